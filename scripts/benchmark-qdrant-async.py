@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Qdrant 並發基準測試
+比較同步 QdrantClient（直接在 event loop 內呼叫）與 AsyncQdrantClient 在並發搜尋下的表現
+
+用法:
+    python scripts/benchmark-qdrant-async.py --url http://localhost:6333 --concurrency 64 --requests 1000
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+from typing import List
+
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue
+
+COLLECTION = "benchmark_async_qdrant"
+DIM = 1536
+TENANTS = [f"company-{i}" for i in range(8)]
+
+
+def random_vector() -> List[float]:
+    return [random.random() for _ in range(DIM)]
+
+
+def tenant_filter(company_id: str) -> Filter:
+    return Filter(must=[FieldCondition(key="company_id", match=MatchValue(value=company_id))])
+
+
+def seed(url: str, points: int):
+    """建立測試 collection 並寫入隨機向量"""
+    client = QdrantClient(url=url)
+    if client.collection_exists(COLLECTION):
+        client.delete_collection(COLLECTION)
+    client.create_collection(COLLECTION, vectors_config=VectorParams(size=DIM, distance=Distance.COSINE))
+
+    for start in range(0, points, 256):
+        client.upsert(
+            collection_name=COLLECTION,
+            points=[
+                PointStruct(
+                    id=str(uuid.uuid4()),
+                    vector=random_vector(),
+                    payload={"company_id": random.choice(TENANTS), "content": f"doc {start + i}"}
+                )
+                for i in range(min(256, points - start))
+            ]
+        )
+    client.close()
+
+
+async def run_sync_path(url: str, total: int, concurrency: int) -> List[float]:
+    """舊路徑：同步 client 在 async handler 內直接呼叫，會阻塞 event loop"""
+    client = QdrantClient(url=url)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            client.query_points(COLLECTION, query=random_vector(), query_filter=tenant_filter(random.choice(TENANTS)), limit=5)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*[one() for _ in range(total)])
+    client.close()
+    return latencies
+
+
+async def run_async_path(url: str, total: int, concurrency: int) -> List[float]:
+    """新路徑：AsyncQdrantClient，請求在 event loop 上重疊執行"""
+    client = AsyncQdrantClient(url=url)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await client.query_points(COLLECTION, query=random_vector(), query_filter=tenant_filter(random.choice(TENANTS)), limit=5)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*[one() for _ in range(total)])
+    await client.close()
+    return latencies
+
+
+def report(name: str, latencies: List[float], elapsed: float):
+    ordered = sorted(latencies)
+    p = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    print(
+        f"{name:<8} total={elapsed:7.2f}s  throughput={len(latencies) / elapsed:8.1f} req/s  "
+        f"mean={statistics.mean(latencies):7.1f}ms  p50={p(0.50):7.1f}ms  p95={p(0.95):7.1f}ms  p99={p(0.99):7.1f}ms"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark sync vs async Qdrant search under concurrency")
+    parser.add_argument("--url", default="http://localhost:6333")
+    parser.add_argument("--points", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--skip-seed", action="store_true")
+    args = parser.parse_args()
+
+    if not args.skip_seed:
+        print(f"Seeding {args.points} points into {COLLECTION} ...")
+        seed(args.url, args.points)
+
+    for name, runner in (("sync", run_sync_path), ("async", run_async_path)):
+        started = time.perf_counter()
+        latencies = await runner(args.url, args.requests, args.concurrency)
+        report(name, latencies, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Vision 影像上傳基準測試
+比較 /vision/inspect 三種上傳方式：JSON (image_base64)、multipart 與 raw image/jpeg body
+的吞吐量、延遲與伺服器端記憶體峰值
+
+預設在同一個 process 內以 ASGI 直接呼叫 ai-core（不需 API key，vision 走 mock 回應，
+只量測上傳、解析與前處理的成本）；指定 --url 則改打正在執行的服務。
+
+用法:
+    python scripts/benchmark-vision-ingest.py --requests 200 --concurrency 16
+    python scripts/benchmark-vision-ingest.py --image frame.jpg --url http://localhost:8000 --token <JWT>
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+AI_CORE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "services", "ai-core")
+ENDPOINT = "/api/v1/vision/inspect"
+
+
+def make_frame(width: int, height: int) -> bytes:
+    """產生帶雜訊的測試 JPEG（雜訊讓壓縮後大小接近實際相機影格）"""
+    import numpy as np
+    from PIL import Image
+
+    pixels = (np.random.rand(height, width, 3) * 255).astype("uint8")
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def request_builders(frame: bytes) -> Dict[str, Callable[[], dict]]:
+    """每種上傳方式對應的 httpx request 參數"""
+    return {
+        "json": lambda: {
+            "url": ENDPOINT,
+            "content": json.dumps({"image_base64": base64.b64encode(frame).decode(), "camera_id": "bench"}),
+            "headers": {"content-type": "application/json"}
+        },
+        "multipart": lambda: {
+            "url": ENDPOINT,
+            "files": {"image": ("frame.jpg", frame, "image/jpeg")},
+            "data": {"camera_id": "bench"}
+        },
+        "raw": lambda: {
+            "url": f"{ENDPOINT}?camera_id=bench",
+            "content": frame,
+            "headers": {"content-type": "image/jpeg"}
+        }
+    }
+
+
+async def run_path(client: httpx.AsyncClient, build: Callable[[], dict], total: int, concurrency: int) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one():
+        async with semaphore:
+            kwargs = build()
+            started = time.perf_counter()
+            response = await client.post(**kwargs)
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*[one() for _ in range(total)])
+    return latencies
+
+
+async def peak_memory(client: httpx.AsyncClient, build: Callable[[], dict]) -> float:
+    """單一請求期間 Python 配置的記憶體峰值（MB），僅 in-process 模式可量測"""
+    kwargs = build()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    await client.post(**kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return (peak - baseline) / 1024 / 1024
+
+
+def report(name: str, latencies: List[float], elapsed: float, frame_bytes: int, memory: Optional[float]):
+    ordered = sorted(latencies)
+    p = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    print(
+        f"{name:<10} throughput={len(latencies) / elapsed:7.1f} frames/s  "
+        f"{len(latencies) * frame_bytes / elapsed / 1024 / 1024:7.1f} MB/s  "
+        f"mean={statistics.mean(latencies):7.1f}ms  p50={p(0.50):7.1f}ms  p95={p(0.95):7.1f}ms"
+        + (f"  peak_mem={memory:6.1f}MB" if memory is not None else "")
+    )
+
+
+async def benchmark(client: httpx.AsyncClient, frame: bytes, args, measure_memory: bool):
+    for name, build in request_builders(frame).items():
+        await run_path(client, build, min(5, args.requests), 1)  # 暖身
+        started = time.perf_counter()
+        latencies = await run_path(client, build, args.requests, args.concurrency)
+        elapsed = time.perf_counter() - started
+        memory = await peak_memory(client, build) if measure_memory else None
+        report(name, latencies, elapsed, len(frame), memory)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON vs binary frame upload on /vision/inspect")
+    parser.add_argument("--url", help="Running ai-core base URL; omit to benchmark in-process")
+    parser.add_argument("--token", default="", help="Bearer token for --url")
+    parser.add_argument("--image", help="JPEG to upload; a noise frame is generated otherwise")
+    parser.add_argument("--width", type=int, default=3840)
+    parser.add_argument("--height", type=int, default=2160)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            frame = f.read()
+    else:
+        frame = make_frame(args.width, args.height)
+    print(f"Frame: {len(frame) / 1024 / 1024:.2f} MB, base64 JSON body: {len(base64.b64encode(frame)) / 1024 / 1024:.2f} MB")
+
+    if args.url:
+        headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+        async with httpx.AsyncClient(base_url=args.url, headers=headers, timeout=120.0) as client:
+            await benchmark(client, frame, args, measure_memory=False)
+        return
+
+    sys.path.insert(0, AI_CORE)
+    os.environ["OPENAI_API_KEY"] = ""
+    os.environ["ANTHROPIC_API_KEY"] = ""
+    from app.main import app
+    from app.core.multi_tenant import get_company_context
+
+    app.dependency_overrides[get_company_context] = lambda: {"company_id": "benchmark", "subscription_tier": "enterprise"}
+    async with app.router.lifespan_context(app):
+        app.state.services.admission.enabled = False
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://ai-core", timeout=120.0) as client:
+            await benchmark(client, frame, args, measure_memory=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,9 +1,20 @@
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from typing import List, Dict, Any
-from app.services.embeddings_service import EmbeddingsService
+from typing import List, Dict, Any, Literal, Optional
+from app.services.embeddings_service import DEFAULT_EMBEDDING_MODEL, EmbeddingsService
 from app.services.qdrant_service import QdrantService
+from app.services.ingestion_service import IngestionService
+from app.services.lexical_index import is_identifier_query, reciprocal_rank_fusion
+from app.services.admission import AdmissionController, AdmissionRejected
+from app.services.model_registry import model_registry
+from app.services.tokenizer import estimate_tokens
 from app.core.multi_tenant import get_company_context
+from app.core.container import (
+    get_embeddings_service,
+    get_qdrant_service,
+    get_ingestion_service,
+    get_admission_controller
+)
 from app.core.logging import app_logger
 
 router = APIRouter(prefix="/embeddings", tags=["embeddings"])
@@ -12,84 +23,198 @@ router = APIRouter(prefix="/embeddings", tags=["embeddings"])
 class UpsertRequest(BaseModel):
     collection: str
     documents: List[Dict[str, Any]]
+    background: bool = False  # Return a job id immediately for very large imports
 
 
 class SearchRequest(BaseModel):
     collection: str
     query: str
     limit: int = 5
+    mode: Literal["vector", "lexical", "hybrid"] = "vector"
+
+
+class BatchSearchQuery(BaseModel):
+    query: str
+    id: Optional[str] = None  # Key for this query in the response; defaults to its position
+    collection: Optional[str] = None  # Overrides the request-level collection
+    limit: int = 5
+
+
+class BatchSearchRequest(BaseModel):
+    queries: List[BatchSearchQuery]
+    collection: Optional[str] = None
 
 
 @router.post("/upsert")
 async def upsert_embeddings(
     request: UpsertRequest,
-    context: Dict = Depends(get_company_context)
+    context: Dict = Depends(get_company_context),
+    ingestion_svc: IngestionService = Depends(get_ingestion_service),
+    admission: AdmissionController = Depends(get_admission_controller)
 ):
     """Store document embeddings with tenant isolation"""
+    # One admission unit per embedding request the ingest will make, plus its tokens
+    requests, tokens = ingestion_svc.plan(request.documents)
+    await admission.admit(context, model_registry.provider_for(DEFAULT_EMBEDDING_MODEL), cost=requests, tokens=tokens)
+    
     try:
-        embeddings_svc = EmbeddingsService()
-        qdrant_svc = QdrantService()
-        
-        # Ensure collection exists
-        qdrant_svc.create_collection(request.collection)
-        
-        # Generate embeddings
-        texts = [doc["content"] for doc in request.documents]
-        embeddings = await embeddings_svc.embed_texts(texts)
+        if request.background:
+            job_id = ingestion_svc.start_job(request.collection, context["company_id"], request.documents)
+            app_logger.info(f"Started ingestion job {job_id} ({len(request.documents)} documents) for company {context['company_id']}")
+            return {"status": "accepted", "job_id": job_id, "total": len(request.documents)}
         
-        # Store in Qdrant
-        qdrant_svc.upsert_embeddings(
-            collection_name=request.collection,
-            company_id=context["company_id"],
-            documents=request.documents,
-            embeddings=embeddings
-        )
+        # Token-budgeted batches are embedded concurrently and upserted as each one finishes
+        result = await ingestion_svc.ingest(request.collection, context["company_id"], request.documents)
         
-        app_logger.info(f"Upserted {len(request.documents)} documents for company {context['company_id']}")
-        return {"status": "success", "count": len(request.documents)}
+        app_logger.info(f"Upserted {result['count']}/{result['total']} documents for company {context['company_id']}")
+        return result
         
+    except AdmissionRejected:
+        raise
     except Exception as e:
         app_logger.error(f"Upsert failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/jobs/{job_id}")
+async def get_ingestion_job(
+    job_id: str,
+    context: Dict = Depends(get_company_context),
+    ingestion_svc: IngestionService = Depends(get_ingestion_service)
+):
+    """Progress of a background ingestion job"""
+    job = ingestion_svc.get_job(job_id, context["company_id"])
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
 @router.post("/search")
 async def search_embeddings(
     request: SearchRequest,
-    context: Dict = Depends(get_company_context)
+    context: Dict = Depends(get_company_context),
+    embeddings_svc: EmbeddingsService = Depends(get_embeddings_service),
+    qdrant_svc: QdrantService = Depends(get_qdrant_service),
+    admission: AdmissionController = Depends(get_admission_controller)
 ):
-    """Semantic search with RAG"""
+    """Semantic search with RAG (mode=lexical|hybrid adds BM25 keyword matching)"""
     try:
-        embeddings_svc = EmbeddingsService()
-        qdrant_svc = QdrantService()
+        company_id = context["company_id"]
+        mode = request.mode
+        
+        # Collections filled before the lexical index existed have nothing to match
+        if mode != "vector" and not await qdrant_svc.has_lexical_index(request.collection, company_id):
+            app_logger.info(f"No lexical index for {request.collection}, falling back to vector search")
+            mode = "vector"
+        
+        if mode != "vector":
+            # Part numbers, drug codes and invoice IDs hit the inverted index directly
+            if is_identifier_query(request.query):
+                exact = await qdrant_svc.lexical_search(
+                    request.collection, company_id, request.query, limit=request.limit, exact=True
+                )
+                if exact:
+                    app_logger.info(f"Exact identifier search returned {len(exact)} results for company {company_id}")
+                    return {"results": exact, "mode": "exact"}
+            
+            # Over-fetch candidates so fusion has enough overlap to re-rank
+            depth = request.limit if mode == "lexical" else request.limit * 4
+            lexical = await qdrant_svc.lexical_search(request.collection, company_id, request.query, limit=depth)
+            if mode == "lexical":
+                return {"results": lexical, "mode": "lexical"}
+        
+        # Only the vector path calls the embedding provider, so exact and lexical hits are free
+        await admission.admit(
+            context,
+            model_registry.provider_for(DEFAULT_EMBEDDING_MODEL),
+            tokens=estimate_tokens(request.query)
+        )
         
         # Embed query
         query_vector = await embeddings_svc.embed_text(request.query)
         
         # Search
-        results = qdrant_svc.search(
+        results = await qdrant_svc.search(
             collection_name=request.collection,
-            company_id=context["company_id"],
+            company_id=company_id,
             query_vector=query_vector,
-            limit=request.limit
+            limit=request.limit if mode == "vector" else request.limit * 4
         )
         
-        app_logger.info(f"Search returned {len(results)} results for company {context['company_id']}")
-        return {"results": results}
+        if mode == "hybrid":
+            results = reciprocal_rank_fusion([results, lexical], limit=request.limit)
+        
+        app_logger.info(f"Search returned {len(results)} results for company {company_id}")
+        return {"results": results, "mode": mode}
         
+    except AdmissionRejected:
+        raise
     except Exception as e:
         app_logger.error(f"Search failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/search-batch")
+async def search_embeddings_batch(
+    request: BatchSearchRequest,
+    context: Dict = Depends(get_company_context),
+    embeddings_svc: EmbeddingsService = Depends(get_embeddings_service),
+    qdrant_svc: QdrantService = Depends(get_qdrant_service),
+    admission: AdmissionController = Depends(get_admission_controller)
+):
+    """Semantic search for many queries with one embedding call and one vector-store round trip"""
+    keys = [q.id or str(i) for i, q in enumerate(request.queries)]
+    if len(set(keys)) != len(keys):
+        raise HTTPException(status_code=400, detail="Query ids must be unique")
+    if any(not (q.collection or request.collection) for q in request.queries):
+        raise HTTPException(status_code=400, detail="Each query needs a collection")
+    
+    await admission.admit(
+        context,
+        model_registry.provider_for(DEFAULT_EMBEDDING_MODEL),
+        tokens=sum(estimate_tokens(q.query) for q in request.queries)
+    )
+    
+    try:
+        vectors = await embeddings_svc.embed_texts([q.query for q in request.queries])
+        
+        results = await qdrant_svc.search_batch(
+            context["company_id"],
+            [
+                (q.collection or request.collection, vector, q.limit)
+                for q, vector in zip(request.queries, vectors)
+            ]
+        )
+        
+        app_logger.info(f"Batch search ran {len(keys)} queries for company {context['company_id']}")
+        return {"results": dict(zip(keys, results))}
+        
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        app_logger.error(f"Batch search failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/collections")
-async def list_collections(context: Dict = Depends(get_company_context)):
+async def list_collections(
+    context: Dict = Depends(get_company_context),
+    qdrant_svc: QdrantService = Depends(get_qdrant_service)
+):
     """List available collections"""
     try:
-        qdrant_svc = QdrantService()
-        collections = qdrant_svc.client.get_collections().collections
-        return {"collections": [c.name for c in collections]}
+        return {"collections": await qdrant_svc.list_collections()}
     except Exception as e:
         app_logger.error(f"Failed to list collections: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.get("/cache/stats")
+async def embedding_cache_stats(
+    context: Dict = Depends(get_company_context),
+    embeddings_svc: EmbeddingsService = Depends(get_embeddings_service)
+):
+    """Embedding cache hit/miss counters and micro-batching stats for this worker"""
+    if not embeddings_svc.cache:
+        return {"enabled": False, "batching": embeddings_svc.batch_stats()}
+    return {"enabled": True, **embeddings_svc.cache.stats(), "batching": embeddings_svc.batch_stats()}
@@ -8,6 +8,7 @@ from pydantic import BaseModel
 from typing import Dict, List, Any, Optional, Literal
 from app.services.model_registry import model_registry, ModelInfo
 from app.services.automl_service import automl_service, ModelEvaluation
+from app.core.config import settings
 from app.core.multi_tenant import get_company_context
 
 router = APIRouter(prefix="/models", tags=["models"])
@@ -151,15 +152,25 @@ async def recommend_model(
 @router.get("/metrics")
 async def get_model_metrics(
     model_name: Optional[str] = None,
+    provider: Optional[str] = None,
+    window: Optional[str] = None,
     context: Dict = Depends(get_company_context)
 ):
-    """Get usage metrics for models"""
+    """Get usage metrics for models, with p50/p95/p99 latency, tokens/second and cost
+    per model, provider and (the caller's own) tenant over sliding windows"""
+    if window and window not in settings.METRICS_WINDOWS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown window '{window}'; expected one of {', '.join(settings.METRICS_WINDOWS)}"
+        )
+    
     try:
         metrics = model_registry.get_metrics(model_name)
         return {
             "status": "success",
             "company_id": context['company_id'],
-            "metrics": {k: v.dict() if v else None for k, v in metrics.items()}
+            "metrics": {k: v.dict() if v else None for k, v in metrics.items()},
+            "quantiles": model_registry.get_quantiles(model_name, provider, context['company_id'], window)
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
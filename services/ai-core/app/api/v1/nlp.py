@@ -1,8 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Literal, Optional, AsyncIterator
+import json
 from app.services.llm_service import LLMService
+from app.services.summarizer import MapReduceSummarizer
+from app.services.translator import BatchTranslator, LANGUAGE_NAMES, translation_max_tokens
+from app.services.tokenizer import count_tokens
+from app.services.token_budget import PromptTooLarge, TokenBudget, plan
+from app.services.provider_router import CircuitOpenError
+from app.services.admission import AdmissionController, AdmissionRejected
+from app.services.model_registry import model_registry
 from app.core.multi_tenant import get_company_context
+from app.core.container import get_llm_service, get_summarizer, get_translator, get_admission_controller
+from app.core.config import settings
 from app.core.logging import app_logger
 
 router = APIRouter(prefix="/nlp", tags=["nlp"])
@@ -14,6 +25,8 @@ class GenerateRequest(BaseModel):
     max_tokens: int = 1000
     temperature: float = 0.7
     model: str = "gpt-3.5-turbo"
+    stream: bool = False
+    overflow: Optional[Literal["reject", "truncate"]] = None  # Defaults to LLM_PROMPT_OVERFLOW
 
 
 class ChatRequest(BaseModel):
@@ -21,11 +34,14 @@ class ChatRequest(BaseModel):
     max_tokens: int = 1000
     temperature: float = 0.7
     model: str = "gpt-3.5-turbo"
+    stream: bool = False
+    overflow: Optional[Literal["reject", "truncate"]] = None  # Defaults to LLM_PROMPT_OVERFLOW
 
 
 class SummarizeRequest(BaseModel):
     text: str
     max_length: int = 200
+    mode: Literal["auto", "single", "map_reduce"] = "auto"  # auto chunks texts over SUMMARIZE_CHUNK_TOKENS
 
 
 class TranslateRequest(BaseModel):
@@ -33,26 +49,103 @@ class TranslateRequest(BaseModel):
     target_language: str = "zh-TW"
 
 
+class BatchTranslateRequest(BaseModel):
+    texts: List[str]
+    target_language: str = "zh-TW"
+
+
+def _sse_response(events: AsyncIterator[Dict[str, Any]], company_id: str) -> StreamingResponse:
+    """Forward LLM stream events as server-sent events"""
+    async def body():
+        try:
+            async for event in events:
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                if event["type"] == "done":
+                    app_logger.info(f"Streamed completion for company {company_id} ({event['usage']['total_tokens']} tokens)")
+        except Exception as e:
+            # Headers are already sent, so report failures in-band
+            app_logger.error(f"Streaming failed: {e}")
+            yield f"event: error\ndata: {json.dumps({'type': 'error', 'detail': str(e)})}\n\n"
+    
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _budget(
+    model: str,
+    messages: List[Dict[str, str]],
+    system_prompt: Optional[str],
+    max_tokens: int,
+    overflow: Optional[str]
+) -> TokenBudget:
+    """Pre-flight token budget; oversized prompts are rejected here, before admission"""
+    try:
+        return plan(model, messages, system_prompt, max_tokens, overflow or settings.LLM_PROMPT_OVERFLOW)[2]
+    except PromptTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
 @router.post("/generate")
 async def generate_text(
     request: GenerateRequest,
-    context: Dict = Depends(get_company_context)
+    context: Dict = Depends(get_company_context),
+    llm_svc: LLMService = Depends(get_llm_service),
+    admission: AdmissionController = Depends(get_admission_controller)
 ):
-    """Generate text using LLM"""
+    """Generate text using LLM (stream=true returns server-sent events)"""
+    budget = _budget(
+        request.model,
+        [{"role": "user", "content": request.prompt}],
+        request.system_prompt,
+        request.max_tokens,
+        request.overflow
+    )
+    await admission.admit(
+        context,
+        model_registry.provider_for(request.model),
+        tokens=budget.prompt_tokens + budget.max_tokens
+    )
+    
+    if request.stream:
+        return _sse_response(
+            llm_svc.stream_text(
+                prompt=request.prompt,
+                system_prompt=request.system_prompt,
+                max_tokens=request.max_tokens,
+                temperature=request.temperature,
+                model=request.model,
+                company_id=context["company_id"],
+                overflow=request.overflow
+            ),
+            context["company_id"]
+        )
+    
     try:
-        llm_svc = LLMService()
-        
         result = await llm_svc.generate_text(
             prompt=request.prompt,
             system_prompt=request.system_prompt,
             max_tokens=request.max_tokens,
             temperature=request.temperature,
-            model=request.model
+            model=request.model,
+            company_id=context["company_id"],
+            subscription_tier=context.get("subscription_tier"),
+            overflow=request.overflow
         )
         
         app_logger.info(f"Text generated for company {context['company_id']}")
         return result
         
+    except PromptTooLarge as e:
+        app_logger.warning(f"Text generation rejected: {e}")
+        raise HTTPException(status_code=413, detail=str(e))
+    except CircuitOpenError as e:
+        app_logger.warning(f"Text generation rejected: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except AdmissionRejected:
+        raise
     except Exception as e:
         app_logger.error(f"Text generation failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -61,22 +154,53 @@ async def generate_text(
 @router.post("/chat")
 async def chat(
     request: ChatRequest,
-    context: Dict = Depends(get_company_context)
+    context: Dict = Depends(get_company_context),
+    llm_svc: LLMService = Depends(get_llm_service),
+    admission: AdmissionController = Depends(get_admission_controller)
 ):
-    """Chat with LLM"""
+    """Chat with LLM (stream=true returns server-sent events)"""
+    budget = _budget(request.model, request.messages, None, request.max_tokens, request.overflow)
+    await admission.admit(
+        context,
+        model_registry.provider_for(request.model),
+        tokens=budget.prompt_tokens + budget.max_tokens
+    )
+    
+    if request.stream:
+        return _sse_response(
+            llm_svc.stream_chat(
+                messages=request.messages,
+                max_tokens=request.max_tokens,
+                temperature=request.temperature,
+                model=request.model,
+                company_id=context["company_id"],
+                overflow=request.overflow
+            ),
+            context["company_id"]
+        )
+    
     try:
-        llm_svc = LLMService()
-        
         result = await llm_svc.chat(
             messages=request.messages,
             max_tokens=request.max_tokens,
             temperature=request.temperature,
-            model=request.model
+            model=request.model,
+            company_id=context["company_id"],
+            subscription_tier=context.get("subscription_tier"),
+            overflow=request.overflow
         )
         
         app_logger.info(f"Chat completed for company {context['company_id']}")
         return result
         
+    except PromptTooLarge as e:
+        app_logger.warning(f"Chat rejected: {e}")
+        raise HTTPException(status_code=413, detail=str(e))
+    except CircuitOpenError as e:
+        app_logger.warning(f"Chat rejected: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except AdmissionRejected:
+        raise
     except Exception as e:
         app_logger.error(f"Chat failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -85,23 +209,34 @@ async def chat(
 @router.post("/summarize")
 async def summarize_text(
     request: SummarizeRequest,
-    context: Dict = Depends(get_company_context)
+    context: Dict = Depends(get_company_context),
+    summarizer: MapReduceSummarizer = Depends(get_summarizer),
+    admission: AdmissionController = Depends(get_admission_controller)
 ):
-    """Summarize text"""
+    """Summarize text (long documents are chunked, summarized in parallel and reduced)"""
+    calls, tokens = summarizer.plan(request.text, request.max_length, request.mode)
+    await admission.admit(context, model_registry.provider_for(summarizer.model), cost=calls, tokens=tokens)
+    
     try:
-        llm_svc = LLMService()
-        
-        prompt = f"Please summarize the following text in no more than {request.max_length} characters:\n\n{request.text}\n\nSummary:"
-        
-        result = await llm_svc.generate_text(
-            prompt=prompt,
-            max_tokens=request.max_length * 2,
-            temperature=0.3
+        result = await summarizer.summarize(
+            text=request.text,
+            max_length=request.max_length,
+            company_id=context["company_id"],
+            subscription_tier=context.get("subscription_tier"),
+            mode=request.mode
         )
         
         app_logger.info(f"Text summarized for company {context['company_id']}")
-        return {"summary": result["content"]}
+        return result
         
+    except PromptTooLarge as e:
+        app_logger.warning(f"Summarization rejected: {e}")
+        raise HTTPException(status_code=413, detail=str(e))
+    except CircuitOpenError as e:
+        app_logger.warning(f"Summarization rejected: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except AdmissionRejected:
+        raise
     except Exception as e:
         app_logger.error(f"Summarization failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -110,33 +245,101 @@ async def summarize_text(
 @router.post("/translate")
 async def translate_text(
     request: TranslateRequest,
-    context: Dict = Depends(get_company_context)
+    context: Dict = Depends(get_company_context),
+    llm_svc: LLMService = Depends(get_llm_service),
+    admission: AdmissionController = Depends(get_admission_controller)
 ):
     """Translate text"""
+    source_tokens = count_tokens(request.text)
+    max_tokens = translation_max_tokens(source_tokens, request.target_language)
+    await admission.admit(context, model_registry.provider_for(settings.TRANSLATE_MODEL), tokens=source_tokens + max_tokens)
+    
     try:
-        llm_svc = LLMService()
-        
-        lang_map = {
-            'zh-TW': '繁體中文',
-            'zh-CN': '簡體中文',
-            'en': 'English',
-            'ja': '日本語',
-            'ko': '한국어'
-        }
-        
-        target_lang = lang_map.get(request.target_language, request.target_language)
+        target_lang = LANGUAGE_NAMES.get(request.target_language, request.target_language)
         prompt = f"Translate the following text to {target_lang}:\n\n{request.text}\n\nTranslation:"
         
         result = await llm_svc.generate_text(
             prompt=prompt,
-            max_tokens=len(request.text) * 2,
-            temperature=0.3
+            max_tokens=max_tokens,
+            temperature=0.3,
+            model=settings.TRANSLATE_MODEL,
+            company_id=context["company_id"],
+            subscription_tier=context.get("subscription_tier")
         )
         
         app_logger.info(f"Text translated for company {context['company_id']}")
-        return {"translation": result["content"]}
+        return {"translation": result["content"], "cached": result["cached"]}
         
+    except PromptTooLarge as e:
+        app_logger.warning(f"Translation rejected: {e}")
+        raise HTTPException(status_code=413, detail=str(e))
+    except CircuitOpenError as e:
+        app_logger.warning(f"Translation rejected: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except AdmissionRejected:
+        raise
     except Exception as e:
         app_logger.error(f"Translation failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.post("/translate-batch")
+async def translate_batch(
+    request: BatchTranslateRequest,
+    context: Dict = Depends(get_company_context),
+    translator: BatchTranslator = Depends(get_translator),
+    admission: AdmissionController = Depends(get_admission_controller)
+):
+    """Translate many texts; repeated segments come from the translation memory"""
+    # Upper bounds: memory hits never reach the provider
+    requests, tokens = translator.plan(request.texts)
+    await admission.admit(context, model_registry.provider_for(translator.model), cost=max(1, requests), tokens=tokens)
+    
+    try:
+        return await translator.translate(
+            texts=request.texts,
+            target_language=request.target_language,
+            company_id=context["company_id"],
+            subscription_tier=context.get("subscription_tier")
+        )
+        
+    except PromptTooLarge as e:
+        app_logger.warning(f"Batch translation rejected: {e}")
+        raise HTTPException(status_code=413, detail=str(e))
+    except CircuitOpenError as e:
+        app_logger.warning(f"Batch translation rejected: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        app_logger.error(f"Batch translation failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/cache/stats")
+async def llm_cache_stats(
+    context: Dict = Depends(get_company_context),
+    llm_svc: LLMService = Depends(get_llm_service),
+    summarizer: MapReduceSummarizer = Depends(get_summarizer),
+    translator: BatchTranslator = Depends(get_translator)
+):
+    """LLM response cache, single-flight, chunk summary and translation memory counters for this worker"""
+    extra = {
+        "singleflight": llm_svc.singleflight.stats() if llm_svc.singleflight else None,
+        "summary_chunks": summarizer.stats(),
+        "translation_memory": translator.memory.stats()
+    }
+    if not llm_svc.cache:
+        return {"enabled": False, **extra}
+    return {"enabled": True, **llm_svc.cache.stats(), **extra}
+
+
+@router.get("/routing/stats")
+async def llm_routing_stats(
+    context: Dict = Depends(get_company_context),
+    llm_svc: LLMService = Depends(get_llm_service)
+):
+    """Per-model latency, error rate and circuit state seen by this worker's provider router"""
+    if not llm_svc.router:
+        return {"enabled": False}
+    return {"enabled": True, **llm_svc.router.stats()}
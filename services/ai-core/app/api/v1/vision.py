@@ -1,10 +1,23 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
-from app.services.vision_service import VisionService
-from app.core.multi_tenant import get_company_context
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from starlette.datastructures import UploadFile as StarletteUploadFile
+from typing import List, Dict, Any, Optional, AsyncIterator, Awaitable, Callable, Tuple
+from contextlib import asynccontextmanager
+from app.services.vision_service import VisionService, decode_base64_image
+from app.services.image_preprocessor import Frame, InvalidImageError, frame_size
+from app.core.config import settings
+from app.core.multi_tenant import get_company_context, get_websocket_company_context
+from app.services.frame_sampler import FrameSampler
+from app.services.admission import AdmissionController, AdmissionRejected
+from app.core.container import get_vision_service, get_admission_controller
 from app.core.logging import app_logger
+import asyncio
 import base64
+import json
+import math
+import tempfile
 
 router = APIRouter(prefix="/vision", tags=["vision"])
 
@@ -19,6 +32,17 @@ class InspectionResponse(BaseModel):
     defects: List[Dict[str, Any]]
     quality_score: float
     processed_at: str
+    metadata: Dict[str, Any] = {}  # Includes before/after byte counts under "preprocessing"
+
+
+class BatchFrame(BaseModel):
+    image_base64: str
+    camera_id: str
+    metadata: Dict[str, Any] = {}
+
+
+class BatchInspectionRequest(BaseModel):
+    frames: List[BatchFrame]
 
 
 class ImageAnalysisRequest(BaseModel):
@@ -26,29 +50,323 @@ class ImageAnalysisRequest(BaseModel):
     prompt: str
 
 
-@router.post("/inspect", response_model=InspectionResponse)
+_INSPECT_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": InspectionRequest.model_json_schema()},
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "image": {"type": "string", "format": "binary"},
+                        "camera_id": {"type": "string"},
+                        "metadata": {"type": "string", "description": "JSON object"}
+                    },
+                    "required": ["image", "camera_id"]
+                }
+            },
+            "image/jpeg": {"schema": {"type": "string", "format": "binary"}}
+        }
+    }
+}
+
+
+def _too_large(size: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"Image is {size} bytes; the limit is {settings.VISION_MAX_UPLOAD_BYTES}"
+    )
+
+
+async def _spool_body(request: Request) -> tempfile.SpooledTemporaryFile:
+    """Copy a raw image body into memory, rolling over to disk past VISION_SPOOL_MAX_MEMORY_BYTES"""
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.VISION_SPOOL_MAX_MEMORY_BYTES)
+    size = 0
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > settings.VISION_MAX_UPLOAD_BYTES:
+                raise _too_large(size)
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+@asynccontextmanager
+async def _inspection_frame(
+    request: Request,
+    camera_id: Optional[str]
+) -> AsyncIterator[Tuple[Frame, str, Dict[str, Any]]]:
+    """(frame, camera_id, metadata) from a JSON, multipart or raw image body. Binary frames
+    stay in their (possibly disk-backed) spool file until the preprocessor reads them."""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    if content_type == "multipart/form-data":
+        form = await request.form()
+        try:
+            upload = form.get("image") or form.get("file")
+            if not isinstance(upload, StarletteUploadFile):
+                raise HTTPException(status_code=400, detail="Multipart inspection needs an 'image' file part")
+            size = upload.size if upload.size is not None else frame_size(upload.file)
+            if size > settings.VISION_MAX_UPLOAD_BYTES:
+                raise _too_large(size)
+            camera_id = form.get("camera_id") or camera_id
+            try:
+                metadata = json.loads(form.get("metadata") or "{}")
+            except ValueError:
+                raise HTTPException(status_code=400, detail="metadata must be a JSON object")
+            if not camera_id or not isinstance(metadata, dict):
+                raise HTTPException(status_code=400, detail="camera_id and a JSON object metadata are required")
+            yield upload.file, camera_id, metadata
+        finally:
+            await form.close()
+
+    elif content_type.startswith("image/") or content_type == "application/octet-stream":
+        if not camera_id:
+            raise HTTPException(status_code=400, detail="Raw image bodies need a camera_id query parameter")
+        spool = await _spool_body(request)
+        try:
+            yield spool, camera_id, {}
+        finally:
+            spool.close()
+
+    else:
+        try:
+            body = InspectionRequest.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in e.errors()])
+        yield decode_base64_image(body.image_base64), body.camera_id, body.metadata
+
+
+@router.post("/inspect", response_model=InspectionResponse, openapi_extra=_INSPECT_BODY)
 async def quality_inspection(
-    request: InspectionRequest,
-    context: Dict = Depends(get_company_context)
+    request: Request,
+    camera_id: Optional[str] = None,
+    context: Dict = Depends(get_company_context),
+    vision_svc: VisionService = Depends(get_vision_service),
+    admission: AdmissionController = Depends(get_admission_controller)
 ):
-    """AI Quality Inspection for Manufacturing"""
+    """AI Quality Inspection for Manufacturing
+    
+    Accepts an InspectionRequest JSON body, a multipart form (image file, camera_id,
+    optional metadata JSON), or a raw image/jpeg body with ?camera_id=. Binary uploads
+    skip the base64 inflation and the JSON parse of a multi-megabyte string.
+    """
+    await admission.admit(context, "openai")
+    
     try:
-        vision_svc = VisionService()
-        
-        result = await vision_svc.detect_defects(
-            image_data=request.image_base64,
-            company_id=context["company_id"],
-            metadata=request.metadata
-        )
+        async with _inspection_frame(request, camera_id) as (frame, camera_id, metadata):
+            result = await vision_svc.detect_defects(
+                image_data=frame,
+                company_id=context["company_id"],
+                metadata=metadata,
+                camera_id=camera_id
+            )
         
         app_logger.info(f"Quality inspection completed for company {context['company_id']}")
         return result
         
+    except InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (AdmissionRejected, HTTPException, RequestValidationError):
+        raise
     except Exception as e:
         app_logger.error(f"Quality inspection failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+_INSPECT_BATCH_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": BatchInspectionRequest.model_json_schema()},
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "image": {"type": "array", "items": {"type": "string", "format": "binary"}},
+                        "camera_id": {"type": "array", "items": {"type": "string"}},
+                        "metadata": {"type": "array", "items": {"type": "string"}, "description": "JSON objects"}
+                    },
+                    "required": ["image", "camera_id"]
+                }
+            }
+        }
+    }
+}
+
+
+async def _batch_frames(request: Request) -> Tuple[List[Tuple[Frame, str, Dict[str, Any]]], Callable[[], Awaitable[None]]]:
+    """(frame, camera_id, metadata) triples from a JSON or multipart body, plus a closer that
+    releases the spooled uploads once the streamed response is finished"""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    if content_type == "multipart/form-data":
+        form = await request.form(max_files=settings.VISION_BATCH_MAX_FRAMES)
+        try:
+            uploads = form.getlist("image")
+            camera_ids = form.getlist("camera_id")
+            metadata = [json.loads(m or "{}") for m in form.getlist("metadata")] or [{}] * len(uploads)
+            if len(camera_ids) != len(uploads) or len(metadata) != len(uploads):
+                raise HTTPException(status_code=400, detail="Send one camera_id (and metadata, if any) per image part")
+            if not all(isinstance(m, dict) for m in metadata):
+                raise HTTPException(status_code=400, detail="metadata parts must be JSON objects")
+            if not all(isinstance(upload, StarletteUploadFile) for upload in uploads):
+                raise HTTPException(status_code=400, detail="Every 'image' part must be a file")
+            for upload in uploads:
+                size = upload.size if upload.size is not None else frame_size(upload.file)
+                if size > settings.VISION_MAX_UPLOAD_BYTES:
+                    raise _too_large(size)
+        except ValueError:
+            await form.close()
+            raise HTTPException(status_code=400, detail="metadata parts must be JSON objects")
+        except BaseException:
+            await form.close()
+            raise
+        return [(u.file, c, m) for u, c, m in zip(uploads, camera_ids, metadata)], form.close
+
+    try:
+        body = BatchInspectionRequest.model_validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in e.errors()])
+
+    async def close():
+        pass
+
+    return [(decode_base64_image(f.image_base64), f.camera_id, f.metadata) for f in body.frames], close
+
+
+@router.post("/inspect-batch", openapi_extra=_INSPECT_BATCH_BODY)
+async def batch_inspection(
+    request: Request,
+    context: Dict = Depends(get_company_context),
+    vision_svc: VisionService = Depends(get_vision_service),
+    admission: AdmissionController = Depends(get_admission_controller)
+):
+    """Inspect frames from several cameras in one request
+    
+    Takes a BatchInspectionRequest JSON body or a multipart form with repeated image,
+    camera_id (and optional metadata) parts. Results stream back as NDJSON, one line
+    {"index", "camera_id", ...} per frame in completion order.
+    """
+    try:
+        frames, close = await _batch_frames(request)
+    except InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if not frames or len(frames) > settings.VISION_BATCH_MAX_FRAMES:
+        await close()
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {settings.VISION_BATCH_MAX_FRAMES} frames")
+    
+    try:
+        # One admission unit per upstream vision call the batch will make
+        await admission.admit(context, "openai", cost=math.ceil(len(frames) / vision_svc.batch_images_per_call))
+    except AdmissionRejected:
+        await close()
+        raise
+    
+    async def body():
+        try:
+            async for index, result in vision_svc.detect_defects_batch(frames, context["company_id"]):
+                yield json.dumps({"index": index, "camera_id": frames[index][1], **result}, ensure_ascii=False) + "\n"
+        finally:
+            await close()
+    
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+@router.websocket("/stream/{camera_id}")
+async def camera_stream(
+    websocket: WebSocket,
+    camera_id: str,
+    sample_every: int = 1,
+    motion_threshold: float = 0.0,
+    context: Dict = Depends(get_websocket_company_context),
+    vision_svc: VisionService = Depends(get_vision_service),
+    admission: AdmissionController = Depends(get_admission_controller)
+):
+    """Persistent per-camera inspection stream
+    
+    The camera sends JPEG frames as binary messages. The server keeps every
+    sample_every-th frame and, with motion_threshold > 0, only frames whose mean pixel
+    difference from the last kept frame exceeds it (0-1 scale). Kept frames wait in a
+    small queue that drops the oldest frame when inspection falls behind; results are
+    pushed back as {"type": "result", "sequence", ...} JSON messages.
+    """
+    await websocket.accept()
+    sampler = FrameSampler(
+        every_nth=sample_every,
+        motion_threshold=motion_threshold,
+        keyframe_seconds=settings.VISION_STREAM_KEYFRAME_SECONDS
+    )
+    queue: asyncio.Queue = asyncio.Queue(maxsize=settings.VISION_STREAM_QUEUE_SIZE)
+    counters = {"dropped": 0, "inspected": 0, "throttled": 0}
+    
+    def stream_stats() -> Dict[str, Any]:
+        return {**sampler.stats(), **counters, "queued": queue.qsize()}
+    
+    async def inspect():
+        while True:
+            sequence, frame = await queue.get()
+            try:
+                await admission.admit(context, "openai")
+                result = await vision_svc.detect_defects(
+                    image_data=frame,
+                    company_id=context["company_id"],
+                    metadata={"sequence": sequence},
+                    camera_id=camera_id
+                )
+                counters["inspected"] += 1
+                message = {"type": "result", "sequence": sequence, **result}
+            except AdmissionRejected as e:
+                counters["throttled"] += 1
+                message = {"type": "error", "sequence": sequence, "status": 429, "detail": str(e), "retry_after": e.retry_after}
+            except InvalidImageError as e:
+                message = {"type": "error", "sequence": sequence, "status": 400, "detail": str(e)}
+            except Exception as e:
+                app_logger.error(f"Stream inspection failed for camera {camera_id}: {e}")
+                message = {"type": "error", "sequence": sequence, "status": 500, "detail": str(e)}
+            try:
+                await websocket.send_json({**message, "stream": stream_stats()})
+            except (WebSocketDisconnect, RuntimeError):
+                return
+    
+    worker = asyncio.create_task(inspect())
+    app_logger.info(f"Camera stream {camera_id} opened for company {context['company_id']}")
+    received = 0
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            frame = message.get("bytes")
+            if frame is None:
+                # Text messages (pings, control JSON) are not frames
+                await websocket.send_json({"type": "error", "status": 400, "detail": "Frames must be sent as binary messages"})
+                continue
+            sequence = received
+            received += 1
+            if len(frame) > settings.VISION_MAX_UPLOAD_BYTES:
+                await websocket.send_json({"type": "error", "sequence": sequence, "status": 413, "detail": "Frame too large"})
+                continue
+            if not await sampler.accept(frame):
+                continue
+            if queue.full():
+                # Inspection is behind: the oldest waiting frame is the stalest, drop it
+                queue.get_nowait()
+                counters["dropped"] += 1
+            queue.put_nowait((sequence, frame))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        worker.cancel()
+        app_logger.info(f"Camera stream {camera_id} closed ({stream_stats()})")
+
+
 @router.post("/upload")
 async def upload_image(
     file: UploadFile = File(...),
@@ -56,14 +374,15 @@ async def upload_image(
 ):
     """Upload image for processing"""
     try:
-        contents = await file.read()
-        base64_image = base64.b64encode(contents).decode('utf-8')
+        # The upload is already spooled; size it and encode only the 75 bytes the preview shows
+        size = file.size if file.size is not None else frame_size(file.file)
+        preview = base64.b64encode(await file.read(75)).decode('utf-8')
         
-        app_logger.info(f"Image uploaded: {file.filename} ({len(contents)} bytes)")
+        app_logger.info(f"Image uploaded: {file.filename} ({size} bytes)")
         return {
             "filename": file.filename,
-            "size": len(contents),
-            "base64": base64_image[:100] + "...",  # Preview
+            "size": size,
+            "base64": preview + "...",  # Preview
             "content_type": file.content_type
         }
     except Exception as e:
@@ -74,14 +393,16 @@ async def upload_image(
 @router.post("/analyze")
 async def analyze_image(
     request: ImageAnalysisRequest,
-    context: Dict = Depends(get_company_context)
+    context: Dict = Depends(get_company_context),
+    vision_svc: VisionService = Depends(get_vision_service),
+    admission: AdmissionController = Depends(get_admission_controller)
 ):
     """General image analysis with custom prompt"""
+    await admission.admit(context, "openai")
+    
     try:
-        vision_svc = VisionService()
-        
         result = await vision_svc.analyze_image(
-            image_data=request.image_base64,
+            image_data=decode_base64_image(request.image_base64),
             prompt=request.prompt,
             company_id=context["company_id"]
         )
@@ -89,7 +410,23 @@ async def analyze_image(
         app_logger.info(f"Image analysis completed for company {context['company_id']}")
         return {"analysis": result}
         
+    except InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except AdmissionRejected:
+        raise
     except Exception as e:
         app_logger.error(f"Image analysis failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.get("/stats")
+async def vision_stats(
+    context: Dict = Depends(get_company_context),
+    vision_svc: VisionService = Depends(get_vision_service)
+):
+    """Preprocessing, per-camera dedupe, pre-screen escalation and per-stage latency for this worker"""
+    return {
+        "preprocessing": vision_svc.preprocessor.stats() if vision_svc.preprocessor else None,
+        "dedupe": vision_svc.frame_cache.stats(context["company_id"]) if vision_svc.frame_cache else None,
+        **vision_svc.stats()
+    }
@@ -0,0 +1,294 @@
+"""
+Service Container
+Application-scoped AI clients created once per worker and shared by every request
+"""
+
+from typing import Dict, Any, Optional
+import asyncio
+from starlette.requests import HTTPConnection
+from openai import AsyncOpenAI
+from anthropic import AsyncAnthropic
+import httpx
+from app.core.config import settings
+from app.core.logging import app_logger
+from app.services.embeddings_service import EmbeddingsService
+from app.services.embedding_cache import EmbeddingCache
+from app.services.llm_service import LLMService
+from app.services.llm_cache import LLMResponseCache
+from app.services.summarizer import MapReduceSummarizer
+from app.services.translation_memory import TranslationMemory
+from app.services.translator import BatchTranslator
+from app.services.singleflight import SingleFlight
+from app.services.provider_router import ProviderRouter
+from app.services.vision_service import VisionService
+from app.services.image_preprocessor import ImagePreprocessor
+from app.services.frame_cache import FrameDedupeCache
+from app.services.defect_prescreen import DefectPrescreener
+from app.services.qdrant_service import QdrantService
+from app.services.ingestion_service import IngestionService
+from app.services.admission import AdmissionController
+from app.services.concurrency import ConcurrencyLimiters
+from app.services.model_registry import model_registry
+from app.services.tokenizer import warm_encodings
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Build the keep-alive (and HTTP/2 when available) pool shared by all provider SDKs"""
+    http2 = settings.HTTP2_ENABLED
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            app_logger.warning("h2 package not installed, falling back to HTTP/1.1 connection pool")
+            http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(settings.HTTP_READ_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT)
+    )
+
+
+class ServiceContainer:
+    """Holds the long-lived clients and services for one worker process"""
+
+    def __init__(self):
+        self.http_client = create_http_client()
+        # The adaptive limiter retries 429s itself (and the router fails over on 5xx), so
+        # SDK retries would multiply upstream calls in exactly the storms AIMD backs off from
+        sdk_retries = 0 if settings.ADAPTIVE_CONCURRENCY_ENABLED else 2
+        self.openai_client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            http_client=self.http_client,
+            max_retries=sdk_retries
+        ) if settings.OPENAI_API_KEY else None
+        self.anthropic_client = AsyncAnthropic(
+            api_key=settings.ANTHROPIC_API_KEY,
+            http_client=self.http_client,
+            max_retries=sdk_retries
+        ) if settings.ANTHROPIC_API_KEY else None
+
+        self.concurrency = ConcurrencyLimiters(
+            target_latency_ms=settings.ADAPTIVE_CONCURRENCY_TARGET_LATENCY_MS,
+            initial_limit=settings.ADAPTIVE_CONCURRENCY_INITIAL,
+            min_limit=settings.ADAPTIVE_CONCURRENCY_MIN,
+            max_limit=settings.ADAPTIVE_CONCURRENCY_MAX,
+            backoff=settings.ADAPTIVE_CONCURRENCY_BACKOFF,
+            queue_timeout=settings.ADAPTIVE_CONCURRENCY_QUEUE_TIMEOUT_SECONDS,
+            max_retries=settings.ADAPTIVE_CONCURRENCY_MAX_RETRIES
+        ) if settings.ADAPTIVE_CONCURRENCY_ENABLED else None
+
+        self.embedding_cache = EmbeddingCache(
+            max_bytes=settings.EMBEDDING_CACHE_MAX_BYTES,
+            db_path=settings.EMBEDDING_CACHE_DB_PATH or None
+        )
+        self.embeddings = EmbeddingsService(
+            client=self.openai_client,
+            cache=self.embedding_cache,
+            concurrency=self.concurrency
+        )
+        self.llm_cache = LLMResponseCache(
+            max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+            embeddings=self.embeddings if settings.LLM_SEMANTIC_CACHE_ENABLED else None,
+            semantic_threshold=settings.LLM_SEMANTIC_CACHE_THRESHOLD,
+            semantic_max_temperature=settings.LLM_SEMANTIC_CACHE_MAX_TEMPERATURE,
+            semantic_max_entries_per_tenant=settings.LLM_SEMANTIC_CACHE_MAX_ENTRIES_PER_TENANT
+        ) if settings.LLM_CACHE_ENABLED else None
+        self.llm = LLMService(
+            openai_client=self.openai_client,
+            anthropic_client=self.anthropic_client,
+            cache=self.llm_cache,
+            singleflight=SingleFlight(
+                timeout=settings.LLM_SINGLEFLIGHT_TIMEOUT_SECONDS
+            ) if settings.LLM_SINGLEFLIGHT_ENABLED else None,
+            router=ProviderRouter(
+                providers={
+                    name for name, client in
+                    (("openai", self.openai_client), ("anthropic", self.anthropic_client)) if client
+                },
+                window=settings.LLM_ROUTER_WINDOW,
+                min_samples=settings.LLM_ROUTER_MIN_SAMPLES,
+                failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+                open_seconds=settings.LLM_CIRCUIT_OPEN_SECONDS,
+                hedge_tiers=set(settings.LLM_HEDGE_TIERS),
+                hedge_min_delay_ms=settings.LLM_HEDGE_MIN_DELAY_MS,
+                max_failovers=settings.LLM_MAX_FAILOVERS
+            ) if settings.LLM_ROUTING_ENABLED else None,
+            concurrency=self.concurrency
+        )
+        self.summarizer = MapReduceSummarizer(
+            self.llm,
+            model=settings.SUMMARIZE_MODEL,
+            chunk_tokens=settings.SUMMARIZE_CHUNK_TOKENS,
+            fan_out=settings.SUMMARIZE_FAN_OUT,
+            chunk_summary_tokens=settings.SUMMARIZE_CHUNK_SUMMARY_TOKENS,
+            max_reduce_rounds=settings.SUMMARIZE_MAX_REDUCE_ROUNDS,
+            cache_max_entries=settings.SUMMARIZE_CHUNK_CACHE_MAX_ENTRIES,
+            cache_ttl_seconds=settings.SUMMARIZE_CHUNK_CACHE_TTL_SECONDS
+        )
+        self.translation_memory = TranslationMemory(
+            max_entries=settings.TRANSLATION_MEMORY_MAX_ENTRIES,
+            db_path=settings.TRANSLATION_MEMORY_DB_PATH or None
+        )
+        self.translator = BatchTranslator(
+            self.llm,
+            self.translation_memory,
+            model=settings.TRANSLATE_MODEL,
+            max_batch_tokens=settings.TRANSLATE_BATCH_MAX_TOKENS,
+            max_batch_segments=settings.TRANSLATE_BATCH_MAX_SEGMENTS,
+            concurrency=settings.TRANSLATE_CONCURRENCY
+        )
+        self.image_preprocessor = ImagePreprocessor(
+            max_long_edge=settings.VISION_MAX_LONG_EDGE,
+            quality=settings.VISION_JPEG_QUALITY,
+            camera_rois=settings.VISION_CAMERA_ROI,
+            workers=settings.VISION_PREPROCESS_WORKERS,
+            executor=settings.VISION_PREPROCESS_EXECUTOR
+        ) if settings.VISION_PREPROCESS_ENABLED else None
+        self.prescreener = self._create_prescreener()
+        self.vision = VisionService(
+            client=self.openai_client,
+            concurrency=self.concurrency,
+            preprocessor=self.image_preprocessor,
+            batch_images_per_call=settings.VISION_BATCH_IMAGES_PER_CALL,
+            batch_concurrency=settings.VISION_BATCH_CONCURRENCY,
+            frame_cache=FrameDedupeCache(
+                max_distance=settings.VISION_DEDUPE_MAX_DISTANCE,
+                ttl_seconds=settings.VISION_DEDUPE_TTL_SECONDS,
+                reinspect_seconds=settings.VISION_DEDUPE_REINSPECT_SECONDS,
+                max_frames_per_camera=settings.VISION_DEDUPE_MAX_FRAMES_PER_CAMERA
+            ) if settings.VISION_DEDUPE_ENABLED else None,
+            prescreener=self.prescreener
+        )
+        self.admission = AdmissionController(
+            tenant_rates=settings.ADMISSION_TENANT_RATE,
+            tenant_bursts=settings.ADMISSION_TENANT_BURST,
+            provider_rates=settings.ADMISSION_PROVIDER_RATE,
+            provider_bursts=settings.ADMISSION_PROVIDER_BURST,
+            max_queue_wait=settings.ADMISSION_MAX_QUEUE_WAIT_SECONDS,
+            provider_tokens_per_minute=settings.ADMISSION_PROVIDER_TOKENS_PER_MINUTE,
+            enabled=settings.ADMISSION_ENABLED
+        )
+        self.qdrant = QdrantService()
+        self.ingestion = IngestionService(
+            self.embeddings,
+            self.qdrant,
+            max_batch_tokens=settings.INGEST_BATCH_MAX_TOKENS,
+            max_batch_documents=settings.INGEST_BATCH_MAX_DOCUMENTS,
+            concurrency=settings.INGEST_CONCURRENCY,
+            upsert_concurrency=settings.INGEST_UPSERT_CONCURRENCY,
+            job_ttl_seconds=settings.INGEST_JOB_TTL_SECONDS
+        )
+
+        app_logger.info(
+            f"Service container ready (http2={self.pool_stats()['http2_enabled']}, "
+            f"max_connections={settings.HTTP_MAX_CONNECTIONS})"
+        )
+
+    @staticmethod
+    def _create_prescreener() -> Optional[DefectPrescreener]:
+        if not settings.VISION_PRESCREEN_MODEL_PATH:
+            return None
+        try:
+            return DefectPrescreener(
+                settings.VISION_PRESCREEN_MODEL_PATH,
+                clean_below=settings.VISION_PRESCREEN_CLEAN_BELOW,
+                defect_above=settings.VISION_PRESCREEN_DEFECT_ABOVE,
+                input_size=settings.VISION_PRESCREEN_INPUT_SIZE,
+                workers=settings.VISION_PRESCREEN_WORKERS
+            )
+        except Exception as e:
+            app_logger.warning(f"Defect pre-screen disabled: {e}")
+            return None
+
+    async def start(self):
+        """Async initialisation that needs the running event loop"""
+        await self.qdrant.connect()
+        # Token budgeting needs the BPE tables; load (or download) them before the first request
+        await asyncio.to_thread(warm_encodings, model_registry.models)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Report connection pool usage of the shared HTTP client"""
+        pool = getattr(self.http_client._transport, "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+
+        by_origin: Dict[str, int] = {}
+        for connection in connections:
+            origin = str(getattr(connection, "_origin", "unknown"))
+            by_origin[origin] = by_origin.get(origin, 0) + 1
+
+        return {
+            "http2_enabled": bool(getattr(pool, "_http2", False)),
+            "max_connections": settings.HTTP_MAX_CONNECTIONS,
+            "max_keepalive_connections": settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            "keepalive_expiry": settings.HTTP_KEEPALIVE_EXPIRY,
+            "open_connections": len(connections),
+            "idle_connections": sum(1 for c in connections if c.is_idle()),
+            "active_connections": sum(1 for c in connections if not c.is_idle() and not c.is_closed()),
+            "http2_connections": sum(1 for c in connections if "HTTP/2" in repr(c)),
+            "connections_by_origin": by_origin,
+            "qdrant_connected": self.qdrant.client is not None,
+            "vector_backend": self.qdrant.backend
+        }
+
+    async def aclose(self):
+        """Close all pooled connections"""
+        await self.ingestion.aclose()
+
+        try:
+            await self.qdrant.close()
+        except Exception as e:
+            app_logger.warning(f"Failed to close Qdrant client: {e}")
+
+        self.embedding_cache.close()
+        self.translation_memory.close()
+        if self.image_preprocessor:
+            self.image_preprocessor.close()
+        if self.prescreener:
+            self.prescreener.close()
+
+        # The provider SDKs share this client, so closing it once releases every pooled socket
+        await self.http_client.aclose()
+        app_logger.info("Service container closed")
+
+
+def get_services(request: HTTPConnection) -> ServiceContainer:
+    """FastAPI dependency returning the worker's service container (HTTP and WebSocket routes)"""
+    return request.app.state.services
+
+
+def get_embeddings_service(request: HTTPConnection) -> EmbeddingsService:
+    return get_services(request).embeddings
+
+
+def get_llm_service(request: HTTPConnection) -> LLMService:
+    return get_services(request).llm
+
+
+def get_summarizer(request: HTTPConnection) -> MapReduceSummarizer:
+    return get_services(request).summarizer
+
+
+def get_translator(request: HTTPConnection) -> BatchTranslator:
+    return get_services(request).translator
+
+
+def get_vision_service(request: HTTPConnection) -> VisionService:
+    return get_services(request).vision
+
+
+def get_qdrant_service(request: HTTPConnection) -> QdrantService:
+    return get_services(request).qdrant
+
+
+def get_ingestion_service(request: HTTPConnection) -> IngestionService:
+    return get_services(request).ingestion
+
+
+def get_admission_controller(request: HTTPConnection) -> AdmissionController:
+    return get_services(request).admission
@@ -1,43 +1,223 @@
-from fastapi import Header, HTTPException, Depends
-from typing import Optional, Dict
+from fastapi import Header, HTTPException, Depends, Request, Query, WebSocket, WebSocketException, status
+from starlette.requests import HTTPConnection
+from typing import Optional, Dict, Any
+from jose import jwt, JWTError
+import asyncio
+import hashlib
+import time
 import httpx
 from app.core.config import settings
+from app.core.cache import TTLCache
+from app.core.logging import app_logger
+from app.core.tenant import current_tenant
 
 
-async def verify_supabase_token(authorization: str = Header(...)) -> Dict:
-    """Verify JWT token from Supabase"""
+# Decoded user data keyed by sha256(token); entries never outlive the token's exp claim
+_token_cache = TTLCache(maxsize=settings.AUTH_CACHE_MAX_SIZE, ttl=settings.AUTH_CACHE_TTL_SECONDS)
+
+# companies.subscription_tier keyed by company_id; the edge gateway reads the same row
+_tier_cache = TTLCache(maxsize=settings.AUTH_CACHE_MAX_SIZE, ttl=settings.AUTH_TIER_CACHE_TTL_SECONDS)
+_TIER_RETRY_SECONDS = 30.0
+
+# Asymmetric algorithms Supabase signs with, by JWK key type
+_JWKS_ALGORITHMS = {"RSA": "RS256", "EC": "ES256"}
+
+_jwks: Dict[str, Any] = {"keys": {}, "fetched_at": 0.0, "attempted_at": float("-inf")}
+_jwks_lock = asyncio.Lock()
+
+
+def _http_client(request: Optional[HTTPConnection]) -> Optional[httpx.AsyncClient]:
+    """Shared pooled client from the service container, if the app has one"""
+    services = getattr(request.app.state, "services", None) if request else None
+    return services.http_client if services else None
+
+
+async def _get(
+    client: Optional[httpx.AsyncClient],
+    url: str,
+    headers: Dict[str, str],
+    params: Optional[Dict[str, str]] = None
+) -> httpx.Response:
+    if client:
+        return await client.get(url, headers=headers, params=params, timeout=10.0)
+    async with httpx.AsyncClient() as temp_client:
+        return await temp_client.get(url, headers=headers, params=params, timeout=10.0)
+
+
+async def _get_jwks_key(kid: Optional[str], client: Optional[httpx.AsyncClient]) -> Optional[Dict]:
+    """Look up a signing key from the cached Supabase JWKS, refreshing it when stale or unknown"""
+    now = time.monotonic()
+    fresh = now - _jwks["fetched_at"] < settings.AUTH_JWKS_TTL_SECONDS
+    if fresh and kid in _jwks["keys"]:
+        return _jwks["keys"][kid]
+
+    async with _jwks_lock:
+        now = time.monotonic()
+        # Another request may have refreshed the keys while we waited for the lock
+        needed = kid not in _jwks["keys"] or now - _jwks["fetched_at"] >= settings.AUTH_JWKS_TTL_SECONDS
+        # Refetch at most once per interval, so tokens with made-up kids cannot hammer Supabase
+        if needed and now - _jwks["attempted_at"] >= settings.AUTH_JWKS_MIN_REFETCH_SECONDS:
+            _jwks["attempted_at"] = now
+            try:
+                response = await _get(
+                    client,
+                    f"{settings.SUPABASE_URL}/auth/v1/.well-known/jwks.json",
+                    {"apikey": settings.SUPABASE_ANON_KEY}
+                )
+                if response.status_code == 200:
+                    _jwks["keys"] = {key.get("kid"): key for key in response.json().get("keys", [])}
+                    _jwks["fetched_at"] = time.monotonic()
+            except httpx.HTTPError as e:
+                app_logger.warning(f"Failed to fetch Supabase JWKS: {e}")
+
+    return _jwks["keys"].get(kid)
+
+
+async def _verify_locally(token: str, client: Optional[httpx.AsyncClient]) -> Optional[Dict]:
+    """Verify the JWT signature without calling Supabase; None when no key is available"""
+    try:
+        header = jwt.get_unverified_header(token)
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    # The header only picks the key source; the accepted algorithm is pinned server-side
+    if header.get("alg") == "HS256":
+        key = settings.SUPABASE_JWT_SECRET or None
+        algorithm = "HS256"
+    elif header.get("alg") in _JWKS_ALGORITHMS.values():
+        key = await _get_jwks_key(header.get("kid"), client)
+        if not key and _jwks["keys"]:
+            # Signed with a key Supabase does not publish; no need to ask it about the token
+            raise HTTPException(status_code=401, detail="Invalid token")
+        algorithm = (key.get("alg") or _JWKS_ALGORITHMS.get(key.get("kty"))) if key else None
+        if key and algorithm not in _JWKS_ALGORITHMS.values():
+            raise HTTPException(status_code=401, detail="Invalid token")
+    else:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    if not key:
+        return None
+
+    try:
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=[algorithm],
+            audience=settings.SUPABASE_JWT_AUDIENCE
+        )
+    except JWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if not claims.get("sub"):
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    # Shape the claims like the /auth/v1/user response so callers see one format
+    return {
+        "id": claims["sub"],
+        "email": claims.get("email", ""),
+        "role": claims.get("role"),
+        "user_metadata": claims.get("user_metadata", {}),
+        "app_metadata": claims.get("app_metadata", {}),
+        "exp": claims.get("exp")
+    }
+
+
+async def _verify_remotely(token: str, client: Optional[httpx.AsyncClient]) -> Dict:
+    """Ask Supabase Auth about the token; also catches revoked sessions"""
+    response = await _get(
+        client,
+        f"{settings.SUPABASE_URL}/auth/v1/user",
+        {"Authorization": f"Bearer {token}", "apikey": settings.SUPABASE_ANON_KEY}
+    )
+    if response.status_code != 200:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return response.json()
+
+
+async def _verify_token(authorization: str, client: Optional[httpx.AsyncClient]) -> Dict:
     if not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Invalid authorization header")
-    
+
     token = authorization.replace("Bearer ", "")
-    
-    # Verify with Supabase
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"{settings.SUPABASE_URL}/auth/v1/user",
-            headers={"Authorization": f"Bearer {token}", "apikey": settings.SUPABASE_ANON_KEY}
-        )
-        if response.status_code != 200:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        user_data = response.json()
+    cache_key = hashlib.sha256(token.encode()).hexdigest()
+
+    user_data = _token_cache.get(cache_key)
+    if user_data is not None:
         return user_data
 
+    user_data = await _verify_locally(token, client)
+    if user_data is None or settings.AUTH_REMOTE_VERIFY:
+        remote_data = await _verify_remotely(token, client)
+        user_data = {**remote_data, "exp": user_data.get("exp")} if user_data else remote_data
+
+    ttl = None
+    if user_data.get("exp"):
+        ttl = user_data["exp"] - time.time()
+    _token_cache.set(cache_key, user_data, ttl=ttl)
+    return user_data
+
+
+async def verify_supabase_token(request: Request, authorization: str = Header(...)) -> Dict:
+    """Verify JWT token from Supabase"""
+    return await _verify_token(authorization, _http_client(request))
+
+
+async def _get_subscription_tier(company_id: str, client: Optional[httpx.AsyncClient]) -> Optional[str]:
+    """Tier from the company's row (free | pro | enterprise), cached per company; None when
+    Supabase cannot be asked"""
+    tier = _tier_cache.get(company_id)
+    if tier is not None:
+        return tier
+    if not settings.SUPABASE_URL or not settings.SUPABASE_SERVICE_ROLE_KEY:
+        return None
+
+    try:
+        response = await _get(
+            client,
+            f"{settings.SUPABASE_URL}/rest/v1/companies",
+            {"apikey": settings.SUPABASE_ANON_KEY, "Authorization": f"Bearer {settings.SUPABASE_SERVICE_ROLE_KEY}"},
+            params={"id": f"eq.{company_id}", "select": "subscription_tier"}
+        )
+    except httpx.HTTPError as e:
+        app_logger.warning(f"Failed to load subscription tier for company {company_id}: {e}")
+        return None
+    if response.status_code != 200:
+        app_logger.warning(f"Failed to load subscription tier for company {company_id}: HTTP {response.status_code}")
+        return None
+
+    rows = response.json()
+    tier = rows[0].get("subscription_tier") if rows else None
+    # The schema's "basic" (and a missing company) get the free limits
+    tier = tier if tier in ("pro", "enterprise") else "free"
+    _tier_cache.set(company_id, tier)
+    return tier
+
 
-async def get_company_context(user_data: Dict = Depends(verify_supabase_token)) -> Dict:
+async def get_company_context(connection: HTTPConnection, user_data: Dict = Depends(verify_supabase_token)) -> Dict:
     """Extract company_id and tenant context from user data"""
     # Get user metadata which should contain company_id
     user_metadata = user_data.get("user_metadata", {})
     company_id = user_metadata.get("company_id", user_data.get("id"))
     
+    # The companies row is authoritative for the tier; the token's app_metadata only
+    # stands in while Supabase cannot be reached
+    tier = await _get_subscription_tier(company_id, _http_client(connection))
+    if tier is None:
+        tier = (user_data.get("app_metadata") or {}).get("subscription_tier", "free")
+        _tier_cache.set(company_id, tier, ttl=_TIER_RETRY_SECONDS)
+    
+    # Attribute provider calls made for this request to the tenant in /models/metrics
+    current_tenant.set(company_id)
+    
     return {
         "user_id": user_data["id"],
         "company_id": company_id,
-        "email": user_data.get("email", "")
+        "email": user_data.get("email", ""),
+        "subscription_tier": tier
     }
 
 
 async def get_optional_company_context(
+    request: Request,
     authorization: Optional[str] = Header(None)
 ) -> Optional[Dict]:
     """Get company context if authorization is provided, otherwise return None"""
@@ -45,8 +225,25 @@ async def get_optional_company_context(
         return None
     
     try:
-        user_data = await verify_supabase_token(authorization)
-        return await get_company_context(user_data)
+        user_data = await _verify_token(authorization, _http_client(request))
+        return await get_company_context(request, user_data)
     except HTTPException:
         return None
 
+
+async def get_websocket_company_context(
+    websocket: WebSocket,
+    token: Optional[str] = Query(None),
+    authorization: Optional[str] = Header(None)
+) -> Dict:
+    """Company context for WebSocket routes; browsers cannot set headers, so ?token= is accepted"""
+    if not authorization and token:
+        authorization = f"Bearer {token}"
+    if not authorization:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Missing authorization")
+    
+    try:
+        user_data = await _verify_token(authorization, _http_client(websocket))
+    except HTTPException as e:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+    return await get_company_context(websocket, user_data)
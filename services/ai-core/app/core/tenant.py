@@ -0,0 +1,10 @@
+"""
+Request-scoped tenant context shared by core and service modules
+"""
+
+from contextvars import ContextVar
+from typing import Optional
+
+# Tenant of the request being served, set by get_company_context; provider calls made
+# while handling the request are attributed to it
+current_tenant: ContextVar[Optional[str]] = ContextVar("current_tenant", default=None)
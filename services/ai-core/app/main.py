@@ -1,20 +1,42 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from prometheus_fastapi_instrumentator import Instrumentator
 from app.core.config import settings
 from app.core.logging import app_logger
+from app.core.container import ServiceContainer
+from app.services.admission import AdmissionRejected
 from app.api.v1 import router as api_v1_router
+import math
 import os
 
 # Create logs directory
 os.makedirs("logs", exist_ok=True)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared AI clients once per worker and close them on shutdown"""
+    app_logger.info(f"Starting {settings.APP_NAME} v{settings.APP_VERSION}")
+    app_logger.info(f"Debug mode: {settings.DEBUG}")
+    app_logger.info(f"CORS origins: {settings.ALLOWED_ORIGINS}")
+    app.state.services = ServiceContainer()
+    await app.state.services.start()
+    
+    yield
+    
+    app_logger.info("Shutting down AI Core Service")
+    await app.state.services.aclose()
+
+
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
     description="AI Orchestration Hub for Business Platform",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -37,6 +59,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """Fast 429 with a Retry-After hint when admission control sheds a request"""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc), "reason": exc.reason, "retry_after": round(exc.retry_after, 2)},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))}
+    )
+
 # Prometheus metrics
 # Temporarily disabled to debug middleware issue
 # Instrumentator().instrument(app).expose(app)
@@ -51,22 +83,24 @@ async def health():
         "version": settings.APP_VERSION
     }
 
-# Include API routes
-app.include_router(api_v1_router, prefix="/api/v1")
 
+@app.get("/health/pools")
+async def pool_health():
+    """Connection pool statistics for the shared AI clients"""
+    return app.state.services.pool_stats()
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize services on startup"""
-    app_logger.info(f"Starting {settings.APP_NAME} v{settings.APP_VERSION}")
-    app_logger.info(f"Debug mode: {settings.DEBUG}")
-    app_logger.info(f"CORS origins: {settings.ALLOWED_ORIGINS}")
 
+@app.get("/health/admission")
+async def admission_health():
+    """Admission control queue depths, rejection counters and adaptive concurrency limits"""
+    services = app.state.services
+    return {
+        **services.admission.stats(),
+        "concurrency": services.concurrency.stats() if services.concurrency else None
+    }
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    """Cleanup on shutdown"""
-    app_logger.info("Shutting down AI Core Service")
+# Include API routes
+app.include_router(api_v1_router, prefix="/api/v1")
 
 
 if __name__ == "__main__":
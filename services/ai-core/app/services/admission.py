@@ -0,0 +1,225 @@
+"""
+Admission Control
+Token-bucket limits per tenant and per provider in front of the AI services. Requests
+that find the provider bucket empty wait in a priority queue (enterprise > pro > free)
+for at most their tier's queue budget; anything that cannot be served in time is
+rejected immediately with a retry-after hint instead of piling onto the provider.
+Providers can also carry a tokens-per-minute budget, charged with the request's
+prompt plus completion tokens.
+"""
+
+from typing import Any, Dict, List, Optional
+import asyncio
+import heapq
+import itertools
+import time
+from app.core.cache import TTLCache
+from app.core.logging import app_logger
+
+# Same tiers as ModelRegistry._filter_by_subscription; lower value is served first
+TIER_PRIORITY = {"enterprise": 0, "pro": 1, "free": 2}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted within its queue budget"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Rate limited ({reason}), retry after {retry_after:.1f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, cost: float = 1.0) -> float:
+        """Take cost tokens and return 0, or return the seconds until they would be available.
+        A cost above the burst needs a full bucket and leaves it in debt for the remainder."""
+        self._refill()
+        needed = min(cost, self.burst)
+        if self.tokens >= needed:
+            self.tokens -= cost
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def reserve(self, cost: float) -> float:
+        """Take cost tokens even if that leaves the bucket in debt; return the seconds until
+        the debt is repaid. Used where a single request may exceed the burst."""
+        self._refill()
+        self.tokens -= cost
+        return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, cost: float = 1.0):
+        self.tokens = min(self.burst, self.tokens + cost)
+
+
+class _ProviderQueue:
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        # [priority, sequence, cost, future]
+        self.waiters: List[list] = []
+        self.drainer: Optional[asyncio.Task] = None
+
+    def backlog(self, priority: int) -> float:
+        """Cost queued ahead of a new waiter at this priority"""
+        return sum(w[2] for w in self.waiters if w[0] <= priority and not w[3].done())
+
+    async def drain(self):
+        """Hand out provider tokens to waiters in priority order as the bucket refills"""
+        try:
+            while self.waiters:
+                _, _, cost, future = self.waiters[0]
+                if future.done():
+                    heapq.heappop(self.waiters)
+                    continue
+                wait = self.bucket.try_take(cost)
+                if wait:
+                    await asyncio.sleep(wait)
+                    continue
+                heapq.heappop(self.waiters)
+                future.set_result(None)
+        finally:
+            self.drainer = None
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        tenant_rates: Dict[str, float],
+        tenant_bursts: Dict[str, float],
+        provider_rates: Dict[str, float],
+        provider_bursts: Dict[str, float],
+        max_queue_wait: Dict[str, float],
+        provider_tokens_per_minute: Optional[Dict[str, float]] = None,
+        enabled: bool = True,
+        max_tenants: int = 100000
+    ):
+        self.tenant_rates = tenant_rates
+        self.tenant_bursts = tenant_bursts
+        self.provider_rates = provider_rates
+        self.provider_bursts = provider_bursts
+        self.max_queue_wait = max_queue_wait
+        self._token_buckets = {
+            provider: TokenBucket(tpm / 60.0, tpm)
+            for provider, tpm in (provider_tokens_per_minute or {}).items()
+        }
+        self.enabled = enabled
+        # Evicting an idle tenant only resets its bucket to full
+        self._tenant_buckets = TTLCache(maxsize=max_tenants, ttl=3600.0)
+        self._queues: Dict[str, _ProviderQueue] = {}
+        self._sequence = itertools.count()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected: Dict[str, int] = {}
+
+    @staticmethod
+    def _tier(context: Dict[str, Any]) -> str:
+        tier = context.get("subscription_tier", "free")
+        return tier if tier in TIER_PRIORITY else "free"
+
+    def _tenant_bucket(self, company_id: str, tier: str) -> TokenBucket:
+        key = (company_id, tier)
+        bucket = self._tenant_buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.tenant_rates[tier], self.tenant_bursts[tier])
+        # Re-set on every use so active tenants stay at the recent end of the LRU
+        self._tenant_buckets.set(key, bucket)
+        return bucket
+
+    def _queue(self, provider: str) -> Optional[_ProviderQueue]:
+        if provider not in self.provider_rates:
+            return None
+        queue = self._queues.get(provider)
+        if queue is None:
+            queue = self._queues[provider] = _ProviderQueue(
+                TokenBucket(self.provider_rates[provider], self.provider_bursts[provider])
+            )
+        return queue
+
+    def _reject(self, reason: str, retry_after: float):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        raise AdmissionRejected(reason, retry_after)
+
+    async def admit(self, context: Dict[str, Any], provider: str, cost: float = 1.0, tokens: int = 0):
+        """Wait for tenant and provider capacity, or raise AdmissionRejected. tokens is the
+        request's prompt plus completion budget, charged against the provider's tokens/minute."""
+        if not self.enabled:
+            return
+
+        tier = self._tier(context)
+        tenant_bucket = self._tenant_bucket(context["company_id"], tier)
+        wait = tenant_bucket.try_take(cost)
+        if wait:
+            self._reject("tenant", wait)
+
+        max_wait = self.max_queue_wait[tier]
+        token_bucket = self._token_buckets.get(provider) if tokens else None
+        token_wait = token_bucket.reserve(tokens) if token_bucket else 0.0
+        if token_wait > max_wait:
+            token_bucket.refund(tokens)
+            tenant_bucket.refund(cost)
+            self._reject(f"{provider}:tokens", token_wait)
+
+        queue = self._queue(provider)
+        if queue is None or (not queue.waiters and not queue.bucket.try_take(cost)):
+            if token_wait:
+                await asyncio.sleep(token_wait)
+            self.admitted += 1
+            return
+
+        priority = TIER_PRIORITY[tier]
+        estimated = (queue.backlog(priority) + cost) / queue.bucket.rate
+        if estimated > max_wait:
+            if token_bucket:
+                token_bucket.refund(tokens)
+            tenant_bucket.refund(cost)
+            self._reject(provider, estimated)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(queue.waiters, [priority, next(self._sequence), cost, future])
+        if queue.drainer is None:
+            queue.drainer = asyncio.create_task(queue.drain())
+        self.queued += 1
+
+        try:
+            await asyncio.wait_for(future, timeout=max_wait)
+        except asyncio.TimeoutError:
+            if token_bucket:
+                token_bucket.refund(tokens)
+            tenant_bucket.refund(cost)
+            app_logger.warning(f"Admission timed out for company {context['company_id']} on {provider} ({tier})")
+            self._reject(provider, (queue.backlog(priority) + cost) / queue.bucket.rate)
+        if token_wait:
+            # The tokens/minute debt may outlast the queue wait
+            await asyncio.sleep(max(0.0, token_bucket.reserve(0)))
+        self.admitted += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "tenants_tracked": len(self._tenant_buckets),
+            "providers": {
+                provider: {
+                    "waiting": sum(1 for w in queue.waiters if not w[3].done()),
+                    "tokens": round(queue.bucket.tokens, 2),
+                    "rate": queue.bucket.rate
+                }
+                for provider, queue in self._queues.items()
+            },
+            "provider_tokens": {
+                provider: {"available": round(bucket.tokens), "per_minute": bucket.burst}
+                for provider, bucket in self._token_buckets.items()
+            }
+        }
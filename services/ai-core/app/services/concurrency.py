@@ -0,0 +1,179 @@
+"""
+Adaptive Concurrency
+AIMD limit on in-flight requests per provider endpoint. The limit grows by one per
+window of healthy responses and is cut multiplicatively on 429s, timeouts or latency
+above the endpoint's target; calls over the limit wait in a FIFO queue, and 429s are
+retried from the queue before being surfaced to the caller as a rate limit.
+"""
+
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+import asyncio
+import time
+from app.core.logging import app_logger
+from app.services.admission import AdmissionRejected
+
+
+def failure_kind(error: BaseException) -> Optional[str]:
+    """"overload" for provider 429s, "timeout" for timeouts, None for anything else"""
+    if getattr(error, "status_code", None) == 429:
+        return "overload"
+    if isinstance(error, asyncio.TimeoutError) or "Timeout" in type(error).__name__:
+        return "timeout"
+    return None
+
+
+def retry_after_seconds(error: BaseException, default: float = 1.0, cap: float = 10.0) -> float:
+    """Provider Retry-After header when present, else a short default"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return min(float(headers.get("retry-after", default)), cap)
+    except (TypeError, ValueError):
+        return default
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int = 16,
+        min_limit: int = 2,
+        max_limit: int = 256,
+        target_latency_ms: float = 10000.0,
+        backoff: float = 0.5,
+        queue_timeout: float = 30.0,
+        max_retries: int = 2
+    ):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency_ms = target_latency_ms
+        self.backoff = backoff
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_cut = 0.0
+        self.cuts: Dict[str, int] = {}
+        self.retries = 0
+        self.rejected = 0
+
+    async def _acquire(self):
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            # The releasing call hands its slot over, so inflight is already counted
+            await asyncio.wait_for(future, timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise AdmissionRejected(f"{self.name} concurrency", self.queue_timeout / 2)
+
+    def _release(self):
+        self.inflight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.inflight < int(self.limit):
+            future = self._waiters.popleft()
+            if not future.done():
+                self.inflight += 1
+                future.set_result(None)
+
+    def _decrease(self, reason: str):
+        now = time.monotonic()
+        # Responses already in flight were sent under the old limit; cut once per round trip
+        if now - self._last_cut < self.target_latency_ms / 1000:
+            return
+        self._last_cut = now
+        previous = self.limit
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+        self.cuts[reason] = self.cuts.get(reason, 0) + 1
+        app_logger.warning(f"Concurrency limit for {self.name} cut {previous:.0f} -> {self.limit:.0f} ({reason})")
+
+    def _record_success(self, latency_ms: Optional[float]):
+        if latency_ms is not None and latency_ms > self.target_latency_ms:
+            self._decrease("latency")
+        else:
+            # +1 per full window of successes, i.e. roughly one step per round trip
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._wake()
+
+    @asynccontextmanager
+    async def slot(self, track_latency: bool = True) -> AsyncIterator[None]:
+        """Hold one in-flight slot for the duration of the block (streams pass track_latency=False)"""
+        await self._acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            kind = failure_kind(e)
+            if kind:
+                self._decrease(kind)
+            raise
+        else:
+            self._record_success((time.monotonic() - start) * 1000 if track_latency else None)
+        finally:
+            self._release()
+
+    async def run(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Call fn under the limit; provider 429s go back through the queue before giving up"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.slot():
+                    return await fn()
+            except Exception as e:
+                if failure_kind(e) != "overload":
+                    raise
+                delay = retry_after_seconds(e)
+                if attempt == self.max_retries:
+                    self.rejected += 1
+                    raise AdmissionRejected(f"{self.name} rate limited", delay) from e
+                self.retries += 1
+                await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": round(self.limit, 2),
+            "inflight": self.inflight,
+            "waiting": sum(1 for f in self._waiters if not f.done()),
+            "target_latency_ms": self.target_latency_ms,
+            "cuts": self.cuts,
+            "retries": self.retries,
+            "rejected": self.rejected
+        }
+
+
+class ConcurrencyLimiters:
+    """One AdaptiveLimiter per provider endpoint, created on first use"""
+
+    def __init__(self, target_latency_ms: Dict[str, float], default_target_latency_ms: float = 10000.0, **limiter_options):
+        self.target_latency_ms = target_latency_ms
+        self.default_target_latency_ms = default_target_latency_ms
+        self.limiter_options = limiter_options
+        self.limiters: Dict[str, AdaptiveLimiter] = {}
+
+    def get(self, endpoint: str) -> AdaptiveLimiter:
+        limiter = self.limiters.get(endpoint)
+        if limiter is None:
+            limiter = self.limiters[endpoint] = AdaptiveLimiter(
+                endpoint,
+                target_latency_ms=self.target_latency_ms.get(endpoint, self.default_target_latency_ms),
+                **self.limiter_options
+            )
+        return limiter
+
+    async def run(self, endpoint: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        return await self.get(endpoint).run(fn)
+
+    def slot(self, endpoint: str, track_latency: bool = True):
+        return self.get(endpoint).slot(track_latency)
+
+    def stats(self) -> Dict[str, Any]:
+        return {endpoint: limiter.stats() for endpoint, limiter in self.limiters.items()}
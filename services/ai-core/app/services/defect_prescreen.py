@@ -0,0 +1,100 @@
+"""
+Defect Pre-screen
+Local CPU scoring of inspection frames with an ONNX classifier/anomaly model, loaded once
+per worker and run in a small thread pool. Frames scoring below clean_below are answered
+locally; the uncertain band and likely defects are escalated to the remote vision model.
+
+The model takes one NCHW float32 image (ImageNet-normalised RGB, input_size square) and
+returns either a single defect probability/anomaly score in [0, 1] or two-class logits
+(clean, defect). onnxruntime is optional; without it the pre-screen is disabled.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+import asyncio
+import io
+import os
+import numpy as np
+from PIL import Image
+from app.core.logging import app_logger
+
+try:
+    import onnxruntime
+except ImportError:  # Optional: every frame goes to the remote model
+    onnxruntime = None
+
+_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+class DefectPrescreener:
+    def __init__(
+        self,
+        model_path: str,
+        clean_below: float = 0.2,
+        defect_above: float = 0.8,
+        input_size: int = 224,
+        workers: int = 2,
+        intra_op_threads: int = 1
+    ):
+        if onnxruntime is None:
+            raise RuntimeError("onnxruntime is not installed")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(model_path)
+
+        options = onnxruntime.SessionOptions()
+        # Parallelism comes from the worker threads; keep each inference single-threaded
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.model_name = os.path.basename(model_path)
+
+        self.clean_below = clean_below
+        self.defect_above = defect_above
+        self.input_size = input_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="defect-prescreen")
+        self.decisions: Dict[str, int] = {"clean": 0, "uncertain": 0, "defective": 0}
+        app_logger.info(f"Defect pre-screen model {self.model_name} loaded")
+
+    def _tensor(self, image: bytes) -> np.ndarray:
+        picture = Image.open(io.BytesIO(image))
+        picture.draft("RGB", (self.input_size, self.input_size))
+        picture = picture.convert("RGB").resize((self.input_size, self.input_size), Image.Resampling.BILINEAR)
+        pixels = (np.asarray(picture, dtype=np.float32) / 255.0 - _MEAN) / _STD
+        return pixels.transpose(2, 0, 1)[np.newaxis]
+
+    def _score(self, image: bytes) -> float:
+        """Blocking: decode at reduced scale, run the model, return the defect score"""
+        output = np.asarray(self.session.run(None, {self.input_name: self._tensor(image)})[0], dtype=np.float32).ravel()
+        if output.size >= 2:
+            logits = output[:2] - output[:2].max()
+            return float(np.exp(logits[1]) / np.exp(logits).sum())
+        return float(np.clip(output[0], 0.0, 1.0))
+
+    async def screen(self, image: bytes) -> Dict[str, Any]:
+        """{"score", "decision"}: clean frames can be answered locally, the rest escalate"""
+        score = await asyncio.get_running_loop().run_in_executor(self._executor, self._score, image)
+        if score < self.clean_below:
+            decision = "clean"
+        elif score >= self.defect_above:
+            decision = "defective"
+        else:
+            decision = "uncertain"
+        self.decisions[decision] += 1
+        return {"score": round(score, 4), "decision": decision, "model": self.model_name}
+
+    def stats(self) -> Dict[str, Any]:
+        screened = sum(self.decisions.values())
+        escalated = screened - self.decisions["clean"]
+        return {
+            "model": self.model_name,
+            "clean_below": self.clean_below,
+            "defect_above": self.defect_above,
+            "screened": screened,
+            "decisions": self.decisions,
+            "escalation_rate": escalated / screened if screened else 0.0
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,67 @@
+"""
+Embedding Cache
+Content-addressed two-tier cache for embeddings keyed by (model, sha256(text)):
+a byte-bounded in-process LRU in front of a persistent SQLite store
+"""
+
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+from app.services.tiered_store import TieredStore
+
+# Per-entry bookkeeping overhead (key string, tuple, OrderedDict node) added to the vector bytes
+_ENTRY_OVERHEAD_BYTES = 160
+
+
+def embedding_key(model: str, text: str) -> Tuple[str, str]:
+    return model, hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _vector_bytes(vector: array) -> int:
+    return len(vector) * vector.itemsize + _ENTRY_OVERHEAD_BYTES
+
+
+def _decode_vector(blob: bytes) -> array:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector
+
+
+class EmbeddingCache:
+    """Two-tier embedding cache; vectors are stored as float32"""
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, db_path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self._store = TieredStore(
+            "Embedding cache",
+            table="embeddings",
+            key_columns=("model", "hash"),
+            value_column="vector",
+            value_type="BLOB",
+            max_size=max_bytes,
+            sizeof=_vector_bytes,
+            encode=lambda vector: vector.tobytes(),
+            decode=_decode_vector,
+            db_path=db_path
+        )
+
+    async def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Return cached vectors in input order, None for misses"""
+        vectors = await self._store.get_many([embedding_key(model, text) for text in texts])
+        return [v.tolist() if v is not None else None for v in vectors]
+
+    async def set_many(self, model: str, texts: List[str], embeddings: List[List[float]]):
+        await self._store.set_many([
+            (embedding_key(model, text), array("f", embedding)) for text, embedding in zip(texts, embeddings)
+        ])
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self._store.stats()
+        return {
+            **stats,
+            "memory_bytes": self._store.memory_size,
+            "memory_max_bytes": self.max_bytes
+        }
+
+    def close(self):
+        self._store.close()
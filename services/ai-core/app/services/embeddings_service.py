@@ -1,42 +1,105 @@
-from typing import List
+from typing import Dict, List, Optional
+import time
 from openai import AsyncOpenAI
 from app.core.config import settings
 from app.core.logging import app_logger
+from app.core.tenant import current_tenant
+from app.services.embedding_cache import EmbeddingCache
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.services.concurrency import ConcurrencyLimiters
+from app.services.model_registry import model_registry
+
+DEFAULT_EMBEDDING_MODEL = "text-embedding-ada-002"
 
 
 class EmbeddingsService:
-    def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY) if settings.OPENAI_API_KEY else None
-    
-    async def embed_text(self, text: str, model: str = "text-embedding-ada-002") -> List[float]:
+    def __init__(
+        self,
+        client: Optional[AsyncOpenAI] = None,
+        cache: Optional[EmbeddingCache] = None,
+        concurrency: Optional[ConcurrencyLimiters] = None
+    ):
+        # Prefer the shared client from the service container; fall back to a private one
+        if client is None and settings.OPENAI_API_KEY:
+            client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        self.client = client
+        self.cache = cache
+        self.concurrency = concurrency
+        self.batchers: Dict[str, EmbeddingBatcher] = {}
+
+    def _get_batcher(self, model: str) -> EmbeddingBatcher:
+        batcher = self.batchers.get(model)
+        if batcher is None:
+            batcher = EmbeddingBatcher(
+                lambda texts: self._embed_uncached(texts, model, shared=True),
+                window_ms=settings.EMBEDDING_BATCH_WINDOW_MS,
+                max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+                max_batch_tokens=settings.EMBEDDING_BATCH_MAX_TOKENS
+            )
+            self.batchers[model] = batcher
+        return batcher
+
+    async def _embed_uncached(self, texts: List[str], model: str, shared: bool = False) -> List[List[float]]:
+        """One provider call for texts known to be missing from the cache"""
+        if shared:
+            # A micro-batch mixes texts from many tenants; keep it out of the tenant metrics
+            current_tenant.set(None)
+        call = lambda: self.client.embeddings.create(input=texts, model=model)
+        started = time.perf_counter()
+        try:
+            response = await (self.concurrency.run("openai:embeddings", call) if self.concurrency else call())
+        except Exception:
+            model_registry.record_call(model, started, success=False)
+            raise
+        model_registry.record_call(model, started, response.usage.prompt_tokens)
+        embeddings = [data.embedding for data in sorted(response.data, key=lambda d: d.index)]
+
+        if self.cache:
+            await self.cache.set_many(model, texts, embeddings)
+        return embeddings
+
+    async def embed_text(self, text: str, model: str = DEFAULT_EMBEDDING_MODEL) -> List[float]:
         """Generate embedding for a single text"""
         if not self.client:
             app_logger.warning("OpenAI client not configured, returning mock embedding")
             return [0.0] * 1536  # Mock embedding
-        
+
+        if self.cache:
+            cached = (await self.cache.get_many(model, [text]))[0]
+            if cached is not None:
+                return cached
+
         try:
-            response = await self.client.embeddings.create(
-                input=text,
-                model=model
-            )
-            return response.data[0].embedding
+            # Concurrent callers share one embeddings.create(input=[...]) request
+            return await self._get_batcher(model).submit(text)
         except Exception as e:
             app_logger.error(f"Embedding generation failed: {e}")
             raise
-    
-    async def embed_texts(self, texts: List[str], model: str = "text-embedding-ada-002") -> List[List[float]]:
+
+    async def embed_texts(self, texts: List[str], model: str = DEFAULT_EMBEDDING_MODEL) -> List[List[float]]:
         """Generate embeddings for multiple texts"""
         if not self.client:
             app_logger.warning("OpenAI client not configured, returning mock embeddings")
             return [[0.0] * 1536 for _ in texts]  # Mock embeddings
-        
-        try:
-            response = await self.client.embeddings.create(
-                input=texts,
-                model=model
-            )
-            return [data.embedding for data in response.data]
-        except Exception as e:
-            app_logger.error(f"Batch embedding generation failed: {e}")
-            raise
 
+        if not texts:
+            return []
+
+        results = await self.cache.get_many(model, texts) if self.cache else [None] * len(texts)
+
+        # Only send unique cache misses upstream, then splice them back in input order
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, results) if vector is None))
+        if missing:
+            try:
+                fetched = await self._embed_uncached(missing, model)
+            except Exception as e:
+                app_logger.error(f"Batch embedding generation failed: {e}")
+                raise
+
+            by_text = dict(zip(missing, fetched))
+            results = [vector if vector is not None else by_text[text] for text, vector in zip(texts, results)]
+
+        return results
+
+    def batch_stats(self) -> Dict[str, Dict]:
+        return {model: batcher.stats() for model, batcher in self.batchers.items()}
@@ -0,0 +1,107 @@
+"""
+Frame Dedupe Cache
+Per-camera cache of recent inspection results keyed by a perceptual hash (dHash) of the
+preprocessed frame. A frame within max_distance bits of a recently inspected one reuses
+that result instead of paying for another vision call, which covers stopped or slow
+lines where a fixed camera keeps sending the same picture. Entries expire after ttl
+seconds without a matching frame, and a result is never reused for longer than
+reinspect_seconds after the inspection that produced it.
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import time
+
+
+class _CameraFrames:
+    __slots__ = ("entries", "hits", "misses", "reinspections")
+
+    def __init__(self):
+        # [hash, result, inspected_at, last_seen]
+        self.entries: List[list] = []
+        self.hits = 0
+        self.misses = 0
+        self.reinspections = 0
+
+
+class FrameDedupeCache:
+    def __init__(
+        self,
+        max_distance: int = 4,
+        ttl_seconds: float = 60.0,
+        reinspect_seconds: float = 300.0,
+        max_frames_per_camera: int = 8,
+        max_cameras: int = 10000
+    ):
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+        self.reinspect_seconds = reinspect_seconds
+        self.max_frames_per_camera = max_frames_per_camera
+        self.max_cameras = max_cameras
+        self._cameras: "OrderedDict[Tuple[str, str], _CameraFrames]" = OrderedDict()
+
+    def _camera(self, company_id: str, camera_id: str) -> _CameraFrames:
+        key = (company_id, camera_id)
+        camera = self._cameras.get(key)
+        if camera is None:
+            camera = self._cameras[key] = _CameraFrames()
+            while len(self._cameras) > self.max_cameras:
+                self._cameras.popitem(last=False)
+        self._cameras.move_to_end(key)
+        return camera
+
+    def _nearest(self, camera: _CameraFrames, frame_hash: int, now: float) -> Tuple[Optional[list], int]:
+        camera.entries = [e for e in camera.entries if now - e[3] < self.ttl_seconds]
+        best, best_distance = None, self.max_distance + 1
+        for entry in camera.entries:
+            distance = (entry[0] ^ frame_hash).bit_count()
+            if distance < best_distance:
+                best, best_distance = entry, distance
+        return best, best_distance
+
+    def lookup(self, company_id: str, camera_id: str, frame_hash: int) -> Optional[Tuple[Dict[str, Any], int, float]]:
+        """(result, hamming distance, seconds since it was inspected) for a near-duplicate
+        frame, or None when the frame must be inspected"""
+        now = time.monotonic()
+        camera = self._camera(company_id, camera_id)
+        entry, distance = self._nearest(camera, frame_hash, now)
+        if entry is None:
+            camera.misses += 1
+            return None
+        if now - entry[2] >= self.reinspect_seconds:
+            camera.entries.remove(entry)
+            camera.reinspections += 1
+            return None
+        entry[3] = now
+        camera.hits += 1
+        return entry[1], distance, now - entry[2]
+
+    def store(self, company_id: str, camera_id: str, frame_hash: int, result: Dict[str, Any]):
+        now = time.monotonic()
+        camera = self._camera(company_id, camera_id)
+        # A fresh inspection replaces the entry it would otherwise have matched
+        entry, _ = self._nearest(camera, frame_hash, now)
+        if entry is not None:
+            camera.entries.remove(entry)
+        camera.entries.append([frame_hash, result, now, now])
+        if len(camera.entries) > self.max_frames_per_camera:
+            camera.entries.remove(min(camera.entries, key=lambda e: e[3]))
+
+    def stats(self, company_id: str) -> Dict[str, Any]:
+        cameras = {
+            camera_id: {
+                "frames": len(camera.entries),
+                "hits": camera.hits,
+                "misses": camera.misses,
+                "reinspections": camera.reinspections,
+                "hit_rate": camera.hits / (camera.hits + camera.misses + camera.reinspections)
+                if camera.hits + camera.misses + camera.reinspections else 0.0
+            }
+            for (company, camera_id), camera in self._cameras.items() if company == company_id
+        }
+        return {
+            "max_distance": self.max_distance,
+            "ttl_seconds": self.ttl_seconds,
+            "reinspect_seconds": self.reinspect_seconds,
+            "cameras": cameras
+        }
@@ -0,0 +1,65 @@
+"""
+Frame Sampler
+Server-side sampling for continuous camera streams: keep every Nth frame and, when a
+motion threshold is set, only frames whose tiny grayscale thumbnail differs from the
+last kept frame by more than that mean pixel difference. A keyframe is still kept every
+keyframe_seconds so a static scene is re-inspected now and then.
+"""
+
+from typing import Any, Dict, Optional
+import asyncio
+import io
+import time
+import numpy as np
+from PIL import Image
+
+_THUMBNAIL_SIZE = (32, 24)
+
+
+def thumbnail(frame: bytes) -> np.ndarray:
+    """Grayscale 32x24 thumbnail as floats in [0, 1]; JPEGs decode at 1/8 scale"""
+    image = Image.open(io.BytesIO(frame))
+    image.draft("L", (_THUMBNAIL_SIZE[0] * 2, _THUMBNAIL_SIZE[1] * 2))
+    small = image.convert("L").resize(_THUMBNAIL_SIZE, Image.Resampling.BILINEAR)
+    return np.asarray(small, dtype=np.float32) / 255.0
+
+
+class FrameSampler:
+    def __init__(self, every_nth: int = 1, motion_threshold: float = 0.0, keyframe_seconds: float = 30.0):
+        self.every_nth = max(1, every_nth)
+        self.motion_threshold = motion_threshold
+        self.keyframe_seconds = keyframe_seconds
+        self._last: Optional[np.ndarray] = None
+        self._last_kept_at = 0.0
+        self.received = 0
+        self.skipped = 0
+        self.still = 0
+
+    async def accept(self, frame: bytes) -> bool:
+        """Whether this frame should be inspected"""
+        self.received += 1
+        if (self.received - 1) % self.every_nth:
+            self.skipped += 1
+            return False
+        if self.motion_threshold <= 0:
+            return True
+
+        try:
+            current = await asyncio.to_thread(thumbnail, frame)
+        except OSError:
+            # Let inspection report the undecodable frame
+            return True
+        now = time.monotonic()
+        if (
+            self._last is not None
+            and now - self._last_kept_at < self.keyframe_seconds
+            and float(np.abs(current - self._last).mean()) < self.motion_threshold
+        ):
+            self.still += 1
+            return False
+        self._last = current
+        self._last_kept_at = now
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {"received": self.received, "skipped": self.skipped, "still": self.still}
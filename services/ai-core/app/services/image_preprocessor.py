@@ -0,0 +1,173 @@
+"""
+Image Preprocessor
+Shrinks camera frames before they are sent to a vision model: decode once (JPEG frames
+are decoded directly at a reduced DCT scale), crop to the camera's region of interest,
+downscale to a maximum long edge and re-encode as JPEG. The work runs in a thread or
+process pool so it never blocks the event loop.
+
+Frames may be passed as bytes or as a seekable binary file (e.g. an upload spooled to
+disk), which Pillow then reads in place instead of the whole frame being copied first.
+"""
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
+import asyncio
+import io
+import time
+from PIL import Image, ImageOps, UnidentifiedImageError
+from app.core.logging import app_logger
+
+
+Frame = Union[bytes, BinaryIO]
+
+
+class InvalidImageError(ValueError):
+    """The uploaded bytes are not a decodable image"""
+
+
+def frame_size(frame: Frame) -> int:
+    if isinstance(frame, bytes):
+        return len(frame)
+    position = frame.tell()
+    size = frame.seek(0, io.SEEK_END)
+    frame.seek(position)
+    return size
+
+
+def read_frame(frame: Frame) -> bytes:
+    if isinstance(frame, bytes):
+        return frame
+    frame.seek(0)
+    return frame.read()
+
+
+def _roi_box(size: Tuple[int, int], roi: List[float]) -> Tuple[int, int, int, int]:
+    """Pixel box for a [left, top, right, bottom] ROI given as fractions of the frame"""
+    width, height = size
+    left, top, right, bottom = (min(1.0, max(0.0, v)) for v in roi)
+    box = (int(left * width), int(top * height), int(right * width), int(bottom * height))
+    if box[2] <= box[0] or box[3] <= box[1]:
+        raise ValueError(f"Empty region of interest {roi}")
+    return box
+
+
+def dhash(image: Image.Image, size: int = 8) -> int:
+    """Difference hash: one bit per horizontally adjacent pixel pair of a tiny grayscale copy"""
+    pixels = image.convert("L").resize((size + 1, size), Image.Resampling.BILINEAR).tobytes()
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def preprocess_image(
+    data: Frame,
+    max_long_edge: int,
+    quality: int,
+    roi: Optional[List[float]] = None
+) -> Tuple[bytes, Dict[str, Any]]:
+    """Blocking decode/crop/resize/encode. Module-level so a process pool can pickle it."""
+    started = time.perf_counter()
+    original_bytes = frame_size(data)
+    try:
+        if not isinstance(data, bytes):
+            data.seek(0)
+        image = Image.open(io.BytesIO(data) if isinstance(data, bytes) else data)
+        original_size = image.size
+        original_format = image.format
+
+        # JPEG can decode straight to 1/2, 1/4 or 1/8 scale; ask for just enough pixels
+        # that the cropped region still covers max_long_edge
+        if original_format == "JPEG":
+            span = max(roi[2] - roi[0], roi[3] - roi[1]) if roi else 1.0
+            scale = max_long_edge / (max(original_size) * max(span, 1e-3))
+            if scale < 1:
+                image.draft("RGB", (int(original_size[0] * scale) + 1, int(original_size[1] * scale) + 1))
+
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    except (UnidentifiedImageError, OSError) as e:
+        raise InvalidImageError(f"Cannot decode image: {e}") from e
+
+    if roi:
+        image = image.crop(_roi_box(image.size, roi))
+    if max(image.size) > max_long_edge:
+        image.thumbnail((max_long_edge, max_long_edge), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    output = buffer.getvalue()
+
+    # An already small JPEG can come out larger after re-encoding; keep the original then
+    if not roi and original_format == "JPEG" and image.size == original_size and len(output) >= original_bytes:
+        output = read_frame(data)
+
+    return output, {
+        "original_bytes": original_bytes,
+        "processed_bytes": len(output),
+        "original_size": list(original_size),
+        "processed_size": list(image.size),
+        "roi": roi,
+        "dhash": f"{dhash(image):016x}",
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+
+
+class ImagePreprocessor:
+    def __init__(
+        self,
+        max_long_edge: int = 1024,
+        quality: int = 85,
+        camera_rois: Optional[Dict[str, List[float]]] = None,
+        workers: int = 2,
+        executor: str = "thread"
+    ):
+        self.max_long_edge = max_long_edge
+        self.quality = quality
+        self.camera_rois = camera_rois or {}
+        # Pillow releases the GIL while decoding, resizing and encoding, so threads scale well;
+        # a process pool isolates the work completely at the cost of copying frames across
+        if executor == "process":
+            self._executor: Executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-preprocess")
+        self.executor_kind = executor
+
+        self.frames = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    async def process(self, data: Frame, camera_id: Optional[str] = None) -> Tuple[bytes, Dict[str, Any]]:
+        """Return the re-encoded JPEG and a report with before/after byte counts"""
+        roi = self.camera_rois.get(camera_id) if camera_id else None
+        loop = asyncio.get_running_loop()
+        if self.executor_kind == "process" and not isinstance(data, bytes):
+            # File handles cannot be pickled across to a worker process
+            data = await loop.run_in_executor(None, read_frame, data)
+        output, info = await loop.run_in_executor(
+            self._executor, preprocess_image, data, self.max_long_edge, self.quality, roi
+        )
+        self.frames += 1
+        self.bytes_in += info["original_bytes"]
+        self.bytes_out += info["processed_bytes"]
+        return output, info
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "executor": self.executor_kind,
+            "max_long_edge": self.max_long_edge,
+            "quality": self.quality,
+            "cameras_with_roi": len(self.camera_rois),
+            "frames": self.frames,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "reduction": 1 - self.bytes_out / self.bytes_in if self.bytes_in else 0.0
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        app_logger.info("Image preprocessor stopped")
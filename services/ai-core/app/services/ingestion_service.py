@@ -0,0 +1,186 @@
+"""
+Ingestion Service
+Pipelined bulk ingestion: documents are split into token-budgeted batches that are
+embedded with bounded parallelism, and each batch is upserted (also bounded) as soon as
+it is ready
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from datetime import datetime
+import asyncio
+import math
+import time
+import uuid
+from app.core.cache import TTLCache
+from app.core.logging import app_logger
+from app.services.embeddings_service import EmbeddingsService
+from app.services.qdrant_service import QdrantService
+from app.services.tokenizer import estimate_tokens
+
+
+class IngestionService:
+    def __init__(
+        self,
+        embeddings: EmbeddingsService,
+        qdrant: QdrantService,
+        max_batch_tokens: int = 20000,
+        max_batch_documents: int = 256,
+        concurrency: int = 4,
+        upsert_concurrency: int = 4,
+        job_ttl_seconds: float = 3600.0
+    ):
+        self.embeddings = embeddings
+        self.qdrant = qdrant
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_documents = max_batch_documents
+        self.concurrency = concurrency
+        self.upsert_concurrency = upsert_concurrency
+        # Running jobs are never evicted; finished ones stay pollable for job_ttl_seconds
+        self.running_jobs: Dict[str, Dict[str, Any]] = {}
+        self.jobs = TTLCache(maxsize=1000, ttl=job_ttl_seconds)
+        self._tasks: Set[asyncio.Task] = set()
+
+    def split_batches(self, documents: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Split documents into batches that fit the provider's per-request token budget"""
+        batches: List[List[Dict[str, Any]]] = []
+        current: List[Dict[str, Any]] = []
+        current_tokens = 0
+
+        for doc in documents:
+            tokens = estimate_tokens(doc["content"])
+            if current and (
+                current_tokens + tokens > self.max_batch_tokens
+                or len(current) >= self.max_batch_documents
+            ):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(doc)
+            current_tokens += tokens
+
+        if current:
+            batches.append(current)
+        return batches
+
+    def plan(self, documents: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """(embedding requests, tokens) ingesting documents costs, for admission"""
+        tokens = sum(estimate_tokens(str(doc.get("content", ""))) for doc in documents)
+        requests = max(1, math.ceil(len(documents) / self.max_batch_documents), math.ceil(tokens / self.max_batch_tokens))
+        return requests, tokens
+
+    async def ingest(
+        self,
+        collection: str,
+        company_id: str,
+        documents: List[Dict[str, Any]],
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Dict[str, Any]:
+        """Embed and upsert documents batch by batch; failures are reported per batch"""
+        await self.qdrant.create_collection(collection)
+
+        batches = self.split_batches(documents)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        upsert_semaphore = asyncio.Semaphore(self.upsert_concurrency)
+        offsets = [0]
+        for batch in batches[:-1]:
+            offsets.append(offsets[-1] + len(batch))
+
+        async def process(index: int, batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+            started = time.perf_counter()
+            result = {"batch": index, "offset": offsets[index], "count": len(batch)}
+            try:
+                async with semaphore:
+                    embeddings = await self.embeddings.embed_texts([doc["content"] for doc in batch])
+                # Upsert under its own limit so the next batch starts embedding meanwhile
+                async with upsert_semaphore:
+                    await self.qdrant.upsert_embeddings(
+                        collection_name=collection,
+                        company_id=company_id,
+                        documents=batch,
+                        embeddings=embeddings
+                    )
+                result["status"] = "success"
+            except Exception as e:
+                app_logger.error(f"Ingestion batch {index} ({len(batch)} docs) failed: {e}")
+                result["status"] = "failed"
+                result["error"] = str(e)
+            result["latency_ms"] = int((time.perf_counter() - started) * 1000)
+            return result
+
+        results: List[Dict[str, Any]] = []
+        for finished in asyncio.as_completed([process(i, b) for i, b in enumerate(batches)]):
+            result = await finished
+            results.append(result)
+            if on_progress:
+                on_progress(result)
+
+        results.sort(key=lambda r: r["batch"])
+        succeeded = sum(r["count"] for r in results if r["status"] == "success")
+        failed_batches = sum(1 for r in results if r["status"] == "failed")
+
+        if failed_batches == 0:
+            status = "success"
+        elif succeeded:
+            status = "partial"
+        else:
+            status = "failed"
+
+        return {
+            "status": status,
+            "count": succeeded,
+            "total": len(documents),
+            "failed": len(documents) - succeeded,
+            "batches": results
+        }
+
+    def start_job(self, collection: str, company_id: str, documents: List[Dict[str, Any]]) -> str:
+        """Run ingestion in the background and return a job id to poll"""
+        job_id = str(uuid.uuid4())
+        total_batches = len(self.split_batches(documents))
+        job: Dict[str, Any] = {
+            "job_id": job_id,
+            "company_id": company_id,
+            "collection": collection,
+            "status": "running",
+            "total": len(documents),
+            "total_batches": total_batches,
+            "completed_batches": 0,
+            "processed": 0,
+            "batches": [],
+            "created_at": datetime.utcnow().isoformat(),
+            "finished_at": None
+        }
+        self.running_jobs[job_id] = job
+
+        def on_progress(result: Dict[str, Any]):
+            job["completed_batches"] += 1
+            if result["status"] == "success":
+                job["processed"] += result["count"]
+            job["batches"].append(result)
+
+        async def run():
+            try:
+                summary = await self.ingest(collection, company_id, documents, on_progress=on_progress)
+                job.update(summary)
+            except Exception as e:
+                app_logger.error(f"Ingestion job {job_id} failed: {e}")
+                job["status"] = "failed"
+                job["error"] = str(e)
+            job["finished_at"] = datetime.utcnow().isoformat()
+            self.jobs.set(job_id, job)
+            self.running_jobs.pop(job_id, None)
+
+        task = asyncio.create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job_id
+
+    def get_job(self, job_id: str, company_id: str) -> Optional[Dict[str, Any]]:
+        job = self.running_jobs.get(job_id) or self.jobs.get(job_id)
+        if not job or job["company_id"] != company_id:
+            return None
+        return job
+
+    async def aclose(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
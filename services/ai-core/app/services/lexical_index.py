@@ -0,0 +1,274 @@
+"""
+Lexical Index
+In-process BM25 inverted index kept next to each vector collection, so part numbers,
+drug names and invoice IDs can be matched exactly and fused with vector results.
+
+Latin text is split into lowercase word tokens (identifiers such as "INV-2024-001"
+are kept whole and also split into their parts); CJK text is indexed as character
+unigrams and bigrams, which works without a zh-TW word segmenter.
+"""
+
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import json
+import math
+import os
+import re
+import threading
+from app.core.logging import app_logger
+
+_WORD_PATTERN = re.compile(r"[0-9a-z]+(?:[\-_./][0-9a-z]+)*")
+_CJK_RUN_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+")
+_IDENTIFIER_PATTERN = re.compile(r"^(?=.*\d)[0-9A-Za-z]+(?:[\-_./][0-9A-Za-z]+)*$")
+
+
+def tokenize(text: str) -> List[str]:
+    text = text.lower()
+    tokens: List[str] = []
+    for match in _WORD_PATTERN.finditer(text):
+        word = match.group()
+        tokens.append(word)
+        parts = re.split(r"[\-_./]", word)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    for match in _CJK_RUN_PATTERN.finditer(text):
+        run = match.group()
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def is_identifier_query(query: str) -> bool:
+    """True for single-token queries like part numbers or invoice IDs"""
+    return bool(_IDENTIFIER_PATTERN.match(query.strip()))
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], limit: int, k: int = 60) -> List[Dict[str, Any]]:
+    """Merge ranked result lists by summing 1 / (k + rank) per document"""
+    scores: Dict[Any, float] = {}
+    documents: Dict[Any, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, start=1):
+            key = str(result["id"])
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            documents.setdefault(key, result)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [{**documents[key], "score": scores[key]} for key in ranked]
+
+
+class _Partition:
+    """BM25 statistics for one tenant inside one collection"""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_terms: Dict[str, Counter] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self.total_length = 0
+
+    def remove(self, doc_id: str):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self.postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        self.documents.pop(doc_id, None)
+
+    def add(self, doc_id: str, content: str, metadata: Dict[str, Any]):
+        self.remove(doc_id)
+        terms = Counter(tokenize(content))
+        self.doc_terms[doc_id] = terms
+        self.doc_lengths[doc_id] = sum(terms.values())
+        self.total_length += self.doc_lengths[doc_id]
+        self.documents[doc_id] = {"content": content, "metadata": metadata}
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+
+    def search(self, query: str, limit: int, k1: float = 1.2, b: float = 0.75) -> List[Dict[str, Any]]:
+        n = len(self.doc_lengths)
+        if n == 0:
+            return []
+
+        avg_length = self.total_length / n
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                norm = tf + k1 * (1 - b + b * self.doc_lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / norm
+
+        ranked = sorted(scores, key=scores.get, reverse=True)[:limit]
+        return [
+            {
+                "id": doc_id,
+                "score": scores[doc_id],
+                "content": self.documents[doc_id]["content"],
+                "metadata": self.documents[doc_id]["metadata"]
+            }
+            for doc_id in ranked
+        ]
+
+    def exact(self, identifier: str, limit: int) -> List[Dict[str, Any]]:
+        postings = self.postings.get(identifier.lower(), {})
+        ranked = sorted(postings, key=postings.get, reverse=True)[:limit]
+        return [
+            {
+                "id": doc_id,
+                "score": 1.0,
+                "content": self.documents[doc_id]["content"],
+                "metadata": self.documents[doc_id]["metadata"]
+            }
+            for doc_id in ranked
+        ]
+
+
+class LexicalIndex:
+    """Per-collection, per-tenant BM25 indexes persisted as JSONL logs.
+
+    Each tenant partition has its own lock, so one tenant's upsert never stalls another
+    tenant's search; the collection lock only covers loading and writing the log. Re-upserts
+    append superseded records, and the log is rewritten from the live documents once it
+    holds more than `compact_ratio` times as many records as there are documents."""
+
+    def __init__(self, base_dir: str, compact_ratio: float = 2.0, compact_min_records: int = 1000):
+        self.base_dir = base_dir
+        self.compact_ratio = compact_ratio
+        self.compact_min_records = compact_min_records
+        self.collections: Dict[str, Dict[str, _Partition]] = {}
+        self._records: Dict[str, int] = {}
+        self._collection_locks: Dict[str, threading.Lock] = {}
+        self._partition_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+        os.makedirs(base_dir, exist_ok=True)
+
+    def _log_path(self, collection_name: str) -> str:
+        if not re.fullmatch(r"[A-Za-z0-9_\-]+", collection_name):
+            raise ValueError(f"Invalid collection name: {collection_name}")
+        return os.path.join(self.base_dir, f"{collection_name}.jsonl")
+
+    def _collection_lock(self, collection_name: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._collection_locks.setdefault(collection_name, threading.Lock())
+
+    def _partition_lock(self, collection_name: str, company_id: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._partition_locks.setdefault((collection_name, company_id), threading.Lock())
+
+    def _collection(self, collection_name: str) -> Dict[str, _Partition]:
+        partitions = self.collections.get(collection_name)
+        if partitions is not None:
+            return partitions
+
+        with self._collection_lock(collection_name):
+            # Another thread may have loaded the log while we waited for the lock
+            partitions = self.collections.get(collection_name)
+            if partitions is not None:
+                return partitions
+
+            partitions = {}
+            records = 0
+            path = self._log_path(collection_name)
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            record = json.loads(line)
+                            partitions.setdefault(record["company_id"], _Partition()).add(
+                                record["id"], record["content"], record.get("metadata", {})
+                            )
+                            records += 1
+                app_logger.info(f"Loaded lexical index for {collection_name}")
+            self._records[collection_name] = records
+            self.collections[collection_name] = partitions
+            return partitions
+
+    def _partition(self, collection_name: str, company_id: str) -> _Partition:
+        partitions = self._collection(collection_name)
+        with self._collection_lock(collection_name):
+            return partitions.setdefault(company_id, _Partition())
+
+    def _add(self, collection_name: str, company_id: str, documents: List[Dict[str, Any]]):
+        partition = self._partition(collection_name, company_id)
+        records = [
+            {
+                "id": doc["id"],
+                "company_id": company_id,
+                "content": doc["content"],
+                "metadata": doc.get("metadata", {})
+            }
+            for doc in documents
+        ]
+
+        with self._collection_lock(collection_name):
+            with open(self._log_path(collection_name), "a", encoding="utf-8") as log:
+                for record in records:
+                    log.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._records[collection_name] += len(records)
+
+        with self._partition_lock(collection_name, company_id):
+            for record in records:
+                partition.add(record["id"], record["content"], record["metadata"])
+
+        self._maybe_compact(collection_name)
+
+    def _maybe_compact(self, collection_name: str):
+        """Rewrite the log from the live documents once superseded records dominate it"""
+        partitions = self._collection(collection_name)
+        with self._collection_lock(collection_name):
+            records = self._records[collection_name]
+            live = sum(len(partition.documents) for partition in partitions.values())
+            if records < self.compact_min_records or records <= live * self.compact_ratio:
+                return
+
+            path = self._log_path(collection_name)
+            temp_path = f"{path}.tmp"
+            written = 0
+            with open(temp_path, "w", encoding="utf-8") as log:
+                for company_id, partition in list(partitions.items()):
+                    with self._partition_lock(collection_name, company_id):
+                        documents = list(partition.documents.items())
+                    for doc_id, doc in documents:
+                        record = {
+                            "id": doc_id,
+                            "company_id": company_id,
+                            "content": doc["content"],
+                            "metadata": doc["metadata"]
+                        }
+                        log.write(json.dumps(record, ensure_ascii=False) + "\n")
+                        written += 1
+            os.replace(temp_path, path)
+            self._records[collection_name] = written
+            app_logger.info(f"Compacted lexical index for {collection_name}: {records} -> {written} records")
+
+    def _search(self, collection_name: str, company_id: str, query: str, limit: int, exact: bool):
+        partition: Optional[_Partition] = self._collection(collection_name).get(company_id)
+        if partition is None:
+            return []
+        with self._partition_lock(collection_name, company_id):
+            return partition.exact(query.strip(), limit) if exact else partition.search(query, limit)
+
+    def _size(self, collection_name: str, company_id: str) -> int:
+        partition: Optional[_Partition] = self._collection(collection_name).get(company_id)
+        return len(partition.documents) if partition is not None else 0
+
+    async def add(self, collection_name: str, company_id: str, documents: List[Dict[str, Any]]):
+        await asyncio.to_thread(self._add, collection_name, company_id, documents)
+
+    async def search(self, collection_name: str, company_id: str, query: str, limit: int = 5):
+        return await asyncio.to_thread(self._search, collection_name, company_id, query, limit, False)
+
+    async def exact(self, collection_name: str, company_id: str, identifier: str, limit: int = 5):
+        return await asyncio.to_thread(self._search, collection_name, company_id, identifier, limit, True)
+
+    async def size(self, collection_name: str, company_id: str) -> int:
+        """Number of documents indexed for the tenant; 0 for collections filled before indexing"""
+        return await asyncio.to_thread(self._size, collection_name, company_id)
@@ -0,0 +1,145 @@
+"""
+LLM Response Cache
+Per-tenant cache of completions with an exact tier keyed by the normalised request and
+an optional semantic tier that reuses answers for embedding-similar prompts at low temperature
+"""
+
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import hashlib
+import json
+import re
+import time
+import numpy as np
+from app.core.cache import TTLCache
+from app.core.logging import app_logger
+from app.services.embeddings_service import EmbeddingsService
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize(text: Optional[str]) -> str:
+    return _WHITESPACE.sub(" ", text or "").strip()
+
+
+def _digest(payload: Any) -> str:
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def make_request_keys(
+    model: str,
+    messages: List[Dict[str, str]],
+    system_prompt: Optional[str],
+    temperature: float,
+    max_tokens: int
+) -> Tuple[str, str]:
+    """Exact key over the whole request, and the semantic scope (everything except the last message)"""
+    normalized = [
+        {"role": m.get("role", "user"), "content": _normalize(m.get("content"))}
+        for m in messages
+    ]
+    base = {
+        "model": model,
+        "system": _normalize(system_prompt),
+        "temperature": round(temperature, 2),
+        "max_tokens": max_tokens
+    }
+    exact_key = _digest({**base, "messages": normalized})
+    scope = _digest({**base, "history": normalized[:-1]})
+    return exact_key, scope
+
+
+class LLMResponseCache:
+    def __init__(
+        self,
+        max_entries: int = 5000,
+        ttl_seconds: float = 3600.0,
+        embeddings: Optional[EmbeddingsService] = None,
+        semantic_threshold: float = 0.95,
+        semantic_max_temperature: float = 0.3,
+        semantic_max_entries_per_tenant: int = 1000
+    ):
+        self.ttl = ttl_seconds
+        self.exact = TTLCache(maxsize=max_entries, ttl=ttl_seconds)
+        self.embeddings = embeddings
+        self.semantic_threshold = semantic_threshold
+        self.semantic_max_temperature = semantic_max_temperature
+        self.semantic_max_entries_per_tenant = semantic_max_entries_per_tenant
+        # company_id -> (scope, unit vector, response, expires_at)
+        self._semantic: Dict[str, Deque[Tuple[str, np.ndarray, Dict[str, Any], float]]] = {}
+        self.semantic_hits = 0
+
+    def _semantic_enabled(self, temperature: float) -> bool:
+        return self.embeddings is not None and temperature <= self.semantic_max_temperature
+
+    async def _embed(self, text: str) -> np.ndarray:
+        vector = np.asarray(await self.embeddings.embed_text(_normalize(text)), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def get(
+        self,
+        company_id: str,
+        exact_key: str,
+        scope: str,
+        last_message: str,
+        temperature: float
+    ) -> Optional[Dict[str, Any]]:
+        response = self.exact.get((company_id, exact_key))
+        if response is not None or not self._semantic_enabled(temperature):
+            return response
+
+        bucket = self._semantic.get(company_id)
+        if not bucket:
+            return None
+
+        now = time.monotonic()
+        candidates = [entry for entry in bucket if entry[0] == scope and entry[3] > now]
+        if not candidates:
+            return None
+
+        try:
+            query = await self._embed(last_message)
+        except Exception as e:
+            app_logger.warning(f"Semantic cache lookup skipped: {e}")
+            return None
+
+        similarities = np.stack([entry[1] for entry in candidates]) @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.semantic_threshold:
+            self.semantic_hits += 1
+            return candidates[best][2]
+        return None
+
+    async def set(
+        self,
+        company_id: str,
+        exact_key: str,
+        scope: str,
+        last_message: str,
+        temperature: float,
+        response: Dict[str, Any]
+    ):
+        self.exact.set((company_id, exact_key), response)
+
+        if self._semantic_enabled(temperature):
+            try:
+                vector = await self._embed(last_message)
+            except Exception as e:
+                app_logger.warning(f"Semantic cache insert skipped: {e}")
+                return
+            bucket = self._semantic.setdefault(company_id, deque(maxlen=self.semantic_max_entries_per_tenant))
+            bucket.append((scope, vector, response, time.monotonic() + self.ttl))
+
+    def stats(self) -> Dict[str, Any]:
+        exact = self.exact.stats()
+        return {
+            "exact_entries": exact["size"],
+            "exact_hits": exact["hits"],
+            "misses": exact["misses"],
+            "semantic_enabled": self.embeddings is not None,
+            "semantic_entries": sum(len(bucket) for bucket in self._semantic.values()),
+            "semantic_hits": self.semantic_hits,
+            "hit_rate": (exact["hits"] + self.semantic_hits) / (exact["hits"] + exact["misses"])
+            if exact["hits"] + exact["misses"] else 0.0
+        }
@@ -1,14 +1,41 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Awaitable, AsyncIterator
+from contextlib import nullcontext
+import time
 from openai import AsyncOpenAI
 from anthropic import AsyncAnthropic
 from app.core.config import settings
 from app.core.logging import app_logger
+from app.core.tenant import current_tenant
+from app.services.llm_cache import LLMResponseCache, make_request_keys
+from app.services.singleflight import SingleFlight
+from app.services.provider_router import ProviderRouter
+from app.services.concurrency import ConcurrencyLimiters
+from app.services.model_registry import model_registry
+from app.services.tokenizer import count_message_tokens, count_tokens
+from app.services.token_budget import plan
 
 
 class LLMService:
-    def __init__(self):
-        self.openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY) if settings.OPENAI_API_KEY else None
-        self.anthropic_client = AsyncAnthropic(api_key=settings.ANTHROPIC_API_KEY) if settings.ANTHROPIC_API_KEY else None
+    def __init__(
+        self,
+        openai_client: Optional[AsyncOpenAI] = None,
+        anthropic_client: Optional[AsyncAnthropic] = None,
+        cache: Optional[LLMResponseCache] = None,
+        singleflight: Optional[SingleFlight] = None,
+        router: Optional[ProviderRouter] = None,
+        concurrency: Optional[ConcurrencyLimiters] = None
+    ):
+        # Prefer the shared clients from the service container; fall back to private ones
+        if openai_client is None and settings.OPENAI_API_KEY:
+            openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        if anthropic_client is None and settings.ANTHROPIC_API_KEY:
+            anthropic_client = AsyncAnthropic(api_key=settings.ANTHROPIC_API_KEY)
+        self.openai_client = openai_client
+        self.anthropic_client = anthropic_client
+        self.cache = cache
+        self.singleflight = singleflight
+        self.router = router
+        self.concurrency = concurrency
     
     async def generate_text(
         self,
@@ -16,9 +43,106 @@ class LLMService:
         system_prompt: Optional[str] = None,
         max_tokens: int = 1000,
         temperature: float = 0.7,
-        model: str = "gpt-3.5-turbo"
+        model: str = "gpt-3.5-turbo",
+        company_id: Optional[str] = None,
+        use_cache: bool = True,
+        subscription_tier: Optional[str] = None,
+        overflow: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Generate text using LLM. Prompts that do not fit the model's context window raise
+        PromptTooLarge, or are compacted/truncated with overflow="truncate"."""
+        messages, system_prompt, budget = plan(
+            model,
+            [{"role": "user", "content": prompt}],
+            system_prompt,
+            max_tokens,
+            overflow or settings.LLM_PROMPT_OVERFLOW
+        )
+        prompt = messages[0]["content"]
+        result = await self._cached(
+            lambda: self._generate_uncached(prompt, system_prompt, budget.max_tokens, temperature, model, subscription_tier),
+            company_id=company_id,
+            use_cache=use_cache,
+            model=model,
+            messages=messages,
+            system_prompt=system_prompt,
+            temperature=temperature,
+            max_tokens=budget.max_tokens
+        )
+        return {**result, "budget": budget.dict()}
+    
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        model: str = "gpt-3.5-turbo",
+        company_id: Optional[str] = None,
+        use_cache: bool = True,
+        subscription_tier: Optional[str] = None,
+        overflow: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Chat with LLM. Conversations that do not fit the model's context window raise
+        PromptTooLarge, or lose their oldest turns with overflow="truncate"."""
+        messages, _, budget = plan(model, messages, None, max_tokens, overflow or settings.LLM_PROMPT_OVERFLOW)
+        result = await self._cached(
+            lambda: self._chat_uncached(messages, budget.max_tokens, temperature, model, subscription_tier),
+            company_id=company_id,
+            use_cache=use_cache,
+            model=model,
+            messages=messages,
+            system_prompt=None,
+            temperature=temperature,
+            max_tokens=budget.max_tokens
+        )
+        return {**result, "budget": budget.dict()}
+    
+    async def _cached(
+        self,
+        call: Callable[[], Awaitable[Dict[str, Any]]],
+        company_id: Optional[str],
+        use_cache: bool,
+        model: str,
+        messages: List[Dict[str, str]],
+        system_prompt: Optional[str],
+        temperature: float,
+        max_tokens: int
+    ) -> Dict[str, Any]:
+        """Serve from the per-tenant response cache, or call the provider and store the result.
+        Identical requests of the same tenant already in flight share one provider call
+        (single-flight), whether or not the cache is used."""
+        if not messages or not (self.openai_client or self.anthropic_client):
+            return {**await call(), "cached": False}
+        
+        exact_key, scope = make_request_keys(model, messages, system_prompt, temperature, max_tokens)
+        last_message = messages[-1].get("content", "")
+        tenant = company_id if company_id is not None else current_tenant.get()
+        use_cache = use_cache and self.cache is not None and company_id is not None
+        
+        if use_cache:
+            hit = await self.cache.get(company_id, exact_key, scope, last_message, temperature)
+            if hit is not None:
+                return {**hit, "cached": True}
+        
+        if not self.singleflight:
+            result, shared = await call(), False
+        else:
+            result, shared = await self.singleflight.do((tenant, exact_key), call)
+        
+        # Only the leader stores the result; followers received the same object
+        if use_cache and not shared:
+            await self.cache.set(company_id, exact_key, scope, last_message, temperature, result)
+        return {**result, "cached": False, "coalesced": shared}
+    
+    async def _generate_uncached(
+        self,
+        prompt: str,
+        system_prompt: Optional[str],
+        max_tokens: int,
+        temperature: float,
+        model: str,
+        subscription_tier: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Generate text using LLM"""
         if not self.openai_client and not self.anthropic_client:
             app_logger.warning("No LLM client configured, returning mock response")
             return {
@@ -27,21 +151,79 @@ class LLMService:
                 "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
             }
         
+        messages = [{"role": "user", "content": prompt}]
+        return await self._routed(
+            model,
+            lambda m: self._complete(m, messages, system_prompt, max_tokens, temperature),
+            subscription_tier
+        )
+    
+    async def _chat_uncached(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        model: str,
+        subscription_tier: Optional[str] = None
+    ) -> Dict[str, Any]:
+        if not self.openai_client and not self.anthropic_client:
+            app_logger.warning("No LLM client configured, returning mock response")
+            return {
+                "content": "Mock AI chat response - please configure API keys",
+                "model": model,
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            }
+        
+        return await self._routed(
+            model,
+            lambda m: self._complete(m, messages, None, max_tokens, temperature),
+            subscription_tier
+        )
+    
+    async def _routed(
+        self,
+        model: str,
+        call: Callable[[str], Awaitable[Dict[str, Any]]],
+        subscription_tier: Optional[str]
+    ) -> Dict[str, Any]:
+        """Send the call through the provider router (failover, hedging, circuit breakers) when configured"""
+        if not self.router:
+            return await call(model)
+        return await self.router.call(model, call, subscription_tier)
+    
+    async def _limited(self, endpoint: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Run one provider request under the endpoint's adaptive concurrency limit"""
+        if not self.concurrency:
+            return await call()
+        return await self.concurrency.run(endpoint, call)
+    
+    def _stream_slot(self, endpoint: str):
+        return self.concurrency.slot(endpoint, track_latency=False) if self.concurrency else nullcontext()
+    
+    async def _complete(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        system_prompt: Optional[str],
+        max_tokens: int,
+        temperature: float
+    ) -> Dict[str, Any]:
+        """One non-streaming completion on the provider that serves model"""
+        provider = model_registry.provider_for(model)
+        started = time.perf_counter()
+        
         try:
-            if self.openai_client and (model.startswith("gpt") or not self.anthropic_client):
-                messages = []
-                if system_prompt:
-                    messages.append({"role": "system", "content": system_prompt})
-                messages.append({"role": "user", "content": prompt})
+            if self.openai_client and (provider == "openai" or not self.anthropic_client):
+                openai_messages = ([{"role": "system", "content": system_prompt}] if system_prompt else []) + messages
                 
-                response = await self.openai_client.chat.completions.create(
+                response = await self._limited("openai:chat", lambda: self.openai_client.chat.completions.create(
                     model=model,
-                    messages=messages,
+                    messages=openai_messages,
                     max_tokens=max_tokens,
                     temperature=temperature
-                )
+                ))
                 
-                return {
+                result = {
                     "content": response.choices[0].message.content,
                     "model": response.model,
                     "usage": {
@@ -50,17 +232,19 @@ class LLMService:
                         "total_tokens": response.usage.total_tokens
                     }
                 }
-            
-            elif self.anthropic_client:
-                response = await self.anthropic_client.messages.create(
-                    model=model if model.startswith("claude") else "claude-3-haiku-20240307",
+            else:
+                # Anthropic takes the system prompt separately from the conversation
+                system = system_prompt or "\n".join(m["content"] for m in messages if m.get("role") == "system")
+                model = model if provider == "anthropic" else "claude-3-haiku-20240307"
+                response = await self._limited("anthropic:messages", lambda: self.anthropic_client.messages.create(
+                    model=model,
                     max_tokens=max_tokens,
                     temperature=temperature,
-                    system=system_prompt or "",
-                    messages=[{"role": "user", "content": prompt}]
-                )
+                    system=system,
+                    messages=[m for m in messages if m.get("role") != "system"]
+                ))
                 
-                return {
+                result = {
                     "content": response.content[0].text,
                     "model": response.model,
                     "usage": {
@@ -70,43 +254,235 @@ class LLMService:
                     }
                 }
         except Exception as e:
-            app_logger.error(f"Text generation failed: {e}")
+            model_registry.record_call(model, started, success=False)
+            app_logger.error(f"Completion on {model} failed: {e}")
             raise
+        
+        model_registry.record_call(
+            model,
+            started,
+            result["usage"]["prompt_tokens"],
+            result["usage"]["completion_tokens"]
+        )
+        return result
     
-    async def chat(
+    async def stream_text(
+        self,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        model: str = "gpt-3.5-turbo",
+        company_id: Optional[str] = None,
+        use_cache: bool = True,
+        overflow: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream text generation as {"type": "delta"} events followed by one {"type": "done"}"""
+        messages, system_prompt, budget = plan(
+            model,
+            [{"role": "user", "content": prompt}],
+            system_prompt,
+            max_tokens,
+            overflow or settings.LLM_PROMPT_OVERFLOW
+        )
+        prompt = messages[0]["content"]
+        max_tokens = budget.max_tokens
+        
+        async for event in self._stream_cached(
+            self._stream_source(model, messages, system_prompt, max_tokens, temperature),
+            lambda: self._generate_uncached(prompt, system_prompt, max_tokens, temperature, model),
+            company_id=company_id,
+            use_cache=use_cache,
+            model=model,
+            messages=messages,
+            system_prompt=system_prompt,
+            temperature=temperature,
+            max_tokens=max_tokens
+        ):
+            yield event
+    
+    async def stream_chat(
         self,
         messages: List[Dict[str, str]],
         max_tokens: int = 1000,
         temperature: float = 0.7,
-        model: str = "gpt-3.5-turbo"
-    ) -> Dict[str, Any]:
-        """Chat with LLM"""
-        if not self.openai_client:
-            app_logger.warning("No LLM client configured, returning mock response")
-            return {
-                "content": "Mock AI chat response - please configure API keys",
-                "model": model,
-                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
-            }
+        model: str = "gpt-3.5-turbo",
+        company_id: Optional[str] = None,
+        use_cache: bool = True,
+        overflow: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a chat completion as {"type": "delta"} events followed by one {"type": "done"}"""
+        messages, _, budget = plan(model, messages, None, max_tokens, overflow or settings.LLM_PROMPT_OVERFLOW)
+        max_tokens = budget.max_tokens
         
-        try:
-            response = await self.openai_client.chat.completions.create(
-                model=model,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temperature
+        async for event in self._stream_cached(
+            self._stream_source(model, messages, None, max_tokens, temperature),
+            lambda: self._chat_uncached(messages, max_tokens, temperature, model),
+            company_id=company_id,
+            use_cache=use_cache,
+            model=model,
+            messages=messages,
+            system_prompt=None,
+            temperature=temperature,
+            max_tokens=max_tokens
+        ):
+            yield event
+    
+    def _stream_source(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        system_prompt: Optional[str],
+        max_tokens: int,
+        temperature: float
+    ) -> Optional[Callable[[], AsyncIterator[Dict[str, Any]]]]:
+        """Streaming call on the provider that serves model, chosen the same way as _complete"""
+        provider = model_registry.provider_for(model)
+        if self.openai_client and (provider == "openai" or not self.anthropic_client):
+            openai_messages = ([{"role": "system", "content": system_prompt}] if system_prompt else []) + messages
+            return lambda: self._stream_openai(openai_messages, max_tokens, temperature, model)
+        if self.anthropic_client:
+            return lambda: self._stream_anthropic(
+                messages,
+                system_prompt,
+                max_tokens,
+                temperature,
+                model if provider == "anthropic" else "claude-3-haiku-20240307"
             )
-            
-            return {
-                "content": response.choices[0].message.content,
-                "model": response.model,
-                "usage": {
-                    "prompt_tokens": response.usage.prompt_tokens,
-                    "completion_tokens": response.usage.completion_tokens,
-                    "total_tokens": response.usage.total_tokens
-                }
+        return None
+    
+    async def _stream_cached(
+        self,
+        source: Optional[Callable[[], AsyncIterator[Dict[str, Any]]]],
+        fallback: Callable[[], Awaitable[Dict[str, Any]]],
+        company_id: Optional[str],
+        use_cache: bool,
+        model: str,
+        messages: List[Dict[str, str]],
+        system_prompt: Optional[str],
+        temperature: float,
+        max_tokens: int
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Replay cache hits, fall back to a single completion when streaming is unavailable,
+        and store the assembled stream in the response cache once it finishes"""
+        info = model_registry.get_model(model)
+        if source is None or (info and not info.supports_streaming):
+            result = await self._cached(fallback, company_id, use_cache, model, messages, system_prompt, temperature, max_tokens)
+            yield {"type": "delta", "content": result["content"]}
+            yield {"type": "done", "model": result["model"], "usage": result["usage"], "cached": result["cached"]}
+            return
+        
+        exact_key = scope = None
+        last_message = messages[-1].get("content", "") if messages else ""
+        if use_cache and self.cache and company_id and messages:
+            exact_key, scope = make_request_keys(model, messages, system_prompt, temperature, max_tokens)
+            hit = await self.cache.get(company_id, exact_key, scope, last_message, temperature)
+            if hit is not None:
+                yield {"type": "delta", "content": hit["content"]}
+                yield {"type": "done", "model": hit["model"], "usage": hit["usage"], "cached": True}
+                return
+        
+        parts: List[str] = []
+        async for event in source():
+            if event["type"] == "delta":
+                parts.append(event["content"])
+                yield event
+            else:
+                result = {"content": "".join(parts), "model": event["model"], "usage": event["usage"]}
+                if exact_key:
+                    await self.cache.set(company_id, exact_key, scope, last_message, temperature, result)
+                yield {**event, "cached": False}
+    
+    async def _stream_openai(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+        model: str
+    ) -> AsyncIterator[Dict[str, Any]]:
+        started = time.perf_counter()
+        try:
+            # The slot is held until the stream finishes
+            async with self._stream_slot("openai:chat"):
+                stream = await self.openai_client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    stream=True
+                )
+                
+                parts: List[str] = []
+                response_model = model
+                async for chunk in stream:
+                    response_model = chunk.model or response_model
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        yield {"type": "delta", "content": chunk.choices[0].delta.content}
+        except Exception as e:
+            model_registry.record_call(model, started, success=False)
+            app_logger.error(f"Streaming generation failed: {e}")
+            raise
+        
+        # Streamed chunks carry no usage block, so count tokens locally for accounting
+        prompt_tokens = count_message_tokens(messages, None, model)
+        completion_tokens = count_tokens("".join(parts), model)
+        model_registry.record_call(model, started, prompt_tokens, completion_tokens)
+        yield {
+            "type": "done",
+            "model": response_model,
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "estimated": True
             }
+        }
+    
+    async def _stream_anthropic(
+        self,
+        messages: List[Dict[str, str]],
+        system_prompt: Optional[str],
+        max_tokens: int,
+        temperature: float,
+        model: str
+    ) -> AsyncIterator[Dict[str, Any]]:
+        input_tokens = output_tokens = 0
+        response_model = model
+        # Anthropic rejects system-role messages; they go in the separate system prompt
+        system = system_prompt or "\n".join(m["content"] for m in messages if m.get("role") == "system")
+        started = time.perf_counter()
+        try:
+            async with self._stream_slot("anthropic:messages"):
+                stream = await self.anthropic_client.messages.create(
+                    model=model,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    system=system,
+                    messages=[m for m in messages if m.get("role") != "system"],
+                    stream=True
+                )
+                
+                async for event in stream:
+                    if event.type == "message_start":
+                        response_model = event.message.model
+                        input_tokens = event.message.usage.input_tokens
+                    elif event.type == "content_block_delta" and getattr(event.delta, "text", None):
+                        yield {"type": "delta", "content": event.delta.text}
+                    elif event.type == "message_delta":
+                        output_tokens = event.usage.output_tokens
         except Exception as e:
-            app_logger.error(f"Chat failed: {e}")
+            model_registry.record_call(model, started, success=False)
+            app_logger.error(f"Streaming generation failed: {e}")
             raise
-
+        
+        model_registry.record_call(model, started, input_tokens, output_tokens)
+        yield {
+            "type": "done",
+            "model": response_model,
+            "usage": {
+                "prompt_tokens": input_tokens,
+                "completion_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens
+            }
+        }
@@ -0,0 +1,249 @@
+"""
+Local Vector Index
+Embedded fallback for QdrantService when no Qdrant server is reachable.
+
+Each collection keeps its unit-normalised vectors in a memory-mapped float32 matrix
+and its payloads in an append-only JSONL log, both under LOCAL_VECTOR_INDEX_DIR.
+Rows are partitioned by company_id and searched with a vectorised cosine top-k.
+When hnswlib is installed, partitions above a size threshold also get an HNSW graph.
+"""
+
+from typing import Any, Dict, List, Optional
+import asyncio
+import json
+import os
+import re
+import threading
+import numpy as np
+from app.core.logging import app_logger
+
+try:
+    import hnswlib
+except ImportError:  # Optional: brute-force search is used without it
+    hnswlib = None
+
+_INITIAL_CAPACITY = 1024
+
+
+class LocalCollection:
+    """One collection: memmapped vectors + payload log + per-tenant row partitions"""
+
+    def __init__(self, path: str, vector_size: int, hnsw_threshold: int):
+        self.path = path
+        self.vector_size = vector_size
+        self.hnsw_threshold = hnsw_threshold
+        self.lock = threading.Lock()
+
+        self.ids: List[str] = []
+        self.payloads: List[Dict[str, Any]] = []
+        self.row_by_id: Dict[str, int] = {}
+        self.partitions: Dict[str, List[int]] = {}
+        self._partition_arrays: Dict[str, np.ndarray] = {}
+        self._hnsw: Dict[str, Any] = {}
+
+        os.makedirs(path, exist_ok=True)
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._log_path = os.path.join(path, "points.jsonl")
+        self._load()
+
+    @property
+    def count(self) -> int:
+        return len(self.ids)
+
+    def _open_matrix(self, capacity: int):
+        mode = "r+" if os.path.exists(self._vectors_path) else "w+"
+        if mode == "r+":
+            existing = os.path.getsize(self._vectors_path) // (4 * self.vector_size)
+            if existing < capacity:
+                with open(self._vectors_path, "r+b") as f:
+                    f.truncate(capacity * 4 * self.vector_size)
+            capacity = max(existing, capacity)
+        self.matrix = np.memmap(self._vectors_path, dtype=np.float32, mode=mode, shape=(capacity, self.vector_size))
+
+    def _load(self):
+        if os.path.exists(self._log_path):
+            with open(self._log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._apply(json.loads(line))
+        self._open_matrix(max(_INITIAL_CAPACITY, self.count))
+
+    def _apply(self, record: Dict[str, Any]) -> int:
+        """Apply one log record to the in-memory id/payload/partition tables"""
+        point_id = record["id"]
+        payload = record["payload"]
+        row = self.row_by_id.get(point_id)
+
+        if row is None:
+            row = len(self.ids)
+            self.ids.append(point_id)
+            self.payloads.append(payload)
+            self.row_by_id[point_id] = row
+            self.partitions.setdefault(payload["company_id"], []).append(row)
+        else:
+            previous_company = self.payloads[row]["company_id"]
+            if previous_company != payload["company_id"]:
+                # A point moving between tenants invalidates the old partition's graph
+                self.partitions[previous_company].remove(row)
+                self._partition_arrays.pop(previous_company, None)
+                self._hnsw.pop(previous_company, None)
+                self.partitions.setdefault(payload["company_id"], []).append(row)
+            self.payloads[row] = payload
+
+        self._partition_arrays.pop(payload["company_id"], None)
+        return row
+
+    def upsert(self, points: List[Dict[str, Any]], vectors: np.ndarray):
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        with self.lock:
+            with open(self._log_path, "a", encoding="utf-8") as log:
+                rows = []
+                for point in points:
+                    log.write(json.dumps(point, ensure_ascii=False) + "\n")
+                    rows.append(self._apply(point))
+
+            if self.count > self.matrix.shape[0]:
+                self.matrix.flush()
+                self._open_matrix(max(self.count, self.matrix.shape[0] * 2))
+
+            self.matrix[rows] = vectors
+            self.matrix.flush()
+
+            # Extend existing HNSW graphs in place instead of rebuilding them
+            for company_id, index in self._hnsw.items():
+                touched = [i for i, point in enumerate(points) if point["payload"]["company_id"] == company_id]
+                if touched:
+                    size = len(self.partitions[company_id])
+                    if size > index.get_max_elements():
+                        index.resize_index(max(size, index.get_max_elements() * 2))
+                    index.add_items(vectors[touched], [rows[i] for i in touched])
+
+    def _partition(self, company_id: str) -> np.ndarray:
+        rows = self._partition_arrays.get(company_id)
+        if rows is None:
+            rows = np.asarray(self.partitions.get(company_id, []), dtype=np.int64)
+            self._partition_arrays[company_id] = rows
+        return rows
+
+    def _hnsw_index(self, company_id: str, rows: np.ndarray):
+        index = self._hnsw.get(company_id)
+        if index is None:
+            index = hnswlib.Index(space="ip", dim=self.vector_size)
+            index.init_index(max_elements=len(rows), ef_construction=200, M=16)
+            index.add_items(np.asarray(self.matrix[rows]), rows)
+            index.set_ef(64)
+            self._hnsw[company_id] = index
+        return index
+
+    def search(self, company_id: str, query_vector: List[float], limit: int) -> List[Dict[str, Any]]:
+        with self.lock:
+            rows = self._partition(company_id)
+            if len(rows) == 0:
+                return []
+
+            query = np.asarray(query_vector, dtype=np.float32)
+            norm = np.linalg.norm(query)
+            if norm:
+                query = query / norm
+            k = min(limit, len(rows))
+
+            if hnswlib is not None and len(rows) >= self.hnsw_threshold:
+                labels, distances = self._hnsw_index(company_id, rows).knn_query(query, k=k)
+                hits = list(zip(labels[0].tolist(), (1 - distances[0]).tolist()))
+            else:
+                scores = self.matrix[rows] @ query
+                top = np.argpartition(-scores, k - 1)[:k]
+                top = top[np.argsort(-scores[top])]
+                hits = list(zip(rows[top].tolist(), scores[top].tolist()))
+
+            return [
+                {
+                    "id": self.ids[row],
+                    "score": float(score),
+                    "content": self.payloads[row].get("content"),
+                    "metadata": self.payloads[row].get("metadata", {})
+                }
+                for row, score in hits
+            ]
+
+
+class LocalVectorIndex:
+    """Directory of LocalCollections, each loaded from disk on first use"""
+
+    def __init__(self, base_dir: str, hnsw_threshold: int = 50000):
+        self.base_dir = base_dir
+        self.hnsw_threshold = hnsw_threshold
+        self.collections: Dict[str, LocalCollection] = {}
+        self._lock = threading.Lock()
+        os.makedirs(base_dir, exist_ok=True)
+        app_logger.info(
+            f"Local vector index at {base_dir} "
+            f"({len(self._on_disk())} collections, hnsw={'on' if hnswlib else 'off'})"
+        )
+
+    def _on_disk(self) -> List[str]:
+        return [
+            name for name in os.listdir(self.base_dir)
+            if os.path.exists(os.path.join(self.base_dir, name, "meta.json"))
+        ]
+
+    def _path(self, collection_name: str) -> str:
+        if not re.fullmatch(r"[A-Za-z0-9_\-]+", collection_name):
+            raise ValueError(f"Invalid collection name: {collection_name}")
+        return os.path.join(self.base_dir, collection_name)
+
+    def _get(self, collection_name: str) -> Optional[LocalCollection]:
+        collection = self.collections.get(collection_name)
+        if collection is not None:
+            return collection
+
+        with self._lock:
+            if collection_name in self.collections:
+                return self.collections[collection_name]
+            path = self._path(collection_name)
+            meta_path = os.path.join(path, "meta.json")
+            if not os.path.exists(meta_path):
+                return None
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            collection = LocalCollection(path, meta["vector_size"], self.hnsw_threshold)
+            self.collections[collection_name] = collection
+            app_logger.info(f"Loaded local collection {collection_name} ({collection.count} points)")
+            return collection
+
+    def _create(self, collection_name: str, vector_size: int):
+        if self._get(collection_name) is not None:
+            return
+        path = self._path(collection_name)
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"vector_size": vector_size, "distance": "cosine"}, f)
+        app_logger.info(f"Created local collection: {collection_name}")
+
+    def _upsert(self, collection_name: str, points: List[Dict[str, Any]], vectors: List[List[float]]):
+        collection = self._get(collection_name)
+        if collection is None:
+            raise ValueError(f"Collection {collection_name} does not exist")
+        collection.upsert(points, np.asarray(vectors, dtype=np.float32))
+
+    def _search(self, collection_name: str, company_id: str, query_vector: List[float], limit: int):
+        collection = self._get(collection_name)
+        if collection is None:
+            return []
+        return collection.search(company_id, query_vector, limit)
+
+    # Async wrappers: disk I/O and matrix math run off the event loop
+
+    async def create_collection(self, collection_name: str, vector_size: int):
+        await asyncio.to_thread(self._create, collection_name, vector_size)
+
+    async def upsert(self, collection_name: str, points: List[Dict[str, Any]], vectors: List[List[float]]):
+        await asyncio.to_thread(self._upsert, collection_name, points, vectors)
+
+    async def search(self, collection_name: str, company_id: str, query_vector: List[float], limit: int = 5):
+        return await asyncio.to_thread(self._search, collection_name, company_id, query_vector, limit)
+
+    def list_collections(self) -> List[str]:
+        return sorted(set(self._on_disk()) | set(self.collections))
@@ -8,6 +8,10 @@ from typing import Dict, List, Optional, Literal
 from pydantic import BaseModel
 from datetime import datetime
 import logging
+import time
+from app.core.config import settings
+from app.core.tenant import current_tenant
+from app.services.usage_metrics import UsageMetrics
 
 logger = logging.getLogger(__name__)
 
@@ -43,6 +47,12 @@ class ModelRegistry:
     def __init__(self):
         self.models: Dict[str, ModelInfo] = self._initialize_models()
         self.metrics: Dict[str, ModelMetrics] = {}
+        self.usage = UsageMetrics(
+            relative_accuracy=settings.METRICS_SKETCH_RELATIVE_ACCURACY,
+            slot_seconds=settings.METRICS_SLOT_SECONDS,
+            windows=settings.METRICS_WINDOWS,
+            max_series=settings.METRICS_MAX_SERIES
+        )
     
     def _initialize_models(self) -> Dict[str, ModelInfo]:
         """Initialize model registry with known models"""
@@ -181,6 +191,13 @@ class ModelRegistry:
         """Get model info by name"""
         return self.models.get(model_name)
     
+    def provider_for(self, model_name: str) -> str:
+        """Provider serving model_name; unregistered models are matched by name prefix"""
+        model = self.models.get(model_name)
+        if model:
+            return model.provider
+        return "anthropic" if model_name.startswith("claude") else "openai"
+    
     def list_models(
         self,
         category: Optional[str] = None,
@@ -197,6 +214,32 @@ class ModelRegistry:
         
         return models
     
+    def equivalent_models(
+        self,
+        model_name: str,
+        subscription_tier: Optional[str] = None,
+        max_accuracy_gap: float = 0.05
+    ) -> List[ModelInfo]:
+        """Models that can stand in for model_name: same category, similar accuracy, at least
+        as many output tokens and as large a context window (a prompt planned for the original
+        must still fit), and allowed for the subscription tier; fastest first"""
+        model = self.models.get(model_name)
+        if not model:
+            return []
+    
+        candidates = [
+            m for m in self.list_models(category=model.category)
+            if m.name != model.name
+            and abs(m.accuracy_score - model.accuracy_score) <= max_accuracy_gap
+            and m.max_tokens >= model.max_tokens
+            and m.context_window >= model.context_window
+        ]
+    
+        if subscription_tier:
+            candidates = self._filter_by_subscription(candidates, subscription_tier)
+    
+        return sorted(candidates, key=lambda m: m.avg_latency_ms)
+    
     def select_best_model(
         self,
         task_type: str,
@@ -291,15 +334,28 @@ class ModelRegistry:
             # Enterprise: all models
             return models
     
+    def cost_of(self, model_name: str, prompt_tokens: int, completion_tokens: int) -> float:
+        """Price of a call at the registry's per-1k token rates; 0 for unregistered models"""
+        model = self.models.get(model_name)
+        if not model:
+            return 0.0
+        return (
+            prompt_tokens / 1000 * model.cost_per_1k_input_tokens +
+            completion_tokens / 1000 * model.cost_per_1k_output_tokens
+        )
+    
     def update_metrics(
         self,
         model_name: str,
         tokens: int,
         cost: float,
-        latency_ms: int,
-        success: bool
+        latency_ms: float,
+        success: bool,
+        completion_tokens: Optional[int] = None,
+        tenant: Optional[str] = None
     ):
-        """Update model usage metrics"""
+        """Update model usage metrics and the per-model/provider/tenant sketches.
+        Throughput is completion tokens per second when given, otherwise all tokens."""
         if model_name not in self.metrics:
             self.metrics[model_name] = ModelMetrics(
                 model_name=model_name,
@@ -323,13 +379,40 @@ class ModelRegistry:
         )
         
         # Update error rate
-        if not success:
-            metrics.error_rate = (
-                (metrics.error_rate * (metrics.total_requests - 1) + 1) /
-                metrics.total_requests
-            )
+        metrics.error_rate = (
+            (metrics.error_rate * (metrics.total_requests - 1) + (0 if success else 1)) /
+            metrics.total_requests
+        )
         
         metrics.last_used = datetime.utcnow()
+        
+        self.usage.record(
+            model_name,
+            self.provider_for(model_name),
+            latency_ms,
+            tokens if completion_tokens is None else completion_tokens,
+            cost,
+            success,
+            tenant if tenant is not None else current_tenant.get()
+        )
+    
+    def record_call(
+        self,
+        model_name: str,
+        started: float,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        success: bool = True
+    ):
+        """update_metrics for one provider call that began at time.perf_counter() == started"""
+        self.update_metrics(
+            model_name,
+            prompt_tokens + completion_tokens,
+            self.cost_of(model_name, prompt_tokens, completion_tokens),
+            (time.perf_counter() - started) * 1000,
+            success,
+            completion_tokens=completion_tokens or None
+        )
     
     def get_metrics(self, model_name: Optional[str] = None) -> Dict[str, ModelMetrics]:
         """Get usage metrics for models"""
@@ -337,6 +420,16 @@ class ModelRegistry:
             return {model_name: self.metrics.get(model_name)}
         return self.metrics
     
+    def get_quantiles(
+        self,
+        model_name: Optional[str] = None,
+        provider: Optional[str] = None,
+        tenant: Optional[str] = None,
+        window: Optional[str] = None
+    ) -> Dict[str, Dict[str, Dict]]:
+        """p50/p95/p99 latency, tokens/second and cost per model, provider and tenant over sliding windows"""
+        return self.usage.snapshot(model_name, provider, tenant, window)
+    
     def recommend_model_for_company(
         self,
         company_settings: Dict,
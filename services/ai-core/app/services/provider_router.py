@@ -0,0 +1,289 @@
+"""
+Provider Router
+Tracks live latency and error rates per provider/model, keeps a circuit breaker per
+model, fails over to equivalent models from the ModelRegistry and, for latency-sensitive
+tiers, hedges a slow request with a duplicate to the fastest healthy equivalent
+"""
+
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+import asyncio
+import time
+import anthropic
+import httpx
+import openai
+from app.core.logging import app_logger
+from app.services.admission import AdmissionRejected
+from app.services.model_registry import ModelRegistry, model_registry
+
+# Timeouts and connection failures (the SDK timeout errors subclass APIConnectionError)
+_TRANSPORT_ERRORS = (
+    asyncio.TimeoutError,
+    httpx.TimeoutException,
+    httpx.TransportError,
+    openai.APIConnectionError,
+    anthropic.APIConnectionError
+)
+
+
+class CircuitOpenError(Exception):
+    """Every candidate model for a request has an open circuit"""
+
+
+def provider_status(error: BaseException) -> Optional[int]:
+    """HTTP status of a provider error response, None if the provider never answered"""
+    if isinstance(error, (openai.APIStatusError, anthropic.APIStatusError)):
+        return error.status_code
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code
+    return None
+
+
+def is_provider_fault(error: BaseException) -> bool:
+    """Timeouts, connection errors, 429 and 5xx count against a model. Bad requests and
+    local errors (admission, prompt budget, response parsing) do not."""
+    if isinstance(error, _TRANSPORT_ERRORS):
+        return True
+    if isinstance(error, AdmissionRejected):
+        # The concurrency limiter surfaces a provider 429 it gave up retrying this way
+        return error.__cause__ is not None and is_provider_fault(error.__cause__)
+    status = provider_status(error)
+    return status is not None and (status == 429 or status >= 500)
+
+
+class CircuitBreaker:
+    """closed -> open after consecutive failures -> half_open (one probe) after a cooldown"""
+
+    def __init__(self, failure_threshold: int = 5, open_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_inflight = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.open_seconds:
+            self.state = "half_open"
+            self._probe_inflight = False
+        if self.state == "half_open" and not self._probe_inflight:
+            self._probe_inflight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probe_inflight = False
+
+    def release(self):
+        """Give back a half-open probe slot that was never answered"""
+        self._probe_inflight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self._probe_inflight = False
+
+
+class RouteStats:
+    """Sliding window of latencies and outcomes for one model"""
+
+    def __init__(self, provider: str, window: int):
+        self.provider = provider
+        self.latencies_ms: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+
+    def record(self, latency_ms: float, success: bool):
+        self.requests += 1
+        self.outcomes.append(success)
+        if success:
+            self.latencies_ms.append(latency_ms)
+        else:
+            self.errors += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies_ms:
+            return None
+        ordered = sorted(self.latencies_ms)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+
+class ProviderRouter:
+    def __init__(
+        self,
+        providers: Set[str],
+        registry: ModelRegistry = model_registry,
+        window: int = 200,
+        min_samples: int = 20,
+        failure_threshold: int = 5,
+        open_seconds: float = 30.0,
+        hedge_tiers: Optional[Set[str]] = None,
+        hedge_min_delay_ms: float = 250.0,
+        max_failovers: int = 1
+    ):
+        self.providers = providers
+        self.registry = registry
+        self.window = window
+        self.min_samples = min_samples
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.hedge_tiers = hedge_tiers or set()
+        self.hedge_min_delay_ms = hedge_min_delay_ms
+        self.max_failovers = max_failovers
+        self.routes: Dict[str, RouteStats] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    def _route(self, model: str) -> RouteStats:
+        route = self.routes.get(model)
+        if route is None:
+            route = self.routes[model] = RouteStats(self.registry.provider_for(model), self.window)
+        return route
+
+    def _breaker(self, model: str) -> CircuitBreaker:
+        breaker = self.breakers.get(model)
+        if breaker is None:
+            breaker = self.breakers[model] = CircuitBreaker(self.failure_threshold, self.open_seconds)
+        return breaker
+
+    def expected_latency_ms(self, model: str) -> float:
+        """Observed p95 once there are enough samples, the registry estimate before that"""
+        route = self.routes.get(model)
+        if route and len(route.latencies_ms) >= self.min_samples:
+            return route.percentile(0.95)
+        info = self.registry.get_model(model)
+        return float(info.avg_latency_ms * 2 if info else 2000)
+
+    def candidates(self, model: str, subscription_tier: Optional[str] = None) -> List[str]:
+        """The requested model followed by its equivalents on configured providers, fastest live p95 first"""
+        equivalents = [
+            m.name for m in self.registry.equivalent_models(model, subscription_tier)
+            if m.provider in self.providers
+        ]
+        return [model] + sorted(equivalents, key=self.expected_latency_ms)
+
+    def _next(self, candidates: List[str], tried: Set[str]) -> Optional[str]:
+        for model in candidates:
+            if model not in tried and self._breaker(model).allow():
+                tried.add(model)
+                return model
+        return None
+
+    async def _timed(self, model: str, fn: Callable[[str], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        start = time.monotonic()
+        try:
+            result = await fn(model)
+        except asyncio.CancelledError:
+            # Losing hedge: neither a success nor a provider failure
+            self._breaker(model).release()
+            raise
+        except Exception as e:
+            if is_provider_fault(e):
+                self._route(model).record((time.monotonic() - start) * 1000, False)
+                self._breaker(model).record_failure()
+            elif provider_status(e) is not None:
+                # The provider answered; the request itself was bad
+                self._breaker(model).record_success()
+            else:
+                # Local error: says nothing about the model's health
+                self._breaker(model).release()
+            raise
+        self._route(model).record((time.monotonic() - start) * 1000, True)
+        self._breaker(model).record_success()
+        return result
+
+    async def _attempt(
+        self,
+        primary: str,
+        candidates: List[str],
+        tried: Set[str],
+        fn: Callable[[str], Awaitable[Dict[str, Any]]],
+        hedge: bool
+    ) -> Dict[str, Any]:
+        primary_task = asyncio.create_task(self._timed(primary, fn))
+        pending = {primary_task}
+        try:
+            if hedge:
+                delay = max(self.expected_latency_ms(primary), self.hedge_min_delay_ms) / 1000
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                backup = None if done else self._next(candidates, tried)
+                if backup:
+                    self.hedges += 1
+                    app_logger.info(f"Hedging {primary} with {backup} after {delay * 1000:.0f}ms")
+                    pending.add(asyncio.create_task(self._timed(backup, fn)))
+
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary_task:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(
+        self,
+        model: str,
+        fn: Callable[[str], Awaitable[Dict[str, Any]]],
+        subscription_tier: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Run fn(model_name) on the best available candidate, failing over on provider faults"""
+        candidates = self.candidates(model, subscription_tier)
+        hedge = subscription_tier in self.hedge_tiers
+        tried: Set[str] = set()
+        last_error: Optional[BaseException] = None
+
+        for attempt in range(self.max_failovers + 1):
+            primary = self._next(candidates, tried)
+            if primary is None:
+                break
+            if attempt:
+                self.failovers += 1
+                app_logger.warning(f"Failing over from {model} to {primary}: {last_error}")
+            try:
+                return await self._attempt(primary, candidates, tried, fn, hedge)
+            except Exception as e:
+                if not is_provider_fault(e):
+                    raise
+                last_error = e
+
+        if last_error:
+            raise last_error
+        raise CircuitOpenError(f"No healthy provider for {model}: circuits open for {', '.join(candidates)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "models": {
+                model: {
+                    "provider": route.provider,
+                    "requests": route.requests,
+                    "errors": route.errors,
+                    "error_rate": route.error_rate,
+                    "p50_ms": route.percentile(0.5),
+                    "p95_ms": route.percentile(0.95),
+                    "circuit": self._breaker(model).state
+                }
+                for model, route in self.routes.items()
+            }
+        }
@@ -1,78 +1,145 @@
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue
-from typing import List, Dict, Any
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue, QueryRequest
+from typing import List, Dict, Any, Optional, Set, Tuple
 from app.core.config import settings
 from app.core.logging import app_logger
+from app.services.local_vector_index import LocalVectorIndex
+from app.services.lexical_index import LexicalIndex
+import asyncio
 import uuid
 
 
 class QdrantService:
-    def __init__(self):
-        try:
-            self.client = QdrantClient(url=settings.QDRANT_URL)
-            app_logger.info(f"Connected to Qdrant at {settings.QDRANT_URL}")
-        except Exception as e:
-            app_logger.warning(f"Could not connect to Qdrant at {settings.QDRANT_URL}: {e}")
-            app_logger.warning("Qdrant service will return mock data. Start Qdrant to enable vector search.")
-            self.client = None
-    
-    def create_collection(self, collection_name: str, vector_size: int = 1536):
+    def __init__(
+        self,
+        client: Optional[AsyncQdrantClient] = None,
+        local_index: Optional[LocalVectorIndex] = None
+    ):
+        self.client = None
+        if client is not None or settings.VECTOR_BACKEND != "local":
+            try:
+                # The async client does its network I/O on the event loop, so concurrent
+                # searches and upserts from many tenants overlap instead of blocking it
+                self.client = client or AsyncQdrantClient(url=settings.QDRANT_URL, timeout=settings.QDRANT_TIMEOUT)
+            except Exception as e:
+                app_logger.warning(f"Could not connect to Qdrant at {settings.QDRANT_URL}: {e}")
+        self.local = local_index
+        self.lexical = LexicalIndex(settings.LEXICAL_INDEX_DIR) if settings.LEXICAL_INDEX_ENABLED else None
+        self._known_collections: Set[str] = set()
+
+    async def connect(self):
+        """Probe Qdrant at startup and fall back to the embedded local index when it is
+        unreachable. The choice holds for the life of the worker: if Qdrant goes down later,
+        calls fail rather than switch to a local index that holds none of Qdrant's points."""
+        if self.client and settings.VECTOR_BACKEND == "auto":
+            try:
+                await asyncio.wait_for(self.client.get_collections(), timeout=settings.QDRANT_TIMEOUT)
+                app_logger.info(f"Connected to Qdrant at {settings.QDRANT_URL}")
+            except Exception as e:
+                app_logger.warning(f"Could not connect to Qdrant at {settings.QDRANT_URL}: {e}")
+                await self.client.close()
+                self.client = None
+
+        if not self.client and self.local is None:
+            app_logger.warning("Qdrant not available, serving vector search from the local index")
+            self.local = LocalVectorIndex(
+                settings.LOCAL_VECTOR_INDEX_DIR,
+                hnsw_threshold=settings.LOCAL_VECTOR_INDEX_HNSW_THRESHOLD
+            )
+
+    @property
+    def backend(self) -> str:
+        if self.client:
+            return "qdrant"
+        return "local" if self.local else "none"
+
+    async def create_collection(self, collection_name: str, vector_size: int = 1536):
         """Create a collection for embeddings"""
         if not self.client:
+            if self.local:
+                await self.local.create_collection(collection_name, vector_size)
+                return
             app_logger.warning(f"Qdrant not available, skipping collection creation for {collection_name}")
             return
-        
+
+        if collection_name in self._known_collections:
+            return
+
         try:
-            collections = self.client.get_collections().collections
-            if collection_name in [c.name for c in collections]:
+            if await self.client.collection_exists(collection_name):
                 app_logger.info(f"Collection {collection_name} already exists")
+                self._known_collections.add(collection_name)
                 return
-            
-            self.client.create_collection(
+
+            await self.client.create_collection(
                 collection_name=collection_name,
                 vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE)
             )
+            self._known_collections.add(collection_name)
             app_logger.info(f"Created collection: {collection_name}")
         except Exception as e:
             app_logger.error(f"Failed to create collection {collection_name}: {e}")
             raise
-    
-    def upsert_embeddings(
-        self, 
+
+    async def list_collections(self) -> List[str]:
+        """List collection names"""
+        if not self.client:
+            return self.local.list_collections() if self.local else []
+
+        collections = (await self.client.get_collections()).collections
+        return [c.name for c in collections]
+
+    async def upsert_embeddings(
+        self,
         collection_name: str,
         company_id: str,
         documents: List[Dict[str, Any]],
         embeddings: List[List[float]]
     ):
         """Store embeddings with tenant isolation"""
-        if not self.client:
+        if not self.client and not self.local:
             app_logger.warning("Qdrant not available, skipping upsert")
             return {"status": "skipped", "reason": "Qdrant not available"}
-        
+
         try:
             points = [
-                PointStruct(
-                    id=str(doc.get("id", str(uuid.uuid4()))),
-                    vector=embedding,
-                    payload={
+                {
+                    "id": str(doc.get("id", str(uuid.uuid4()))),
+                    "payload": {
                         "company_id": company_id,
                         "content": doc["content"],
                         "metadata": doc.get("metadata", {})
                     }
-                )
-                for doc, embedding in zip(documents, embeddings)
+                }
+                for doc in documents
             ]
-            
-            self.client.upsert(
-                collection_name=collection_name,
-                points=points
-            )
-            app_logger.info(f"Upserted {len(points)} points to {collection_name}")
+
+            if not self.client:
+                await self.local.upsert(collection_name, points, embeddings)
+                app_logger.info(f"Upserted {len(points)} points to local collection {collection_name}")
+            else:
+                await self.client.upsert(
+                    collection_name=collection_name,
+                    points=[
+                        PointStruct(id=point["id"], vector=embedding, payload=point["payload"])
+                        for point, embedding in zip(points, embeddings)
+                    ]
+                )
+                app_logger.info(f"Upserted {len(points)} points to {collection_name}")
+
+            # Index only what the vector store accepted, so a failed upsert leaves no
+            # lexical-only documents behind
+            if self.lexical:
+                await self.lexical.add(
+                    collection_name,
+                    company_id,
+                    [{"id": point["id"], **point["payload"]} for point in points]
+                )
         except Exception as e:
             app_logger.error(f"Failed to upsert embeddings: {e}")
             raise
-    
-    def search(
+
+    async def search(
         self,
         collection_name: str,
         company_id: str,
@@ -81,13 +148,15 @@ class QdrantService:
     ) -> List[Dict[str, Any]]:
         """Search with tenant filtering"""
         if not self.client:
+            if self.local:
+                return await self.local.search(collection_name, company_id, query_vector, limit)
             app_logger.warning("Qdrant not available, returning empty results")
             return []
-        
+
         try:
-            results = self.client.search(
+            response = await self.client.query_points(
                 collection_name=collection_name,
-                query_vector=query_vector,
+                query=query_vector,
                 query_filter=Filter(
                     must=[
                         FieldCondition(
@@ -98,7 +167,7 @@ class QdrantService:
                 ),
                 limit=limit
             )
-            
+
             return [
                 {
                     "id": result.id,
@@ -106,9 +175,96 @@ class QdrantService:
                     "content": result.payload.get("content"),
                     "metadata": result.payload.get("metadata", {})
                 }
-                for result in results
+                for result in response.points
             ]
         except Exception as e:
             app_logger.error(f"Search failed: {e}")
             raise
 
+    async def search_batch(
+        self,
+        company_id: str,
+        searches: List[Tuple[str, List[float], int]]
+    ) -> List[List[Dict[str, Any]]]:
+        """Run many (collection, query_vector, limit) searches with one round trip per collection"""
+        if not self.client:
+            if self.local:
+                return await asyncio.gather(*[
+                    self.local.search(collection_name, company_id, vector, limit)
+                    for collection_name, vector, limit in searches
+                ])
+            app_logger.warning("Qdrant not available, returning empty results")
+            return [[] for _ in searches]
+
+        tenant_filter = Filter(
+            must=[
+                FieldCondition(
+                    key="company_id",
+                    match=MatchValue(value=company_id)
+                )
+            ]
+        )
+
+        by_collection: Dict[str, List[int]] = {}
+        for i, (collection_name, _, _) in enumerate(searches):
+            by_collection.setdefault(collection_name, []).append(i)
+
+        async def run(collection_name: str, indexes: List[int]):
+            return await self.client.query_batch_points(
+                collection_name=collection_name,
+                requests=[
+                    QueryRequest(
+                        query=searches[i][1],
+                        filter=tenant_filter,
+                        limit=searches[i][2],
+                        with_payload=True
+                    )
+                    for i in indexes
+                ]
+            )
+
+        try:
+            responses = await asyncio.gather(*[run(name, idx) for name, idx in by_collection.items()])
+        except Exception as e:
+            app_logger.error(f"Batch search failed: {e}")
+            raise
+
+        results: List[List[Dict[str, Any]]] = [[] for _ in searches]
+        for indexes, batch in zip(by_collection.values(), responses):
+            for i, response in zip(indexes, batch):
+                results[i] = [
+                    {
+                        "id": point.id,
+                        "score": point.score,
+                        "content": point.payload.get("content"),
+                        "metadata": point.payload.get("metadata", {})
+                    }
+                    for point in response.points
+                ]
+        return results
+
+    async def lexical_search(
+        self,
+        collection_name: str,
+        company_id: str,
+        query: str,
+        limit: int = 5,
+        exact: bool = False
+    ) -> List[Dict[str, Any]]:
+        """BM25 search (or exact identifier lookup) over the collection's inverted index"""
+        if not self.lexical:
+            return []
+        if exact:
+            return await self.lexical.exact(collection_name, company_id, query, limit)
+        return await self.lexical.search(collection_name, company_id, query, limit)
+
+    async def has_lexical_index(self, collection_name: str, company_id: str) -> bool:
+        """False when the tenant has no indexed documents, e.g. points upserted before
+        the lexical index was enabled; callers fall back to vector search then"""
+        if not self.lexical:
+            return False
+        return await self.lexical.size(collection_name, company_id) > 0
+
+    async def close(self):
+        if self.client:
+            await self.client.close()
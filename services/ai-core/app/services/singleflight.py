@@ -0,0 +1,41 @@
+"""
+Single-Flight
+Coalesces concurrent identical calls so only one reaches the provider and every
+caller receives its result
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+import asyncio
+
+
+class SingleFlight:
+    def __init__(self, timeout: float = 60.0):
+        self.timeout = timeout
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run fn once per key at a time; returns (result, shared) where shared marks followers"""
+        task = self._inflight.get(key)
+        shared = task is not None
+
+        if task is None:
+            # The timeout belongs to the shared call, so a slow provider releases every waiter together
+            task = asyncio.create_task(asyncio.wait_for(fn(), timeout=self.timeout))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None) if self._inflight.get(key) is task else None)
+            self.leaders += 1
+        else:
+            self.followers += 1
+
+        # shield: one caller being cancelled (client disconnect) must not cancel the others
+        return await asyncio.shield(task), shared
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "inflight": len(self._inflight),
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "timeout_seconds": self.timeout
+        }
@@ -0,0 +1,237 @@
+"""
+Map-Reduce Summarizer
+Summarizes long documents by splitting them on paragraph/sentence boundaries into
+token-budgeted chunks, summarizing the chunks concurrently, then reducing the partial
+summaries in rounds until one remains (or, after max_reduce_rounds, truncating what is
+left into a single prompt). Chunk summaries are cached per tenant by content
+hash, and chunk boundaries are content-defined, so an edited document only re-summarizes
+the chunks around the edit.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import math
+import re
+from app.core.cache import TTLCache
+from app.core.logging import app_logger
+from app.services.llm_service import LLMService
+from app.services.tokenizer import estimate_tokens, truncate_to_tokens
+
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?;。！？；])\s*")
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _pieces(text: str, max_tokens: int) -> List[str]:
+    """Paragraphs, with oversized paragraphs broken into sentences and then hard-wrapped"""
+    pieces: List[str] = []
+    for paragraph in _PARAGRAPH_SPLIT.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+            continue
+        for sentence in _SENTENCE_SPLIT.split(paragraph):
+            while estimate_tokens(sentence) > max_tokens:
+                # No usable boundary: cut at a character count that fits the budget
+                cut = max(1, len(sentence) * max_tokens // estimate_tokens(sentence))
+                pieces.append(sentence[:cut])
+                sentence = sentence[cut:]
+            if sentence.strip():
+                pieces.append(sentence)
+    return pieces
+
+
+def split_chunks(text: str, max_tokens: int) -> List[str]:
+    """Pack pieces into chunks of at most max_tokens. Besides the budget, a chunk also ends
+    after any piece whose hash selects it as a boundary once the chunk is half full, so an
+    edit only moves boundaries until the next content-defined cut."""
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+
+    for piece in _pieces(text, max_tokens):
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+        if current_tokens >= max_tokens // 2 and int(_hash(piece)[:4], 16) % 4 == 0:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+class MapReduceSummarizer:
+    def __init__(
+        self,
+        llm: LLMService,
+        model: str = "gpt-3.5-turbo",
+        chunk_tokens: int = 3000,
+        fan_out: int = 4,
+        chunk_summary_tokens: int = 400,
+        max_reduce_rounds: int = 4,
+        cache_max_entries: int = 20000,
+        cache_ttl_seconds: float = 86400.0
+    ):
+        self.llm = llm
+        self.model = model
+        self.chunk_tokens = chunk_tokens
+        self.fan_out = fan_out
+        self.chunk_summary_tokens = chunk_summary_tokens
+        self.max_reduce_rounds = max_reduce_rounds
+        self.cache = TTLCache(maxsize=cache_max_entries, ttl=cache_ttl_seconds)
+
+    async def _summarize_one(
+        self,
+        text: str,
+        max_length: int,
+        company_id: str,
+        subscription_tier: Optional[str]
+    ) -> Dict[str, Any]:
+        prompt = f"Please summarize the following text in no more than {max_length} characters:\n\n{text}\n\nSummary:"
+        return await self.llm.generate_text(
+            prompt=prompt,
+            max_tokens=max_length * 2,
+            temperature=0.3,
+            model=self.model,
+            company_id=company_id,
+            subscription_tier=subscription_tier
+        )
+
+    async def _summarize_chunk(
+        self,
+        chunk: str,
+        semaphore: asyncio.Semaphore,
+        company_id: str,
+        subscription_tier: Optional[str],
+        counters: Dict[str, int]
+    ) -> str:
+        key = (company_id, _hash(f"{self.chunk_summary_tokens}\x00{chunk}"))
+        summary = self.cache.get(key)
+        if summary is not None:
+            counters["cached"] += 1
+            return summary
+
+        prompt = (
+            "Summarize this section of a longer document. Keep names, figures, dates, "
+            f"obligations and conclusions.\n\n{chunk}\n\nSection summary:"
+        )
+        async with semaphore:
+            result = await self.llm.generate_text(
+                prompt=prompt,
+                max_tokens=self.chunk_summary_tokens,
+                temperature=0.3,
+                model=self.model,
+                company_id=company_id,
+                subscription_tier=subscription_tier
+            )
+        counters["generated"] += 1
+        self.cache.set(key, result["content"])
+        return result["content"]
+
+    def _is_single(self, text: str, mode: str) -> bool:
+        return mode == "single" or (mode == "auto" and estimate_tokens(text) <= self.chunk_tokens)
+
+    def plan(self, text: str, max_length: int, mode: str = "auto") -> Tuple[int, int]:
+        """(LLM calls, tokens) a summary of text is expected to cost, for admission"""
+        text_tokens = estimate_tokens(text)
+        if self._is_single(text, mode):
+            return 1, text_tokens + max_length * 2
+        partials = max(1, math.ceil(text_tokens / self.chunk_tokens))
+        calls, tokens = partials, text_tokens + partials * self.chunk_summary_tokens
+        for _ in range(self.max_reduce_rounds):
+            groups = math.ceil(partials * self.chunk_summary_tokens / self.chunk_tokens)
+            if groups <= 1 or groups >= partials:
+                break
+            calls += groups
+            tokens += (partials + groups) * self.chunk_summary_tokens
+            partials = groups
+        # Plus the final summary over what is left
+        return calls + 1, tokens + min(partials * self.chunk_summary_tokens, self.chunk_tokens) + max_length * 2
+
+    def _groups(self, summaries: List[str]) -> List[str]:
+        """Pack partial summaries into reduce inputs that fit one chunk budget"""
+        groups: List[str] = []
+        current: List[str] = []
+        current_tokens = 0
+        for summary in summaries:
+            tokens = estimate_tokens(summary)
+            if current and current_tokens + tokens > self.chunk_tokens:
+                groups.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            current.append(summary)
+            current_tokens += tokens
+        if current:
+            groups.append("\n\n".join(current))
+        return groups
+
+    async def summarize(
+        self,
+        text: str,
+        max_length: int,
+        company_id: str,
+        subscription_tier: Optional[str] = None,
+        mode: str = "auto"
+    ) -> Dict[str, Any]:
+        """mode=single sends one prompt; map_reduce always chunks; auto chunks only long texts"""
+        if self._is_single(text, mode):
+            result = await self._summarize_one(text, max_length, company_id, subscription_tier)
+            return {"summary": result["content"], "cached": result["cached"]}
+
+        semaphore = asyncio.Semaphore(self.fan_out)
+        counters = {"cached": 0, "generated": 0}
+        chunks = split_chunks(text, self.chunk_tokens) or [text]
+
+        # Map: every chunk in parallel, bounded by the semaphore
+        summaries = await asyncio.gather(*[
+            self._summarize_chunk(chunk, semaphore, company_id, subscription_tier, counters)
+            for chunk in chunks
+        ])
+
+        # Reduce: merge groups of partial summaries until one prompt holds them all
+        rounds = 0
+        reduce_counters = {"cached": 0, "generated": 0}
+        groups = self._groups(summaries)
+        while len(groups) > 1 and rounds < self.max_reduce_rounds:
+            rounds += 1
+            summaries = await asyncio.gather(*[
+                self._summarize_chunk(group, semaphore, company_id, subscription_tier, reduce_counters)
+                for group in groups
+            ])
+            reduced = self._groups(summaries)
+            if len(reduced) >= len(groups):
+                # Summaries are not shrinking; more rounds would only add paid calls
+                groups = reduced
+                break
+            groups = reduced
+
+        final = groups[0]
+        if len(groups) > 1:
+            app_logger.warning(f"Map-reduce summary stopped after {rounds} reduce rounds with {len(groups)} partials; truncating")
+            final = truncate_to_tokens("\n\n".join(groups), self.chunk_tokens)
+
+        result = await self._summarize_one(final, max_length, company_id, subscription_tier)
+        app_logger.info(
+            f"Map-reduce summary of {len(chunks)} chunks ({counters['cached']} cached, "
+            f"{rounds} reduce rounds) for company {company_id}"
+        )
+        return {
+            "summary": result["content"],
+            "cached": result["cached"],
+            "chunks": len(chunks),
+            "chunks_cached": counters["cached"],
+            "reduce_rounds": rounds
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return self.cache.stats()
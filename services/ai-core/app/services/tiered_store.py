@@ -0,0 +1,163 @@
+"""
+Tiered Store
+Two-tier key/value store shared by the embedding cache and the translation memory: a
+size-bounded in-process LRU in front of an optional SQLite table. Keys are tuples of
+strings mapped one-to-one onto the table's primary key columns.
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import os
+import sqlite3
+import threading
+from app.core.logging import app_logger
+
+Key = Tuple[str, ...]
+
+
+class TieredStore:
+    def __init__(
+        self,
+        name: str,
+        table: str,
+        key_columns: Sequence[str],
+        value_column: str,
+        value_type: str = "TEXT",
+        max_size: int = 50000,
+        sizeof: Callable[[Any], int] = lambda value: 1,
+        encode: Callable[[Any], Any] = lambda value: value,
+        decode: Callable[[Any], Any] = lambda stored: stored,
+        db_path: Optional[str] = None
+    ):
+        """max_size bounds the summed sizeof() of the memory tier (entries by default)"""
+        self.name = name
+        self.max_size = max_size
+        self._sizeof = sizeof
+        self._encode = encode
+        self._decode = decode
+        self._memory: "OrderedDict[Key, Any]" = OrderedDict()
+        self.memory_size = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        columns = ", ".join(key_columns)
+        self._select = (
+            f"SELECT {value_column} FROM {table} WHERE "
+            + " AND ".join(f"{column} = ?" for column in key_columns)
+        )
+        self._insert = (
+            f"INSERT OR REPLACE INTO {table} ({columns}, {value_column}) "
+            f"VALUES ({', '.join('?' for _ in range(len(key_columns) + 1))})"
+        )
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            try:
+                os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+                self._db.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    + "".join(f"{column} TEXT NOT NULL, " for column in key_columns)
+                    + f"{value_column} {value_type} NOT NULL, PRIMARY KEY ({columns}))"
+                )
+                self._db.commit()
+                app_logger.info(f"{name} persisted at {db_path}")
+            except sqlite3.Error as e:
+                app_logger.warning(f"{name} disk tier disabled ({db_path}): {e}")
+                self._db = None
+
+    # ---- memory tier ----
+
+    def _memory_get(self, key: Key) -> Optional[Any]:
+        value = self._memory.get(key)
+        if value is not None:
+            self._memory.move_to_end(key)
+        return value
+
+    def _memory_put(self, key: Key, value: Any):
+        size = self._sizeof(value)
+        if size > self.max_size:
+            return
+
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self.memory_size -= self._sizeof(previous)
+
+        self._memory[key] = value
+        self.memory_size += size
+        while self.memory_size > self.max_size:
+            _, evicted = self._memory.popitem(last=False)
+            self.memory_size -= self._sizeof(evicted)
+
+    # ---- disk tier (blocking, called from a worker thread) ----
+
+    def _disk_get_many(self, keys: List[Key]) -> Dict[Key, Any]:
+        found: Dict[Key, Any] = {}
+        with self._db_lock:
+            for key in keys:
+                row = self._db.execute(self._select, key).fetchone()
+                if row:
+                    found[key] = self._decode(row[0])
+        return found
+
+    def _disk_put_many(self, items: List[Tuple[Key, Any]]):
+        with self._db_lock:
+            self._db.executemany(self._insert, [(*key, self._encode(value)) for key, value in items])
+            self._db.commit()
+
+    # ---- public API ----
+
+    async def get_many(self, keys: List[Key]) -> List[Optional[Any]]:
+        """Return stored values in input order, None for misses"""
+        values: List[Optional[Any]] = [self._memory_get(key) for key in keys]
+        self.memory_hits += sum(1 for v in values if v is not None)
+
+        missing = [i for i, v in enumerate(values) if v is None]
+        if missing and self._db is not None:
+            try:
+                found = await asyncio.to_thread(self._disk_get_many, list({keys[i] for i in missing}))
+            except sqlite3.Error as e:
+                app_logger.warning(f"{self.name} disk lookup failed: {e}")
+                found = {}
+            for i in missing:
+                value = found.get(keys[i])
+                if value is not None:
+                    values[i] = value
+                    self._memory_put(keys[i], value)
+                    self.disk_hits += 1
+
+        self.misses += sum(1 for v in values if v is None)
+        return values
+
+    async def set_many(self, items: List[Tuple[Key, Any]]):
+        for key, value in items:
+            self._memory_put(key, value)
+
+        if self._db is not None and items:
+            try:
+                await asyncio.to_thread(self._disk_put_many, items)
+            except sqlite3.Error as e:
+                app_logger.warning(f"{self.name} disk write failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "persistent": self._db is not None
+        }
+
+    def close(self):
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
@@ -0,0 +1,114 @@
+"""
+Token Budget
+Pre-flight accounting for LLM requests: counts prompt tokens against the model's
+context_window and max_tokens from the ModelRegistry, clamps the completion budget,
+compacts or truncates oversized prompts (or rejects them), and estimates cost
+before anything is sent upstream
+"""
+
+from typing import Dict, List, Optional, Tuple
+import re
+from pydantic import BaseModel
+from app.services.model_registry import model_registry
+from app.services.tokenizer import count_message_tokens, truncate_to_tokens
+
+# Used for models that are not in the registry
+_DEFAULT_CONTEXT_WINDOW = 8192
+_DEFAULT_MAX_OUTPUT_TOKENS = 4096
+
+# A completion budget smaller than this is not worth sending; compact/truncate instead
+_MIN_COMPLETION_TOKENS = 256
+
+_BLANK_LINES = re.compile(r"\n\s*\n\s*\n+")
+_SPACES = re.compile(r"[ \t]{2,}")
+
+
+class PromptTooLarge(ValueError):
+    """The prompt cannot fit the model's context window with room for a completion"""
+
+    def __init__(self, model: str, prompt_tokens: int, limit: int):
+        super().__init__(f"Prompt is {prompt_tokens} tokens; {model} accepts at most {limit} with room for a reply")
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.limit = limit
+
+
+class TokenBudget(BaseModel):
+    model: str
+    prompt_tokens: int
+    max_tokens: int
+    context_window: int
+    compacted: bool = False
+    truncated: bool = False
+    estimated_cost: float  # Upper bound: prompt plus the full completion budget
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    return model_registry.cost_of(model, prompt_tokens, completion_tokens)
+
+
+def _compact(text: str) -> str:
+    return _SPACES.sub(" ", _BLANK_LINES.sub("\n\n", text)).strip()
+
+
+def plan(
+    model: str,
+    messages: List[Dict[str, str]],
+    system_prompt: Optional[str],
+    max_tokens: int,
+    overflow: str = "reject"
+) -> Tuple[List[Dict[str, str]], Optional[str], TokenBudget]:
+    """Fit a request into the model's limits. overflow="reject" raises PromptTooLarge;
+    "truncate" compacts whitespace, drops the oldest turns, then cuts the middle of the
+    longest remaining message."""
+    info = model_registry.get_model(model)
+    context_window = info.context_window if info else _DEFAULT_CONTEXT_WINDOW
+    max_tokens = min(max_tokens, info.max_tokens if info else _DEFAULT_MAX_OUTPUT_TOKENS)
+    min_completion = min(max_tokens, _MIN_COMPLETION_TOKENS)
+    limit = context_window - min_completion
+
+    prompt_tokens = count_message_tokens(messages, system_prompt, model)
+    compacted = truncated = False
+
+    if prompt_tokens > limit:
+        if overflow != "truncate":
+            raise PromptTooLarge(model, prompt_tokens, limit)
+
+        messages = [{**m, "content": _compact(m.get("content") or "")} for m in messages]
+        system_prompt = _compact(system_prompt) if system_prompt else system_prompt
+        prompt_tokens = count_message_tokens(messages, system_prompt, model)
+        compacted = True
+
+        # Oldest turns go first; system messages and the latest message always stay
+        while prompt_tokens > limit and len(messages) > 1:
+            droppable = [i for i, m in enumerate(messages[:-1]) if m.get("role") != "system"]
+            if not droppable:
+                break
+            messages = messages[:droppable[0]] + messages[droppable[0] + 1:]
+            prompt_tokens = count_message_tokens(messages, system_prompt, model)
+            truncated = True
+
+        if prompt_tokens > limit:
+            longest = max(range(len(messages)), key=lambda i: len(messages[i].get("content") or ""))
+            content = messages[longest].get("content") or ""
+            keep = max(0, count_message_tokens([messages[longest]], None, model) - (prompt_tokens - limit) - 8)
+            messages = list(messages)
+            messages[longest] = {**messages[longest], "content": truncate_to_tokens(content, keep, model)}
+            prompt_tokens = count_message_tokens(messages, system_prompt, model)
+            truncated = True
+
+        if prompt_tokens > limit:
+            raise PromptTooLarge(model, prompt_tokens, limit)
+
+    # Shrink the completion budget rather than let the provider reject the request
+    max_tokens = min(max_tokens, context_window - prompt_tokens)
+
+    return messages, system_prompt, TokenBudget(
+        model=model,
+        prompt_tokens=prompt_tokens,
+        max_tokens=max_tokens,
+        context_window=context_window,
+        compacted=compacted,
+        truncated=truncated,
+        estimated_cost=estimate_cost(model, prompt_tokens, max_tokens)
+    )
@@ -0,0 +1,104 @@
+"""
+Token estimation helpers shared by batching and budgeting code
+
+estimate_tokens is a cheap heuristic for hot paths such as batch packing; count_tokens
+uses the model's BPE tables (tiktoken, loaded once per encoding and warmed at startup)
+when available and falls back to the heuristic otherwise.
+"""
+
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+import re
+from app.core.logging import app_logger
+
+try:
+    import tiktoken
+except ImportError:  # Optional: counts fall back to the heuristic estimate
+    tiktoken = None
+
+# CJK ideographs, kana and hangul are roughly one token per character for BPE tokenizers
+_CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+
+# Chat format overhead per message and for the assistant reply primer (OpenAI cookbook values)
+_TOKENS_PER_MESSAGE = 3
+_REPLY_PRIMER_TOKENS = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap upper-leaning token estimate: one per CJK character, ~4 characters per token otherwise"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def encoding_name(model: Optional[str]) -> str:
+    """BPE table for model; Anthropic does not publish one, cl100k_base is a close stand-in"""
+    if model and model.startswith(("gpt-4o", "o1", "o3")):
+        return "o200k_base"
+    return "cl100k_base"
+
+
+@lru_cache(maxsize=None)
+def _encoding(name: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        # e.g. the BPE file cannot be downloaded in an offline deployment
+        app_logger.warning(f"Tokenizer {name} unavailable, using heuristic token counts: {e}")
+        return None
+
+
+def warm_encodings(models: Iterable[str]):
+    """Load the BPE tables for models up front. tiktoken may download them on first use,
+    which must not happen inside a request; blocking, so run it in a worker thread."""
+    for name in sorted({encoding_name(model) for model in models}):
+        _encoding(name)
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Token count from the model's BPE tables, or the heuristic estimate without tiktoken"""
+    if not text:
+        return 0
+    encoding = _encoding(encoding_name(model))
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(
+    messages: List[Dict[str, str]],
+    system_prompt: Optional[str] = None,
+    model: Optional[str] = None
+) -> int:
+    """Prompt tokens for a chat request, including per-message framing"""
+    total = _REPLY_PRIMER_TOKENS
+    if system_prompt:
+        total += _TOKENS_PER_MESSAGE + count_tokens(system_prompt, model)
+    for message in messages:
+        total += _TOKENS_PER_MESSAGE + count_tokens(message.get("content") or "", model)
+    return total
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """Keep the head and tail of text within max_tokens, marking the cut in the middle"""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    marker = "\n[...]\n"
+    budget = max(0, max_tokens - count_tokens(marker, model))
+    head_budget = budget * 2 // 3
+    tail_budget = budget - head_budget
+
+    encoding = _encoding(encoding_name(model))
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        tail = encoding.decode(tokens[-tail_budget:]) if tail_budget else ""
+        return encoding.decode(tokens[:head_budget]) + marker + tail
+
+    # Heuristic path: scale by characters per estimated token
+    ratio = len(text) / max(1, estimate_tokens(text))
+    head_chars = int(head_budget * ratio)
+    tail_chars = int(tail_budget * ratio)
+    return text[:head_chars] + marker + (text[-tail_chars:] if tail_chars else "")
@@ -0,0 +1,43 @@
+"""
+Translation Memory
+Segment-level store of finished translations keyed by (company, sha256(source segment),
+target language): a bounded in-process LRU in front of a persistent SQLite table. Entries
+are scoped per tenant so one company's glossary and hit counts never leak to another.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+from app.services.tiered_store import TieredStore
+
+
+def segment_key(company_id: str, segment: str, target_language: str) -> Tuple[str, str, str]:
+    return company_id, hashlib.sha256(segment.encode("utf-8")).hexdigest(), target_language
+
+
+class TranslationMemory:
+    def __init__(self, max_entries: int = 50000, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self._store = TieredStore(
+            "Translation memory",
+            table="tenant_segments",
+            key_columns=("company_id", "hash", "target_language"),
+            value_column="translation",
+            max_size=max_entries,
+            db_path=db_path
+        )
+
+    async def get_many(self, company_id: str, segments: List[str], target_language: str) -> List[Optional[str]]:
+        """Return the company's stored translations in input order, None for misses"""
+        return await self._store.get_many([segment_key(company_id, segment, target_language) for segment in segments])
+
+    async def set_many(self, company_id: str, segments: List[str], target_language: str, translations: List[str]):
+        await self._store.set_many([
+            (segment_key(company_id, segment, target_language), translation)
+            for segment, translation in zip(segments, translations)
+        ])
+
+    def stats(self) -> Dict[str, Any]:
+        return self._store.stats()
+
+    def close(self):
+        self._store.close()
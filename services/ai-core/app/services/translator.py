@@ -0,0 +1,188 @@
+"""
+Batch Translator
+Splits texts into line/sentence segments, serves repeated segments from the company's
+translation memory, and sends only the misses upstream, packed many per request as a JSON array
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import json
+import re
+from app.core.logging import app_logger
+from app.services.llm_service import LLMService
+from app.services.translation_memory import TranslationMemory
+from app.services.tokenizer import estimate_tokens
+
+LANGUAGE_NAMES = {
+    'zh-TW': '繁體中文',
+    'zh-CN': '簡體中文',
+    'en': 'English',
+    'ja': '日本語',
+    'ko': '한국어'
+}
+
+# Output tokens per source token; CJK targets spend more tokens on the same content
+_EXPANSION = {'zh-TW': 2.0, 'zh-CN': 2.0, 'ja': 2.0, 'ko': 2.0}
+_DEFAULT_EXPANSION = 1.5
+
+# A segment ends after a newline or a sentence terminator and the whitespace that follows it
+_SEGMENT_PATTERN = re.compile(r".*?(?:[.!?]+(?:\s+|$)|[。！？]+\s*|\n+|$)", re.S)
+
+
+def translation_max_tokens(source_tokens: int, target_language: str, segments: int = 1, cap: int = 4096) -> int:
+    """Output budget from the source token count instead of the character count"""
+    expansion = _EXPANSION.get(target_language, _DEFAULT_EXPANSION)
+    # Per-segment allowance covers JSON quoting and separators in packed requests
+    return min(cap, int(source_tokens * expansion) + 8 * segments + 32)
+
+
+def split_segments(text: str) -> List[Tuple[str, str, str]]:
+    """(leading whitespace, segment, trailing whitespace) triples that join back to text"""
+    parts: List[Tuple[str, str, str]] = []
+    for match in _SEGMENT_PATTERN.finditer(text):
+        piece = match.group()
+        if not piece:
+            continue
+        stripped = piece.strip()
+        if not stripped:
+            parts.append((piece, "", ""))
+            continue
+        start = piece.index(stripped)
+        parts.append((piece[:start], stripped, piece[start + len(stripped):]))
+    return parts
+
+
+class BatchTranslator:
+    def __init__(
+        self,
+        llm: LLMService,
+        memory: TranslationMemory,
+        model: str = "gpt-3.5-turbo",
+        max_batch_tokens: int = 1500,
+        max_batch_segments: int = 50,
+        concurrency: int = 4
+    ):
+        self.llm = llm
+        self.memory = memory
+        self.model = model
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_segments = max_batch_segments
+        self.concurrency = concurrency
+
+    def _pack(self, segments: List[str]) -> List[List[str]]:
+        batches: List[List[str]] = []
+        current: List[str] = []
+        current_tokens = 0
+        for segment in segments:
+            tokens = estimate_tokens(segment)
+            if current and (current_tokens + tokens > self.max_batch_tokens or len(current) >= self.max_batch_segments):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(segment)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _translate_one(self, segment: str, target_language: str, company_id: str, subscription_tier: Optional[str]) -> str:
+        target = LANGUAGE_NAMES.get(target_language, target_language)
+        result = await self.llm.generate_text(
+            prompt=f"Translate the following text to {target}. Reply with the translation only.\n\n{segment}",
+            max_tokens=translation_max_tokens(estimate_tokens(segment), target_language),
+            temperature=0.3,
+            model=self.model,
+            company_id=company_id,
+            use_cache=False,
+            subscription_tier=subscription_tier
+        )
+        return result["content"].strip()
+
+    async def _translate_batch(
+        self,
+        batch: List[str],
+        target_language: str,
+        company_id: str,
+        subscription_tier: Optional[str]
+    ) -> List[str]:
+        if len(batch) == 1:
+            return [await self._translate_one(batch[0], target_language, company_id, subscription_tier)]
+
+        target = LANGUAGE_NAMES.get(target_language, target_language)
+        prompt = (
+            f"Translate each string in this JSON array to {target}. Reply with only a JSON array "
+            f"of {len(batch)} strings holding the translations in the same order.\n\n"
+            + json.dumps(batch, ensure_ascii=False)
+        )
+        result = await self.llm.generate_text(
+            prompt=prompt,
+            max_tokens=translation_max_tokens(sum(estimate_tokens(s) for s in batch), target_language, len(batch)),
+            temperature=0.3,
+            model=self.model,
+            company_id=company_id,
+            use_cache=False,
+            subscription_tier=subscription_tier
+        )
+
+        content = result["content"].strip()
+        try:
+            translations = json.loads(content[content.index("["):content.rindex("]") + 1])
+            if len(translations) == len(batch) and all(isinstance(t, str) for t in translations):
+                return translations
+        except ValueError:
+            pass
+
+        # The model broke the array format: fall back to one request per segment
+        app_logger.warning(f"Packed translation of {len(batch)} segments returned malformed JSON, retrying singly")
+        return list(await asyncio.gather(*[
+            self._translate_one(segment, target_language, company_id, subscription_tier) for segment in batch
+        ]))
+
+    def plan(self, texts: List[str]) -> Tuple[int, int]:
+        """(LLM requests, tokens) translating texts costs at most, for admission; source plus
+        up to 2x expanded output, before translation memory hits are known"""
+        unique = list(dict.fromkeys(segment for text in texts for _, segment, _ in split_segments(text) if segment))
+        return len(self._pack(unique)), 3 * sum(estimate_tokens(segment) for segment in unique)
+
+    async def translate(
+        self,
+        texts: List[str],
+        target_language: str,
+        company_id: str,
+        subscription_tier: Optional[str] = None
+    ) -> Dict[str, Any]:
+        split = [split_segments(text) for text in texts]
+        unique = list(dict.fromkeys(segment for parts in split for _, segment, _ in parts if segment))
+
+        stored = await self.memory.get_many(company_id, unique, target_language)
+        translated: Dict[str, str] = {s: t for s, t in zip(unique, stored) if t is not None}
+        missing = [s for s, t in zip(unique, stored) if t is None]
+
+        batches = self._pack(missing)
+        if batches:
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def run(batch: List[str]) -> List[str]:
+                async with semaphore:
+                    return await self._translate_batch(batch, target_language, company_id, subscription_tier)
+
+            results = await asyncio.gather(*[run(batch) for batch in batches])
+            # Mock responses (no provider configured) must not be remembered
+            remember = bool(self.llm.openai_client or self.llm.anthropic_client)
+            for batch, translations in zip(batches, results):
+                translated.update(zip(batch, translations))
+                if remember:
+                    await self.memory.set_many(company_id, batch, target_language, translations)
+
+        app_logger.info(
+            f"Translated {len(unique)} unique segments to {target_language} for company {company_id} "
+            f"({len(unique) - len(missing)} from memory, {len(batches)} requests)"
+        )
+        return {
+            "translations": [
+                "".join(lead + (translated[segment] if segment else "") + trail for lead, segment, trail in parts)
+                for parts in split
+            ],
+            "segments": len(unique),
+            "from_memory": len(unique) - len(missing),
+            "requests": len(batches)
+        }
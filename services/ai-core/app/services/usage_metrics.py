@@ -0,0 +1,199 @@
+"""
+Usage Metrics
+Streaming quantile sketches for provider calls, kept per model, per provider and per
+tenant. A sketch counts samples in logarithmically spaced buckets (DDSketch/HDR style):
+the bucket width bounds the relative error of every quantile, adding a sample is one log
+and one dict increment, and two sketches merge by adding their counts. Samples land in
+fixed time slots, and a sliding window is the merge of the slots it covers, so p50/p95/p99
+over the last minute, five minutes or hour come from the same data.
+"""
+
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+import math
+import time
+
+QUANTILES = (0.50, 0.95, 0.99)
+FIELDS = ("latency_ms", "tokens_per_second", "cost")
+DIMENSIONS = ("model", "provider", "tenant")
+
+
+class QuantileSketch:
+    """Relative-error quantile sketch with exact count, sum, min and max"""
+
+    __slots__ = ("relative_accuracy", "_gamma", "_log_gamma", "buckets", "zeros", "count", "total", "min", "max")
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        # Bucket i counts values in (gamma^(i-1), gamma^i]
+        self.buckets: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float):
+        if value > 0:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            self.buckets[key] = self.buckets.get(key, 0) + 1
+        else:
+            self.zeros += 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "QuantileSketch"):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantiles(self, qs: Iterable[float]) -> List[Optional[float]]:
+        """Values at the given quantiles (ascending), each within relative_accuracy of the true one"""
+        if not self.count:
+            return [None for _ in qs]
+        keys = sorted(self.buckets)
+        values: List[Optional[float]] = []
+        position, seen = 0, self.zeros
+        for q in qs:
+            rank = q * (self.count - 1)
+            if rank < self.zeros:
+                values.append(max(self.min, 0.0))
+                continue
+            while position < len(keys) and seen <= rank:
+                seen += self.buckets[keys[position]]
+                position += 1
+            # Midpoint of the bucket in relative terms, clamped to what was actually seen
+            estimate = 2 * self._gamma ** keys[position - 1] / (self._gamma + 1)
+            values.append(min(max(estimate, self.min), self.max))
+        return values
+
+    def summary(self) -> Dict[str, Any]:
+        p50, p95, p99 = self.quantiles(QUANTILES)
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "p50": p50,
+            "p95": p95,
+            "p99": p99
+        }
+
+
+class _Slot:
+    __slots__ = ("start", "requests", "errors", "sketches")
+
+    def __init__(self, start: float, relative_accuracy: float):
+        self.start = start
+        self.requests = 0
+        self.errors = 0
+        self.sketches = {field: QuantileSketch(relative_accuracy) for field in FIELDS}
+
+
+class UsageMetrics:
+    def __init__(
+        self,
+        relative_accuracy: float = 0.01,
+        slot_seconds: float = 10.0,
+        windows: Optional[Dict[str, float]] = None,
+        max_series: int = 10000
+    ):
+        self.relative_accuracy = relative_accuracy
+        self.slot_seconds = slot_seconds
+        self.windows = windows or {"1m": 60, "5m": 300, "1h": 3600}
+        self.horizon = max(self.windows.values())
+        self.max_series = max_series
+        self._series: "OrderedDict[Tuple[str, str], Deque[_Slot]]" = OrderedDict()
+
+    def _slot(self, key: Tuple[str, str], start: float) -> _Slot:
+        slots = self._series.get(key)
+        if slots is None:
+            slots = self._series[key] = deque()
+            while len(self._series) > self.max_series:
+                self._series.popitem(last=False)
+        self._series.move_to_end(key)
+
+        if not slots or slots[-1].start != start:
+            slots.append(_Slot(start, self.relative_accuracy))
+            while slots[0].start <= start - self.horizon:
+                slots.popleft()
+        return slots[-1]
+
+    def record(
+        self,
+        model: str,
+        provider: str,
+        latency_ms: float,
+        tokens: int = 0,
+        cost: float = 0.0,
+        success: bool = True,
+        tenant: Optional[str] = None
+    ):
+        """Add one provider call to the model, provider and (when known) tenant series.
+        Failed calls count towards the error rate but not the distributions."""
+        now = time.monotonic()
+        start = now - now % self.slot_seconds
+        tokens_per_second = tokens / latency_ms * 1000 if tokens and latency_ms > 0 else None
+
+        for key in (("model", model), ("provider", provider), ("tenant", tenant)):
+            if not key[1]:
+                continue
+            slot = self._slot(key, start)
+            slot.requests += 1
+            if not success:
+                slot.errors += 1
+                continue
+            slot.sketches["latency_ms"].add(latency_ms)
+            slot.sketches["cost"].add(cost)
+            if tokens_per_second is not None:
+                slot.sketches["tokens_per_second"].add(tokens_per_second)
+
+    def _window(self, slots: Deque[_Slot], seconds: float, now: float) -> Dict[str, Any]:
+        """Merge the slots overlapping the last `seconds` (to slot granularity)"""
+        requests = errors = 0
+        merged = {field: QuantileSketch(self.relative_accuracy) for field in FIELDS}
+        for slot in reversed(slots):
+            if slot.start <= now - seconds - self.slot_seconds:
+                break
+            requests += slot.requests
+            errors += slot.errors
+            for field in FIELDS:
+                merged[field].merge(slot.sketches[field])
+        return {
+            "requests": requests,
+            "errors": errors,
+            "error_rate": errors / requests if requests else 0.0,
+            **{field: sketch.summary() for field, sketch in merged.items()}
+        }
+
+    def snapshot(
+        self,
+        model: Optional[str] = None,
+        provider: Optional[str] = None,
+        tenant: Optional[str] = None,
+        window: Optional[str] = None
+    ) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """{dimension: {name: {window: stats}}}, optionally narrowed to one name per dimension"""
+        now = time.monotonic()
+        names = {"model": model, "provider": provider, "tenant": tenant}
+        windows = {window: self.windows[window]} if window else self.windows
+        result: Dict[str, Dict[str, Dict[str, Any]]] = {dimension: {} for dimension in DIMENSIONS}
+        for (dimension, name), slots in self._series.items():
+            if names[dimension] is not None and names[dimension] != name:
+                continue
+            result[dimension][name] = {
+                label: self._window(slots, seconds, now) for label, seconds in windows.items()
+            }
+        return result
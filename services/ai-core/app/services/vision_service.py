@@ -1,23 +1,164 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
+from collections import deque
+import asyncio
 import base64
+import binascii
+import json
+import time
 from datetime import datetime
 from openai import AsyncOpenAI
 from app.core.config import settings
 from app.core.logging import app_logger
+from app.services.concurrency import ConcurrencyLimiters
+from app.services.frame_cache import FrameDedupeCache
+from app.services.defect_prescreen import DefectPrescreener
+from app.services.model_registry import model_registry
+from app.services.image_preprocessor import Frame, ImagePreprocessor, InvalidImageError, read_frame
+
+# Inspection stages timed for /vision/stats
+STAGES = ("preprocess", "prescreen", "remote")
+
+
+def decode_base64_image(image_base64: str) -> bytes:
+    """Frame bytes from a JSON image_base64 field"""
+    try:
+        return base64.b64decode(image_base64, validate=True)
+    except binascii.Error as e:
+        raise InvalidImageError(f"Invalid base64 image: {e}") from e
+
+
+def image_part(image: bytes) -> Dict[str, Any]:
+    """Provider payload for one frame; the only place a frame is base64-encoded"""
+    return {
+        "type": "image_url",
+        "image_url": {"url": "data:image/jpeg;base64," + base64.b64encode(image).decode("ascii")}
+    }
 
 
 class VisionService:
-    def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY) if settings.OPENAI_API_KEY else None
+    def __init__(
+        self,
+        client: Optional[AsyncOpenAI] = None,
+        concurrency: Optional[ConcurrencyLimiters] = None,
+        preprocessor: Optional[ImagePreprocessor] = None,
+        batch_images_per_call: int = 4,
+        batch_concurrency: int = 4,
+        frame_cache: Optional[FrameDedupeCache] = None,
+        prescreener: Optional[DefectPrescreener] = None,
+        latency_window: int = 1000
+    ):
+        # Prefer the shared client from the service container; fall back to a private one
+        if client is None and settings.OPENAI_API_KEY:
+            client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+        self.client = client
+        self.concurrency = concurrency
+        self.preprocessor = preprocessor
+        self.batch_images_per_call = batch_images_per_call
+        self.batch_concurrency = batch_concurrency
+        self.frame_cache = frame_cache
+        self.prescreener = prescreener
+        self.stage_latency = {stage: deque(maxlen=latency_window) for stage in STAGES}
+    
+    def _record(self, stage: str, started: float):
+        self.stage_latency[stage].append((time.perf_counter() - started) * 1000)
+    
+    async def _prepare(self, image_data: Frame, camera_id: Optional[str] = None) -> Tuple[bytes, Optional[Dict[str, Any]]]:
+        """Downscale/crop/re-encode the frame off the event loop; returns JPEG bytes and a size report"""
+        if not self.preprocessor:
+            return read_frame(image_data), None
+        started = time.perf_counter()
+        try:
+            return await self.preprocessor.process(image_data, camera_id)
+        finally:
+            self._record("preprocess", started)
+    
+    async def _prescreen(self, image: bytes, metadata: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """Score the frame with the local model; returns the updated metadata and, for a
+        confidently clean frame, the local result that replaces the remote call"""
+        if not self.prescreener:
+            return metadata, None
+        started = time.perf_counter()
+        try:
+            verdict = await self.prescreener.screen(image)
+        except Exception as e:
+            app_logger.warning(f"Defect pre-screen failed, escalating frame: {e}")
+            return metadata, None
+        finally:
+            self._record("prescreen", started)
+        
+        metadata = {**metadata, "prescreen": verdict}
+        if verdict["decision"] != "clean":
+            return metadata, None
+        return metadata, {
+            "defects": [],
+            "quality_score": round(1 - verdict["score"], 4),
+            "processed_at": datetime.utcnow().isoformat(),
+            "metadata": metadata
+        }
+    
+    def _reuse(self, company_id: str, camera_id: Optional[str], metadata: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Result of a near-identical recent frame from the same camera, if any"""
+        preprocessing = metadata.get("preprocessing")
+        if not self.frame_cache or not camera_id or not preprocessing:
+            return None
+        hit = self.frame_cache.lookup(company_id, camera_id, int(preprocessing["dhash"], 16))
+        if hit is None:
+            return None
+        result, distance, age = hit
+        return {
+            **result,
+            "metadata": {**metadata, "dedupe": {"hit": True, "distance": distance, "age_seconds": round(age, 1)}}
+        }
+    
+    def _remember(self, company_id: str, camera_id: Optional[str], metadata: Dict[str, Any], result: Dict[str, Any]):
+        preprocessing = metadata.get("preprocessing")
+        # Mock responses (no client configured) must not be reused
+        if self.frame_cache and camera_id and preprocessing and self.client:
+            self.frame_cache.store(company_id, camera_id, int(preprocessing["dhash"], 16), result)
+    
+    async def _create(self, **kwargs):
+        """chat.completions.create under the shared adaptive concurrency limit, recorded in the model metrics"""
+        call = lambda: self.client.chat.completions.create(**kwargs)
+        started = time.perf_counter()
+        try:
+            response = await (self.concurrency.run("openai:chat", call) if self.concurrency else call())
+        except Exception:
+            model_registry.record_call(kwargs["model"], started, success=False)
+            raise
+        finally:
+            self._record("remote", started)
+        model_registry.record_call(
+            kwargs["model"],
+            started,
+            response.usage.prompt_tokens,
+            response.usage.completion_tokens
+        )
+        return response
     
     async def detect_defects(
         self,
-        image_data: str,
+        image_data: Frame,
         company_id: str,
-        metadata: Dict[str, Any] = {}
+        metadata: Dict[str, Any] = {},
+        camera_id: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Detect defects in manufacturing images"""
+        """Detect defects in manufacturing images (frame bytes or a binary file)"""
+        image_data, preprocessing = await self._prepare(image_data, camera_id)
+        if preprocessing:
+            metadata = {**metadata, "preprocessing": preprocessing}
         
+        reused = self._reuse(company_id, camera_id, metadata)
+        if reused:
+            return reused
+        metadata, local = await self._prescreen(image_data, metadata)
+        if local:
+            return local
+        result = await self._inspect(image_data, metadata)
+        self._remember(company_id, camera_id, metadata, result)
+        return result
+    
+    async def _inspect(self, image_data: bytes, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """One vision call for one preprocessed frame"""
         if not self.client:
             app_logger.warning("OpenAI client not configured, returning mock response")
             return {
@@ -26,12 +167,13 @@ class VisionService:
                     {"type": "dent", "bbox": [300, 400, 350, 450], "score": 0.87, "severity": "low"}
                 ],
                 "quality_score": 0.88,
-                "processed_at": datetime.utcnow().isoformat()
+                "processed_at": datetime.utcnow().isoformat(),
+                "metadata": metadata
             }
         
         try:
             # Use GPT-4 Vision for defect detection
-            response = await self.client.chat.completions.create(
+            response = await self._create(
                 model="gpt-4-vision-preview",
                 messages=[
                     {
@@ -41,12 +183,7 @@ class VisionService:
                                 "type": "text",
                                 "text": "Analyze this manufacturing product image for defects. Identify any scratches, dents, discoloration, or other quality issues. Provide a JSON response with defect type, approximate location, and severity."
                             },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_data}"
-                                }
-                            }
+                            image_part(image_data)
                         ]
                     }
                 ],
@@ -71,9 +208,146 @@ class VisionService:
             app_logger.error(f"Vision analysis failed: {e}")
             raise
     
+    async def _inspect_group(self, group: List[Tuple[int, bytes, Dict[str, Any]]]) -> List[Tuple[int, Dict[str, Any]]]:
+        """One vision call for several frames, answered as a JSON array in image order"""
+        if len(group) == 1 or not self.client:
+            return [(index, await self._inspect(image, metadata)) for index, image, metadata in group]
+        
+        response = await self._create(
+            model="gpt-4-vision-preview",
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": f"Analyze each of these {len(group)} manufacturing product images for defects such as scratches, dents or discoloration. Reply with only a JSON array of {len(group)} objects, one per image in the order given, each shaped {{\"defects\": [{{\"type\": str, \"location\": str, \"severity\": \"low\"|\"medium\"|\"high\"}}], \"quality_score\": number between 0 and 1}}."
+                        },
+                        *[image_part(image) for _, image, _ in group]
+                    ]
+                }
+            ],
+            max_tokens=300 * len(group)
+        )
+        
+        content = response.choices[0].message.content or ""
+        try:
+            items = json.loads(content[content.index("["):content.rindex("]") + 1])
+            if len(items) != len(group) or not all(isinstance(item, dict) for item in items):
+                raise ValueError(f"expected {len(group)} objects")
+        except ValueError as e:
+            # The model broke the array format: inspect the frames one by one
+            app_logger.warning(f"Packed inspection of {len(group)} frames returned malformed JSON ({e}), retrying singly")
+            results = await asyncio.gather(*[self._inspect(image, metadata) for _, image, metadata in group])
+            return [(index, result) for (index, _, _), result in zip(group, results)]
+        
+        processed_at = datetime.utcnow().isoformat()
+        results: List[Tuple[int, Dict[str, Any]]] = []
+        for (index, _, metadata), item in zip(group, items):
+            # A malformed entry fails only its own frame, not the whole packed call
+            try:
+                defects = item.get("defects") or []
+                if not isinstance(defects, list):
+                    raise ValueError("defects is not a list")
+                quality_score = float(item.get("quality_score", 0.9))
+            except (TypeError, ValueError) as e:
+                results.append((index, {"error": f"Malformed inspection result: {e}"}))
+                continue
+            results.append((index, {
+                "defects": defects,
+                "quality_score": quality_score,
+                "processed_at": processed_at,
+                "metadata": metadata
+            }))
+        return results
+    
+    async def detect_defects_batch(
+        self,
+        frames: List[Tuple[Frame, str, Dict[str, Any]]],
+        company_id: str
+    ) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """Inspect (frame, camera_id, metadata) triples and yield (index, result) as each
+        completes. Frames are preprocessed in parallel, packed batch_images_per_call to a
+        vision call as soon as they are ready, and at most batch_concurrency calls run at
+        once. Near-duplicates of recent frames are answered from the frame cache, clean
+        frames by the local pre-screen, and a failed frame yields {"error": ...} instead of
+        aborting the batch."""
+        queue: asyncio.Queue = asyncio.Queue()
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+        ready: List[Tuple[int, bytes, Dict[str, Any]]] = []
+        calls: List[asyncio.Task] = []
+        
+        async def dispatch(group: List[Tuple[int, bytes, Dict[str, Any]]]):
+            async with semaphore:
+                # Settle the whole group before enqueueing so each index is answered once
+                try:
+                    results = await self._inspect_group(group)
+                    for index, result in results:
+                        self._remember(company_id, frames[index][1], result.get("metadata", {}), result)
+                except Exception as e:
+                    results = [(index, {"error": str(e)}) for index, _, _ in group]
+                for item in results:
+                    queue.put_nowait(item)
+        
+        async def prepare(index: int, frame: Frame, camera_id: str, metadata: Dict[str, Any]):
+            try:
+                image, preprocessing = await self._prepare(frame, camera_id)
+                metadata = {**metadata, "preprocessing": preprocessing} if preprocessing else metadata
+                reused = self._reuse(company_id, camera_id, metadata)
+                if reused:
+                    queue.put_nowait((index, reused))
+                    return
+                metadata, local = await self._prescreen(image, metadata)
+            except Exception as e:
+                queue.put_nowait((index, {"error": str(e)}))
+                return
+            if local:
+                queue.put_nowait((index, local))
+                return
+            ready.append((index, image, metadata))
+            if len(ready) >= self.batch_images_per_call:
+                calls.append(asyncio.create_task(dispatch(ready[:])))
+                ready.clear()
+        
+        async def run():
+            await asyncio.gather(*[prepare(i, *frame) for i, frame in enumerate(frames)])
+            if ready:
+                calls.append(asyncio.create_task(dispatch(ready[:])))
+            await asyncio.gather(*calls)
+        
+        runner = asyncio.create_task(run())
+        unanswered = set(range(len(frames)))
+        getter: Optional[asyncio.Future] = None
+        try:
+            while unanswered:
+                if not queue.empty():
+                    index, result = queue.get_nowait()
+                elif runner.done():
+                    # Raises whatever stopped run(); otherwise frames went missing
+                    runner.result()
+                    raise RuntimeError(f"Batch inspection ended without results for frames {sorted(unanswered)}")
+                else:
+                    getter = asyncio.ensure_future(queue.get())
+                    await asyncio.wait({getter, runner}, return_when=asyncio.FIRST_COMPLETED)
+                    if not getter.done():
+                        getter.cancel()
+                        continue
+                    index, result = getter.result()
+                if index in unanswered:
+                    unanswered.discard(index)
+                    yield index, result
+        finally:
+            # The client may disconnect mid-stream; stop the remaining calls
+            for task in [runner, *calls, *([getter] if getter else [])]:
+                task.cancel()
+        
+        app_logger.info(
+            f"Batch inspection of {len(frames)} frames in {len(calls)} vision calls for company {company_id}"
+        )
+    
     async def analyze_image(
         self,
-        image_data: str,
+        image_data: Frame,
         prompt: str,
         company_id: str
     ) -> str:
@@ -81,18 +355,22 @@ class VisionService:
         if not self.client:
             return "Mock image analysis result - OpenAI client not configured"
         
+        image_data, preprocessing = await self._prepare(image_data)
+        if preprocessing:
+            app_logger.info(
+                f"Analysis image reduced from {preprocessing['original_bytes']} "
+                f"to {preprocessing['processed_bytes']} bytes"
+            )
+        
         try:
-            response = await self.client.chat.completions.create(
+            response = await self._create(
                 model="gpt-4-vision-preview",
                 messages=[
                     {
                         "role": "user",
                         "content": [
                             {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {"url": f"data:image/jpeg;base64,{image_data}"}
-                            }
+                            image_part(image_data)
                         ]
                     }
                 ],
@@ -104,4 +382,15 @@ class VisionService:
         except Exception as e:
             app_logger.error(f"Image analysis failed: {e}")
             raise
-
+    
+    def stats(self) -> Dict[str, Any]:
+        """Per-stage latency percentiles and the pre-screen escalation rate"""
+        stages = {}
+        for stage, samples in self.stage_latency.items():
+            ordered = sorted(samples)
+            p = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2) if ordered else None
+            stages[stage] = {"samples": len(ordered), "p50_ms": p(0.50), "p95_ms": p(0.95)}
+        return {
+            "stages": stages,
+            "prescreen": self.prescreener.stats() if self.prescreener else None
+        }
@@ -0,0 +1,130 @@
+import asyncio
+import time
+
+import pytest
+
+from app.services.admission import AdmissionController, AdmissionRejected, TokenBucket
+
+
+def _controller(**overrides):
+    options = dict(
+        tenant_rates={"free": 1.0, "pro": 10.0, "enterprise": 100.0},
+        tenant_bursts={"free": 5.0, "pro": 50.0, "enterprise": 500.0},
+        provider_rates={},
+        provider_bursts={},
+        max_queue_wait={"free": 0.5, "pro": 2.0, "enterprise": 5.0}
+    )
+    options.update(overrides)
+    return AdmissionController(**options)
+
+
+CONTEXT = {"company_id": "acme", "subscription_tier": "free"}
+
+
+def test_bucket_takes_until_empty_then_reports_wait():
+    bucket = TokenBucket(rate=2.0, burst=3.0)
+    assert [bucket.try_take() for _ in range(3)] == [0.0, 0.0, 0.0]
+
+    wait = bucket.try_take()
+    assert 0.4 < wait <= 0.5
+
+
+def test_bucket_refills_over_time_up_to_burst():
+    bucket = TokenBucket(rate=1.0, burst=2.0)
+    bucket.try_take(2.0)
+    bucket.updated -= 10
+
+    assert bucket.try_take(2.0) == 0.0
+    assert bucket.tokens == pytest.approx(0.0, abs=0.01)
+
+
+def test_bucket_oversized_cost_needs_full_bucket_and_leaves_debt():
+    bucket = TokenBucket(rate=1.0, burst=4.0)
+    assert bucket.try_take(10.0) == 0.0
+    assert bucket.tokens == pytest.approx(-6.0, abs=0.01)
+    assert bucket.try_take(1.0) == pytest.approx(7.0, abs=0.01)
+
+
+def test_bucket_reserve_and_refund():
+    bucket = TokenBucket(rate=10.0, burst=100.0)
+    assert bucket.reserve(150.0) == pytest.approx(5.0, abs=0.01)
+
+    bucket.refund(150.0)
+    assert bucket.tokens == pytest.approx(100.0, abs=0.01)
+
+    bucket.refund(50.0)
+    assert bucket.tokens == 100.0
+
+
+def test_admit_rejects_tenant_over_burst():
+    controller = _controller()
+
+    async def run():
+        for _ in range(5):
+            await controller.admit(CONTEXT, "openai")
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.admit(CONTEXT, "openai")
+        return rejected.value
+
+    error = asyncio.run(run())
+    assert error.reason == "tenant"
+    assert error.retry_after > 0
+    assert controller.admitted == 5
+
+
+def test_admit_refunds_tenant_when_token_budget_rejects():
+    controller = _controller(provider_tokens_per_minute={"openai": 600.0})
+    token_bucket = controller._token_buckets["openai"]
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        asyncio.run(controller.admit(CONTEXT, "openai", cost=2.0, tokens=5000))
+
+    assert rejected.value.reason == "openai:tokens"
+    assert controller._tenant_bucket("acme", "free").tokens == pytest.approx(5.0, abs=0.01)
+    assert token_bucket.tokens == pytest.approx(600.0, abs=0.01)
+
+
+def test_admit_refunds_tenant_and_tokens_when_provider_queue_rejects():
+    controller = _controller(
+        provider_rates={"openai": 1.0},
+        provider_bursts={"openai": 1.0},
+        provider_tokens_per_minute={"openai": 6000.0}
+    )
+
+    async def run():
+        await controller.admit(CONTEXT, "openai", tokens=100)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.admit(CONTEXT, "openai", tokens=100)
+        return rejected.value
+
+    error = asyncio.run(run())
+    assert error.reason == "openai"
+    assert controller._tenant_bucket("acme", "free").tokens == pytest.approx(4.0, abs=0.01)
+    assert controller._token_buckets["openai"].tokens == pytest.approx(5900.0, abs=1.0)
+    assert controller.rejected == {"openai": 1}
+
+
+def test_admit_disabled_is_a_no_op():
+    controller = _controller(enabled=False)
+    for _ in range(10):
+        asyncio.run(controller.admit(CONTEXT, "openai"))
+    assert controller.admitted == 0
+
+
+def test_enterprise_context_gets_enterprise_bucket():
+    controller = _controller()
+    enterprise = {"company_id": "bigco", "subscription_tier": "enterprise"}
+
+    async def run():
+        for _ in range(100):
+            await controller.admit(enterprise, "openai")
+
+    asyncio.run(run())
+    bucket = controller._tenant_bucket("bigco", "enterprise")
+    assert (bucket.rate, bucket.burst) == (100.0, 500.0)
+    assert controller.admitted == 100
+
+
+def test_unknown_tier_is_admitted_as_free():
+    controller = _controller()
+    assert controller._tier({"subscription_tier": "basic"}) == "free"
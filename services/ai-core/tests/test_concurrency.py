@@ -0,0 +1,106 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.admission import AdmissionRejected
+from app.services.concurrency import AdaptiveLimiter
+
+
+class _RateLimited(Exception):
+    status_code = 429
+    response = SimpleNamespace(headers={"retry-after": "0"})
+
+
+def test_successes_grow_limit_by_about_one_per_window():
+    limiter = AdaptiveLimiter("openai", initial_limit=4, max_limit=8)
+
+    async def run():
+        for _ in range(4):
+            await limiter.run(lambda: asyncio.sleep(0))
+
+    asyncio.run(run())
+    assert 4.9 < limiter.limit < 5.0
+    assert limiter.inflight == 0
+
+
+def test_limit_never_exceeds_max():
+    limiter = AdaptiveLimiter("openai", initial_limit=4, max_limit=5)
+
+    async def run():
+        for _ in range(50):
+            await limiter.run(lambda: asyncio.sleep(0))
+
+    asyncio.run(run())
+    assert limiter.limit == 5
+
+
+def test_provider_429_cuts_limit_and_retries_before_rejecting():
+    limiter = AdaptiveLimiter("openai", initial_limit=16, min_limit=2, max_retries=1, target_latency_ms=0)
+    attempts = []
+
+    async def fn():
+        attempts.append(1)
+        raise _RateLimited()
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        asyncio.run(limiter.run(fn))
+
+    assert isinstance(rejected.value.__cause__, _RateLimited)
+    assert len(attempts) == 2
+    assert limiter.retries == 1
+    assert limiter.limit == 4
+    assert limiter.cuts == {"overload": 2}
+
+
+def test_cuts_happen_once_per_round_trip():
+    limiter = AdaptiveLimiter("openai", initial_limit=16, max_retries=0, target_latency_ms=60000)
+
+    async def fn():
+        raise _RateLimited()
+
+    for _ in range(3):
+        with pytest.raises(AdmissionRejected):
+            asyncio.run(limiter.run(fn))
+    assert limiter.limit == 8
+
+
+def test_slow_responses_cut_limit_down_to_minimum():
+    limiter = AdaptiveLimiter("openai", initial_limit=8, min_limit=2, target_latency_ms=0.001)
+
+    async def run():
+        for _ in range(5):
+            await limiter.run(lambda: asyncio.sleep(0.005))
+
+    asyncio.run(run())
+    assert limiter.limit == 2
+    assert limiter.cuts == {"latency": 5}
+
+
+def test_other_errors_leave_limit_unchanged():
+    limiter = AdaptiveLimiter("openai", initial_limit=8)
+
+    async def fn():
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        asyncio.run(limiter.run(fn))
+    assert limiter.limit == 8
+    assert limiter.inflight == 0
+
+
+def test_calls_over_the_limit_queue_until_a_slot_frees():
+    limiter = AdaptiveLimiter("openai", initial_limit=2, min_limit=1)
+    peak = 0
+
+    async def fn():
+        nonlocal peak
+        peak = max(peak, limiter.inflight)
+        await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(*[limiter.run(fn) for _ in range(6)])
+
+    asyncio.run(run())
+    assert peak <= 2
+    assert limiter.inflight == 0
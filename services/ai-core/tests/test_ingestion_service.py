@@ -0,0 +1,57 @@
+import asyncio
+
+from app.services.ingestion_service import IngestionService
+
+
+class _Embeddings:
+    async def embed_texts(self, texts):
+        return [[0.0] for _ in texts]
+
+
+class _VectorStore:
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.inflight = 0
+        self.peak = 0
+        self.upserted = 0
+
+    async def create_collection(self, collection_name):
+        pass
+
+    async def upsert_embeddings(self, collection_name, company_id, documents, embeddings):
+        self.inflight += 1
+        self.peak = max(self.peak, self.inflight)
+        await asyncio.sleep(self.delay)
+        self.inflight -= 1
+        self.upserted += len(documents)
+
+
+def _documents(count):
+    return [{"id": str(i), "content": f"document {i}"} for i in range(count)]
+
+
+def test_upserts_are_bounded():
+    store = _VectorStore()
+    service = IngestionService(_Embeddings(), store, max_batch_documents=1, concurrency=8, upsert_concurrency=2)
+
+    summary = asyncio.run(service.ingest("docs", "acme", _documents(10)))
+    assert summary["status"] == "success" and store.upserted == 10
+    assert store.peak == 2
+
+
+def test_running_job_outlives_the_job_ttl():
+    store = _VectorStore(delay=0.05)
+    service = IngestionService(_Embeddings(), store, max_batch_documents=1, job_ttl_seconds=0.01)
+
+    async def run():
+        job_id = service.start_job("docs", "acme", _documents(3))
+        await asyncio.sleep(0.03)
+        running = dict(service.get_job(job_id, "acme"))
+        await asyncio.gather(*service._tasks)
+        return job_id, running, service.get_job(job_id, "acme"), service.get_job(job_id, "globex")
+
+    job_id, running, finished, other_tenant = asyncio.run(run())
+    assert running is not None and running["status"] == "running"
+    assert finished["status"] == "success" and finished["finished_at"]
+    assert other_tenant is None
+    assert job_id not in service.running_jobs
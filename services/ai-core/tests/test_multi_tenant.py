@@ -0,0 +1,130 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+
+from app.core import multi_tenant
+from app.core.config import settings
+
+
+class _Client:
+    def __init__(self, rows=None, status_code=200, error=None):
+        self.rows = rows or []
+        self.status_code = status_code
+        self.error = error
+        self.calls = []
+
+    async def get(self, url, headers, params=None, timeout=None):
+        self.calls.append((url, params))
+        if self.error:
+            raise self.error
+        return SimpleNamespace(status_code=self.status_code, json=lambda: self.rows)
+
+
+def _connection(client):
+    return SimpleNamespace(app=SimpleNamespace(state=SimpleNamespace(services=SimpleNamespace(http_client=client))))
+
+
+USER = {"id": "user-1", "user_metadata": {"company_id": "acme"}, "app_metadata": {}}
+
+
+@pytest.fixture(autouse=True)
+def supabase(monkeypatch):
+    monkeypatch.setattr(settings, "SUPABASE_URL", "https://supabase.example")
+    monkeypatch.setattr(settings, "SUPABASE_SERVICE_ROLE_KEY", "service-role")
+    multi_tenant._tier_cache.clear()
+    yield
+    multi_tenant._tier_cache.clear()
+
+
+def test_tier_comes_from_the_companies_row_and_is_cached():
+    client = _Client(rows=[{"subscription_tier": "enterprise"}])
+
+    async def run():
+        return [await multi_tenant.get_company_context(_connection(client), USER) for _ in range(3)]
+
+    contexts = asyncio.run(run())
+    assert {context["subscription_tier"] for context in contexts} == {"enterprise"}
+    assert client.calls == [("https://supabase.example/rest/v1/companies", {"id": "eq.acme", "select": "subscription_tier"})]
+
+
+@pytest.mark.parametrize("rows", [[{"subscription_tier": "basic"}], []])
+def test_basic_or_missing_company_is_free(rows):
+    context = asyncio.run(multi_tenant.get_company_context(_connection(_Client(rows=rows)), USER))
+    assert context["subscription_tier"] == "free"
+
+
+def test_token_claim_stands_in_while_supabase_is_unreachable():
+    client = _Client(error=httpx.ConnectError("down"))
+    user = {**USER, "app_metadata": {"subscription_tier": "pro"}}
+
+    context = asyncio.run(multi_tenant.get_company_context(_connection(client), user))
+    assert context["subscription_tier"] == "pro"
+
+
+SECRET = "test-secret"
+
+
+def _rsa_jwk():
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from jose import jwk
+
+    private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    public_pem = private.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return private_pem, {**jwk.construct(public_pem, "RS256").to_dict(), "kid": "key-1"}
+
+
+@pytest.fixture
+def jwt_settings(monkeypatch):
+    monkeypatch.setattr(settings, "SUPABASE_JWT_SECRET", SECRET)
+    monkeypatch.setattr(multi_tenant, "_jwks", {"keys": {}, "fetched_at": 0.0, "attempted_at": float("-inf")})
+
+
+def _claims(**overrides):
+    return {"sub": "user-1", "aud": settings.SUPABASE_JWT_AUDIENCE, **overrides}
+
+
+def _verify(token):
+    return asyncio.run(multi_tenant._verify_locally(token, _Client()))
+
+
+def test_hs256_token_is_verified_with_the_shared_secret(jwt_settings):
+    assert _verify(jwt.encode(_claims(), SECRET, algorithm="HS256"))["id"] == "user-1"
+
+
+@pytest.mark.parametrize("algorithm", ["HS384", "HS512"])
+def test_other_hmac_algorithms_are_rejected(jwt_settings, algorithm):
+    with pytest.raises(HTTPException) as rejected:
+        _verify(jwt.encode(_claims(), SECRET, algorithm=algorithm))
+    assert rejected.value.status_code == 401
+
+
+def test_token_without_subject_is_rejected(jwt_settings):
+    claims = _claims()
+    del claims["sub"]
+    with pytest.raises(HTTPException) as rejected:
+        _verify(jwt.encode(claims, SECRET, algorithm="HS256"))
+    assert rejected.value.status_code == 401
+
+
+def test_jwks_token_must_use_the_keys_own_algorithm(jwt_settings):
+    private_pem, public_jwk = _rsa_jwk()
+    multi_tenant._jwks.update(keys={"key-1": public_jwk}, fetched_at=time.monotonic())
+
+    token = jwt.encode(_claims(), private_pem, algorithm="RS256", headers={"kid": "key-1"})
+    assert _verify(token)["id"] == "user-1"
+
+    forged = jwt.encode(_claims(), private_pem, algorithm="RS512", headers={"kid": "key-1"})
+    with pytest.raises(HTTPException) as rejected:
+        _verify(forged)
+    assert rejected.value.status_code == 401
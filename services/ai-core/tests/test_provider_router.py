@@ -0,0 +1,174 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.services.model_registry import ModelInfo, ModelRegistry
+from app.services.provider_router import CircuitBreaker, CircuitOpenError, ProviderRouter
+
+
+def _model(name, provider="openai", **overrides):
+    fields = dict(
+        name=name,
+        provider=provider,
+        category="chat",
+        cost_per_1k_input_tokens=0.001,
+        cost_per_1k_output_tokens=0.002,
+        avg_latency_ms=1000,
+        accuracy_score=0.85,
+        max_tokens=4096,
+        context_window=16385
+    )
+    fields.update(overrides)
+    return ModelInfo(**fields)
+
+
+def _registry(*models):
+    registry = ModelRegistry()
+    registry.models = {m.name: m for m in models}
+    return registry
+
+
+def _connect_error(model):
+    return httpx.ConnectError(f"{model} unreachable", request=httpx.Request("POST", "https://example.invalid"))
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, open_seconds=30.0)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_breaker_half_open_admits_one_probe_after_cooldown():
+    breaker = CircuitBreaker(failure_threshold=1, open_seconds=30.0)
+    breaker.record_failure()
+    breaker.opened_at = time.monotonic() - 31
+
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+    assert breaker.allow()
+
+
+def test_breaker_failed_probe_reopens_and_released_probe_frees_slot():
+    breaker = CircuitBreaker(failure_threshold=5, open_seconds=30.0)
+    breaker.state, breaker.opened_at = "open", time.monotonic() - 31
+
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_equivalent_models_requires_matching_capacity():
+    registry = _registry(
+        _model("primary", avg_latency_ms=2000),
+        _model("fast", provider="anthropic", avg_latency_ms=500),
+        _model("slow", provider="anthropic", avg_latency_ms=3000),
+        _model("small-context", context_window=4096),
+        _model("short-output", max_tokens=1024),
+        _model("less-accurate", accuracy_score=0.70),
+        _model("other-category", category="embeddings")
+    )
+
+    assert [m.name for m in registry.equivalent_models("primary")] == ["fast", "slow"]
+    assert registry.equivalent_models("unknown") == []
+
+
+def test_equivalent_models_respects_subscription_tier():
+    registry = _registry(_model("gpt-4"), _model("claude-3-opus-20240229", provider="anthropic"), _model("gpt-3.5-turbo"))
+
+    assert [m.name for m in registry.equivalent_models("gpt-4", "free")] == ["gpt-3.5-turbo"]
+    assert [m.name for m in registry.equivalent_models("gpt-4", "pro")] == ["gpt-3.5-turbo"]
+    assert {m.name for m in registry.equivalent_models("gpt-4", "enterprise")} == {
+        "claude-3-opus-20240229", "gpt-3.5-turbo"
+    }
+
+
+def test_router_fails_over_on_provider_fault():
+    router = ProviderRouter({"openai", "anthropic"}, registry=_registry(_model("primary"), _model("backup", provider="anthropic")))
+    calls = []
+
+    async def fn(model):
+        calls.append(model)
+        if model == "primary":
+            raise _connect_error(model)
+        return {"model": model}
+
+    assert asyncio.run(router.call("primary", fn)) == {"model": "backup"}
+    assert calls == ["primary", "backup"]
+    assert router.failovers == 1
+    assert router.breakers["primary"].failures == 1
+
+
+def test_router_does_not_fail_over_on_local_errors():
+    router = ProviderRouter({"openai", "anthropic"}, registry=_registry(_model("primary"), _model("backup", provider="anthropic")))
+    calls = []
+
+    async def fn(model):
+        calls.append(model)
+        raise ValueError("bad response")
+
+    with pytest.raises(ValueError):
+        asyncio.run(router.call("primary", fn))
+    assert calls == ["primary"]
+    assert router.breakers["primary"].failures == 0
+
+
+def test_router_raises_circuit_open_when_every_candidate_is_open():
+    router = ProviderRouter(
+        {"openai"},
+        registry=_registry(_model("primary"), _model("backup")),
+        failure_threshold=1,
+        max_failovers=3
+    )
+
+    async def fn(model):
+        raise _connect_error(model)
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(router.call("primary", fn))
+    assert {name: b.state for name, b in router.breakers.items()} == {"primary": "open", "backup": "open"}
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(router.call("primary", fn))
+
+
+def _hedging_router():
+    registry = _registry(
+        _model("gpt-4", avg_latency_ms=10),
+        _model("claude-3-opus-20240229", provider="anthropic", avg_latency_ms=10),
+        _model("gpt-3.5-turbo", avg_latency_ms=10)
+    )
+    return ProviderRouter({"openai", "anthropic"}, registry=registry, hedge_tiers={"enterprise"}, hedge_min_delay_ms=10)
+
+
+def test_failover_candidates_follow_the_tenant_tier():
+    router = _hedging_router()
+    assert router.candidates("gpt-4", "free") == ["gpt-4", "gpt-3.5-turbo"]
+    assert set(router.candidates("gpt-4", "enterprise")) == {"gpt-4", "claude-3-opus-20240229", "gpt-3.5-turbo"}
+
+
+@pytest.mark.parametrize("tier, hedged", [("enterprise", True), ("pro", False), ("free", False)])
+def test_slow_requests_are_hedged_only_for_hedge_tiers(tier, hedged):
+    router = _hedging_router()
+
+    async def fn(model):
+        await asyncio.sleep(0.2 if model == "gpt-4" else 0)
+        return {"model": model}
+
+    result = asyncio.run(router.call("gpt-4", fn, tier))
+    assert (result["model"] != "gpt-4") == hedged
+    assert (router.hedges, router.hedge_wins) == ((1, 1) if hedged else (0, 0))
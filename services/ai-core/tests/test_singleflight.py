@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+
+from app.services.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    calls = 0
+
+    async def fn():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def run():
+        return await asyncio.gather(*[flight.do("key", fn) for _ in range(5)])
+
+    results = asyncio.run(run())
+    assert calls == 1
+    assert [result for result, _ in results] == ["answer"] * 5
+    assert [shared for _, shared in results] == [False, True, True, True, True]
+    assert (flight.leaders, flight.followers) == (1, 4)
+
+
+def test_leader_error_reaches_every_caller_and_clears_the_key():
+    flight = SingleFlight()
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("provider down")
+
+    async def succeeding():
+        return "recovered"
+
+    async def run():
+        results = await asyncio.gather(*[flight.do("key", failing) for _ in range(3)], return_exceptions=True)
+        assert flight.stats()["inflight"] == 0
+        return results, await flight.do("key", succeeding)
+
+    results, retried = asyncio.run(run())
+    assert calls == 1
+    assert all(isinstance(r, RuntimeError) and str(r) == "provider down" for r in results)
+    assert retried == ("recovered", False)
+
+
+def test_timeout_releases_every_waiter():
+    flight = SingleFlight(timeout=0.01)
+
+    async def hang():
+        await asyncio.sleep(1)
+
+    async def run():
+        return await asyncio.gather(*[flight.do("key", hang) for _ in range(2)], return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, asyncio.TimeoutError) for r in results)
+
+
+def test_cancelled_follower_does_not_cancel_the_call():
+    flight = SingleFlight()
+
+    async def fn():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def run():
+        leader = asyncio.create_task(flight.do("key", fn))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("key", fn))
+        await asyncio.sleep(0)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return await leader
+
+    assert asyncio.run(run()) == ("done", False)
+
+
+def _llm_service():
+    from types import SimpleNamespace
+
+    from app.services.llm_service import LLMService
+
+    return LLMService(openai_client=SimpleNamespace(), anthropic_client=SimpleNamespace(), singleflight=SingleFlight())
+
+
+def test_uncached_llm_calls_coalesce_per_tenant_only():
+    service = _llm_service()
+    calls = []
+    messages = [{"role": "user", "content": "Translate: hello"}]
+
+    def call_for(tenant):
+        async def call():
+            calls.append(tenant)
+            await asyncio.sleep(0.01)
+            return {"content": f"answer for {tenant}", "model": "gpt-3.5-turbo", "usage": {}}
+        return call
+
+    async def run():
+        return await asyncio.gather(*[
+            service._cached(call_for(tenant), tenant, False, "gpt-3.5-turbo", messages, None, 0.3, 100)
+            for tenant in ["acme", "acme", "globex"]
+        ])
+
+    results = asyncio.run(run())
+    assert sorted(calls) == ["acme", "globex"]
+    assert [r["content"] for r in results] == ["answer for acme", "answer for acme", "answer for globex"]
+    assert [r["coalesced"] for r in results] == [False, True, False]
+
+
+def test_llm_single_flight_falls_back_to_the_request_tenant():
+    from app.core.tenant import current_tenant
+
+    service = _llm_service()
+    messages = [{"role": "user", "content": "hello"}]
+
+    async def call():
+        await asyncio.sleep(0.01)
+        return {"content": current_tenant.get(), "model": "gpt-3.5-turbo", "usage": {}}
+
+    async def as_tenant(tenant):
+        current_tenant.set(tenant)
+        return await service._cached(call, None, False, "gpt-3.5-turbo", messages, None, 0.3, 100)
+
+    async def run():
+        return await asyncio.gather(as_tenant("acme"), as_tenant("globex"))
+
+    assert [r["content"] for r in asyncio.run(run())] == ["acme", "globex"]
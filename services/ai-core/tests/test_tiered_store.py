@@ -0,0 +1,63 @@
+import asyncio
+
+from app.services.embedding_cache import EmbeddingCache
+from app.services.tiered_store import TieredStore
+from app.services.translation_memory import TranslationMemory
+
+
+def test_memory_tier_evicts_least_recently_used_by_size():
+    store = TieredStore("test", "items", ("k",), "v", max_size=6, sizeof=len)
+
+    async def run():
+        await store.set_many([(("a",), "aa"), (("b",), "bb"), (("c",), "cc")])
+        await store.get_many([("a",)])
+        await store.set_many([(("d",), "dd")])
+        await store.set_many([(("huge",), "x" * 7)])
+        return await store.get_many([("a",), ("b",), ("c",), ("d",), ("huge",)])
+
+    assert asyncio.run(run()) == ["aa", None, "cc", "dd", None]
+    assert store.memory_size == 6
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "store.sqlite3")
+
+    async def write():
+        store = TieredStore("test", "items", ("k1", "k2"), "v", db_path=path)
+        await store.set_many([(("a", "1"), "first")])
+        store.close()
+
+    async def read():
+        store = TieredStore("test", "items", ("k1", "k2"), "v", db_path=path)
+        values = await store.get_many([("a", "1"), ("a", "2")])
+        stats = store.stats()
+        store.close()
+        return values, stats
+
+    asyncio.run(write())
+    values, stats = asyncio.run(read())
+    assert values == ["first", None]
+    assert (stats["disk_hits"], stats["misses"], stats["persistent"]) == (1, 1, True)
+
+
+def test_embedding_cache_round_trips_float32_vectors(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+
+    async def run():
+        cache = EmbeddingCache(db_path=path)
+        await cache.set_many("ada", ["hello"], [[0.5, -1.25]])
+        cache.close()
+        reopened = EmbeddingCache(db_path=path)
+        return await reopened.get_many("ada", ["hello", "other"]), await reopened.get_many("other-model", ["hello"])
+
+    assert asyncio.run(run()) == ([[0.5, -1.25], None], [None])
+
+
+def test_translation_memory_is_scoped_per_company():
+    memory = TranslationMemory()
+
+    async def run():
+        await memory.set_many("acme", ["Hello"], "fr", ["Bonjour"])
+        return await memory.get_many("acme", ["Hello"], "fr"), await memory.get_many("globex", ["Hello"], "fr")
+
+    assert asyncio.run(run()) == (["Bonjour"], [None])
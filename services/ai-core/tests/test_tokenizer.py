@@ -0,0 +1,15 @@
+from app.services import tokenizer
+
+
+def test_warm_encodings_loads_each_table_once(monkeypatch):
+    loaded = []
+    monkeypatch.setattr(tokenizer, "_encoding", loaded.append)
+
+    tokenizer.warm_encodings(["gpt-4", "gpt-3.5-turbo", "gpt-4o-mini", "claude-3-haiku-20240307"])
+    assert loaded == ["cl100k_base", "o200k_base"]
+
+
+def test_count_tokens_falls_back_to_estimate_without_tables(monkeypatch):
+    monkeypatch.setattr(tokenizer, "_encoding", lambda name: None)
+    assert tokenizer.count_tokens("hello world, hello") == tokenizer.estimate_tokens("hello world, hello")
+    assert tokenizer.count_tokens("") == 0
@@ -0,0 +1,26 @@
+import pytest
+
+from app.services.translator import split_segments
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "Hello world.",
+    "First sentence. Second one!  Third?\n\nNew paragraph.\n",
+    "  leading and trailing whitespace  \n",
+    "Line one\r\nLine two\r\n\r\n",
+    "品質檢查完成。發現兩個缺陷！\n請確認。",
+    "Part INV-2024-001 failed... see report v1.2.3\t\n",
+    "\n\n\n"
+])
+def test_segments_join_back_to_text(text):
+    parts = split_segments(text)
+    assert "".join(lead + segment + trail for lead, segment, trail in parts) == text
+
+
+def test_segments_are_stripped_and_non_empty():
+    parts = split_segments("One.  Two.\n\nThree")
+    segments = [segment for _, segment, _ in parts if segment]
+    assert segments
+    assert all(segment == segment.strip() for segment in segments)
+    assert "".join(segments).replace(" ", "") == "One.Two.Three"
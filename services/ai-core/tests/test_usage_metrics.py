@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from app.services.usage_metrics import QuantileSketch, UsageMetrics
+
+
+def _true_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+@pytest.mark.parametrize("accuracy", [0.01, 0.05])
+def test_quantiles_within_relative_accuracy(accuracy):
+    rng = random.Random(7)
+    values = [rng.lognormvariate(5, 1.5) for _ in range(20000)]
+    sketch = QuantileSketch(accuracy)
+    for value in values:
+        sketch.add(value)
+
+    qs = [0.01, 0.25, 0.5, 0.9, 0.95, 0.99, 1.0]
+    for q, estimate in zip(qs, sketch.quantiles(qs)):
+        true = _true_quantile(values, q)
+        assert abs(estimate - true) <= accuracy * true * 1.001
+
+
+def test_summary_tracks_exact_count_sum_min_max():
+    sketch = QuantileSketch()
+    for value in [0.0, 2.0, 4.0, 10.0]:
+        sketch.add(value)
+
+    summary = sketch.summary()
+    assert summary["count"] == 4
+    assert summary["mean"] == 4.0
+    assert (summary["min"], summary["max"]) == (0.0, 10.0)
+    assert sketch.quantiles([0.0]) == [0.0]
+
+
+def test_empty_sketch_has_no_quantiles():
+    sketch = QuantileSketch()
+    assert sketch.quantiles([0.5, 0.99]) == [None, None]
+    assert sketch.summary()["mean"] is None
+
+
+def test_merge_equals_sketch_of_all_samples():
+    rng = random.Random(11)
+    values = [rng.expovariate(0.01) for _ in range(5000)]
+    left, right, whole = QuantileSketch(), QuantileSketch(), QuantileSketch()
+    for i, value in enumerate(values):
+        (left if i % 2 else right).add(value)
+        whole.add(value)
+
+    left.merge(right)
+    assert left.buckets == whole.buckets
+    assert left.count == whole.count
+    assert (left.min, left.max) == (whole.min, whole.max)
+    assert left.total == pytest.approx(whole.total)
+    assert left.quantiles([0.5, 0.95, 0.99]) == whole.quantiles([0.5, 0.95, 0.99])
+
+
+def test_merge_rejects_different_accuracy():
+    with pytest.raises(ValueError):
+        QuantileSketch(0.01).merge(QuantileSketch(0.02))
+
+
+def test_usage_metrics_records_per_dimension_and_counts_errors():
+    metrics = UsageMetrics(windows={"1m": 60})
+    metrics.record("gpt-4", "openai", 100.0, tokens=50, cost=0.01, tenant="acme")
+    metrics.record("gpt-4", "openai", 300.0, tokens=50, cost=0.01, tenant="acme")
+    metrics.record("gpt-4", "openai", 5000.0, success=False)
+
+    snapshot = metrics.snapshot()
+    model = snapshot["model"]["gpt-4"]["1m"]
+    assert (model["requests"], model["errors"]) == (3, 1)
+    assert model["latency_ms"]["count"] == 2
+    assert model["latency_ms"]["max"] == 300.0
+    assert snapshot["tenant"]["acme"]["1m"]["requests"] == 2
+    assert metrics.snapshot(tenant="other")["tenant"] == {}
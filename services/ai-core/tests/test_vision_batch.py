@@ -0,0 +1,112 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.v1 import vision
+from app.core.multi_tenant import get_company_context
+from app.services.vision_service import VisionService
+
+
+def _service(batch_images_per_call=3):
+    service = VisionService(batch_images_per_call=batch_images_per_call, batch_concurrency=2)
+    # Mock responses, no provider calls
+    service.client = None
+    return service
+
+
+def _frames(count):
+    return [(f"frame-{i}".encode(), "camera-1", {"position": i}) for i in range(count)]
+
+
+def _collect(service, frames):
+    async def run():
+        return [item async for item in service.detect_defects_batch(frames, "acme")]
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("count", [1, 3, 10])
+def test_every_frame_is_yielded_exactly_once(count):
+    results = _collect(_service(), _frames(count))
+    assert sorted(index for index, _ in results) == list(range(count))
+    assert all("defects" in result for _, result in results)
+
+
+def test_failed_group_yields_errors_for_its_frames_only():
+    service = _service()
+    inspect_group = service._inspect_group
+
+    async def flaky(group):
+        if any(index == 0 for index, _, _ in group):
+            raise RuntimeError("vision call failed")
+        return await inspect_group(group)
+
+    service._inspect_group = flaky
+    results = dict(_collect(service, _frames(7)))
+
+    assert sorted(results) == list(range(7))
+    failed = {index for index, result in results.items() if "error" in result}
+    assert 0 in failed and len(failed) == 3
+    assert all("defects" in results[i] for i in set(range(7)) - failed)
+
+
+def test_duplicate_answers_are_yielded_once():
+    service = _service()
+    inspect_group = service._inspect_group
+
+    async def repeating(group):
+        results = await inspect_group(group)
+        return results + results
+
+    service._inspect_group = repeating
+    results = _collect(service, _frames(5))
+    assert sorted(index for index, _ in results) == list(range(5))
+
+
+def test_missing_answers_raise_instead_of_hanging():
+    service = _service()
+    inspect_group = service._inspect_group
+
+    async def dropping(group):
+        return (await inspect_group(group))[1:]
+
+    service._inspect_group = dropping
+    with pytest.raises(RuntimeError, match="without results"):
+        _collect(service, _frames(4))
+
+
+def test_malformed_packed_item_fails_only_its_frame():
+    service = _service(batch_images_per_call=3)
+    service.client = SimpleNamespace()
+    content = json.dumps([
+        {"defects": [], "quality_score": 0.95},
+        {"defects": [], "quality_score": "high"},
+        {"defects": "none", "quality_score": 0.5}
+    ])
+
+    async def create(**kwargs):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+    service._create = create
+    results = dict(_collect(service, _frames(3)))
+
+    assert results[0]["quality_score"] == 0.95
+    assert "error" in results[1] and "error" in results[2]
+
+
+def test_multipart_metadata_parts_must_be_objects():
+    app = FastAPI()
+    app.include_router(vision.router)
+    app.dependency_overrides[get_company_context] = lambda: {"company_id": "acme", "subscription_tier": "free"}
+    app.state.services = SimpleNamespace(vision=_service(), admission=None)
+
+    response = TestClient(app).post(
+        "/vision/inspect-batch",
+        files=[("image", ("a.jpg", b"frame", "image/jpeg"))],
+        data={"camera_id": "camera-1", "metadata": "[1, 2]"}
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "metadata parts must be JSON objects"